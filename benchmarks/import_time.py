@@ -0,0 +1,54 @@
+'''新しいプロセスでモジュールを import するのにかかる時間を測る
+
+    python benchmarks/import_time.py [回数] [モジュール名 ...]
+
+モジュール名を省略すると pywikibot を測る。-X importtime の結果から
+時間のかかったモジュールも表示する。
+'''
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run(code: str, *options: str) -> (float, str):
+    '''新しいインタプリタで code を実行し、かかった秒数と標準エラーを返す'''
+    env = dict(os.environ, PYTHONPATH=ROOT, PYWIKIBOT2_NO_USER_CONFIG='2')
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, *options, '-c', code], cwd=ROOT,
+                            env=env, stderr=subprocess.PIPE,
+                            universal_newlines=True, check=True)
+    return time.perf_counter() - started, result.stderr
+
+
+def slowest_imports(module: str, count: int = 10) -> list:
+    '''-X importtime の累積時間が長い順にモジュールを返す'''
+    _, stderr = run('import ' + module, '-X', 'importtime')
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        rows.append((int(cumulative) / 1e6, name.strip()))
+    return sorted(rows, reverse=True)[:count]
+
+
+def main_():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    modules = sys.argv[2:] or ['pywikibot']
+    baseline = min(run('pass')[0] for _ in range(repeat))
+    print('{:<24} {:8.3f} s'.format('(interpreter)', baseline))
+    for module in modules:
+        seconds = [run('import ' + module)[0] - baseline
+                   for _ in range(repeat)]
+        print('{:<24} {:8.3f} s (median {:.3f} s)'.format(
+            module, min(seconds), statistics.median(seconds)))
+        for cumulative, name in slowest_imports(module):
+            print('    {:<28} {:8.3f} s'.format(name, cumulative))
+
+
+if __name__ == '__main__':
+    main_()
@@ -0,0 +1,77 @@
+'''textlib の例外正規表現のキャッシュのヒット率と効果を測る
+
+    python benchmarks/regex_cache.py [ページ数]
+
+ダミーのサイトで replaceExcept をページ数だけ呼び、_get_regexes と
+_MultiTemplateMatchBuilder のキャッシュのヒット率を表示する。また
+サイト固有のパターンをサイト情報から作る時間と、パターンの保存先
+(regexes.sqlite3) から読み込む時間を比べる。
+'''
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault('PYWIKIBOT2_NO_USER_CONFIG', '2')
+
+from pywikibot import config, textlib  # noqa: E402
+from pywikibot.data import cachestore  # noqa: E402
+from tests.utils import DrySite  # noqa: E402
+
+SITE_KEYS = ['category', 'file', 'interwiki']
+KEYS = ['comment', 'nowiki', 'pre', 'source', 'template', 'link'] + SITE_KEYS
+TEXT = ('[[Category:Foo]] {{Bar|baz}} <!-- a --> [[File:A.jpg|thumb]] '
+        'a b c [[en:Foo]] ') * 20
+
+
+def lookups(site, pages: int) -> float:
+    '''ページごとに例外とテンプレートの正規表現を引き、かかった秒数を返す'''
+    builder = textlib._MultiTemplateMatchBuilder(site)
+    started = time.perf_counter()
+    for _ in range(pages):
+        textlib.replaceExcept(TEXT, 'a', 'b', KEYS, site=site)
+        builder.search_any_predicate(['Bar', 'Baz'])(TEXT)
+    return time.perf_counter() - started
+
+
+def build_time(site, store, repeat: int = 20) -> float:
+    '''サイト固有のパターンを作ってコンパイルする平均秒数を返す'''
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for key in SITE_KEYS:
+            textlib._regex_cache.pop((key, repr(site)), None)
+            textlib._regex_cache_stats['misses'] += 1
+            textlib._regex_cache[key, repr(site)] = textlib._site_regex(
+                key, site)
+    return (time.perf_counter() - started) / repeat
+
+
+def main_():
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    site = DrySite('en', 'wikipedia', None, None)
+    seconds = lookups(site, pages)
+    stats = textlib._regex_cache_stats
+    total = stats['hits'] + stats['misses']
+    print('{} ページ: {:.3f} s, 参照 {} 回, ヒット率 {:.2%}'.format(
+        pages, seconds, total, stats['hits'] / total))
+
+    directory = tempfile.mkdtemp()
+    store = cachestore.CacheStore(os.path.join(directory, 'regexes.sqlite3'))
+    textlib._regex_store = lambda: store
+    try:
+        built = build_time(site, store)
+        config.precompiled_regexes = True
+        build_time(site, store, 1)
+        loaded = build_time(site, store)
+    finally:
+        store._db.close()
+        shutil.rmtree(directory)
+    print('サイト固有のパターン {} 個: 作成 {:.2f} ms, 読み込み {:.2f} ms'
+          .format(len(SITE_KEYS), built * 1000, loaded * 1000))
+
+
+if __name__ == '__main__':
+    main_()
@@ -0,0 +1,70 @@
+'''main.render_rows と以前の iterrows による描画の速さを比べる
+
+    python benchmarks/render_rows.py [行数]
+'''
+import os
+import sys
+import timeit
+
+import numpy as np
+import pandas as pd
+from jinja2 import Template
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import main  # noqa: E402
+
+TEMPLATE = '''== {{ ブロマイド名 }} ==
+* レア: {{ レア }}
+* キャラクター: {{ キャラクター名 }}
+* 最大ランク: {{ 最大ランク }}
+* アピール: {{ アピール }}'''
+
+
+def make_sheet(rows: int) -> pd.DataFrame:
+    '''ブロマイドシートに似た合成データを作る'''
+    rng = np.random.RandomState(0)
+    appeal = rng.randint(1000, 5000, rows).astype(float)
+    appeal[::7] = np.nan
+    return pd.DataFrame({
+        'レア': rng.choice(['R', 'SR', 'UR'], rows),
+        'ブロマイド名': ['ブロマイド{}'.format(i) for i in range(rows)],
+        'キャラクター名': rng.choice(['一条シン', '太刀花ユキノジョウ', '香賀美タイガ'], rows),
+        '最大ランク': rng.randint(1, 6, rows).astype(float),
+        'アピール': appeal,
+    })
+
+
+def render_iterrows(df: pd.DataFrame) -> str:
+    '''以前の実装: 行ごとに Series を dict にして文字列を連結する'''
+    def to_int(i):
+        if type(i) is float:
+            return int(i)
+        else:
+            return i
+
+    template = Template(TEMPLATE)
+    block_text = ''
+    for i, row in df.iterrows():
+        row = {k: to_int(v) for k, v in row.fillna('').to_dict().items()}
+        block_text += template.render(row) + '\n\n'
+    return block_text
+
+
+def render_records(df: pd.DataFrame) -> str:
+    df = main.normalize_frame(df, fillna='', to_int=True)
+    return main.render_rows('ベンチマーク', df)
+
+
+def main_():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    df = make_sheet(rows)
+    main.templates['ベンチマーク'] = (0, TEMPLATE, Template(TEMPLATE))
+    assert render_iterrows(df) == render_records(df)
+    for func in (render_iterrows, render_records):
+        seconds = min(timeit.repeat(lambda: func(df), number=1, repeat=3))
+        print('{:<16} {:>8} rows {:8.3f} s'.format(
+            func.__name__, rows, seconds))
+
+
+if __name__ == '__main__':
+    main_()
@@ -0,0 +1,89 @@
+'''ダンプの各ページに置換ルールを適用する時間を測る
+
+    python benchmarks/replace_except.py [ダンプ] [回数] [fix 名 ...]
+
+fixes.py の fix をそれぞれのページに順に適用し、変更後の本文を毎回
+検索し直す従来の方法と textlib.ExceptReplacer の時間を比べる。両者の
+結果が一致することも確かめる。ダンプを省略すると tests/data/xml の
+記事を使う。
+'''
+import os
+import re
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault('PYWIKIBOT2_NO_USER_CONFIG', '2')
+
+from pywikibot import textlib, xmlreader  # noqa: E402
+from pywikibot.fixes import fixes  # noqa: E402
+
+DEFAULT_DUMP = os.path.join(ROOT, 'tests', 'data', 'xml',
+                            'article-pear-0.10.xml')
+
+
+def load_rules(names: list) -> list:
+    '''fix の置換ルールを (正規表現, 置換後, 例外) のリストにする'''
+    rules = []
+    for name in names:
+        fix = fixes[name]
+        exceptions = fix.get('exceptions', {}).get('inside-tags', [])
+        for old, new in fix['replacements']:
+            if not fix.get('regex'):
+                old = re.escape(old)
+            rules.append((re.compile(old, re.UNICODE), new, exceptions))
+    return rules
+
+
+def reference(text: str, rules: list) -> str:
+    '''ルールごとに変更後の本文全体を検索し直す従来の方法で置換する'''
+    for old, new, exceptions in rules:
+        if not old.search(text):
+            continue
+        regexes = textlib._get_regexes(exceptions, None)
+        new = new if callable(new) else new.replace('\\n', '\n')
+        text = textlib._replace_in_text(text, old, new, regexes, False, 0,
+                                        0, 0, len(text))[0]
+    return text
+
+
+def engine(text: str, rules: list) -> str:
+    '''ExceptReplacer で置換する'''
+    replacer = textlib.ExceptReplacer(text)
+    for old, new, exceptions in rules:
+        replacer.replace(old, new, exceptions)
+    return replacer.text
+
+
+def measure(function, texts: list, rules: list, repeat: int) -> (float, list):
+    '''function を全ページに適用する最短時間と結果を返す'''
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        results = [function(text, rules) for text in texts]
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, results
+
+
+def main_():
+    dump = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_DUMP
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    names = sys.argv[3:] or ['HTML', 'syntax', 'isbn']
+    texts = [entry.text for entry in xmlreader.XmlDump(dump).parse()]
+    rules = load_rules(names)
+    print('{} ページ ({:,} 文字), {} ルール'.format(
+        len(texts), sum(map(len, texts)), len(rules)))
+    before, expected = measure(reference, texts, rules, repeat)
+    after, results = measure(engine, texts, rules, repeat)
+    changed = sum(new != old for new, old in zip(expected, texts))
+    print('{:<16} {:8.3f} s'.format('replaceExcept', before))
+    print('{:<16} {:8.3f} s ({:.1f} 倍)'.format(
+        'ExceptReplacer', after, before / after))
+    print('変更されたページ: {}, 結果の一致: {}'.format(
+        changed, results == expected))
+
+
+if __name__ == '__main__':
+    main_()
@@ -1,16 +1,33 @@
 import argparse
+import pywikibot
 from pywikibot import Site, Page
-from bs4 import BeautifulSoup
+from pywikibot.comms import http
+from pywikibot.data import api
+from pywikibot.diff import PatchManager
+from pywikibot.throttle import Throttle
 import requests
 from tabulate import tabulate
 from jinja2 import Template
 import pandas as pd
 import numpy as np
 import io
-from mypy.types import Dict
-
-
-site = Site()
+import os
+import time
+import datetime
+import contextlib
+import collections
+import re
+import json
+import pickle
+import hashlib
+import sqlite3
+import functools
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+
+# --jobs のワーカープロセスは spawn で起動されると main.py を __mp_main__ として
+# 読み込み直すので、そこではサイトに接続しない
+site = Site() if __name__ != '__mp_main__' else None
 
 sheet_ids = {
     "📺 シナリオ一覧": 788224352,
@@ -42,21 +59,140 @@ sheet_ids = {
 
 colors = ['紫', '藍', '青', '緑', '黄', '橙', '赤']
 
-
-def get_sheet(name: str, **kargs) -> pd.DataFrame:
-    '''スプレッドシートからシートを DataFrame として読み込む'''
-    url = get_sheet_csv_url(name)
-    r = requests.get(url)
+prism_names = ['瞬きプリズム', '煌めきプリズム', '輝きプリズム']
+
+# 前回取得したシートのスナップショットを保存するディレクトリ
+snapshot_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'sheet-cache')
+
+session = requests.Session()
+session.mount('https://', requests.adapters.HTTPAdapter(
+    pool_connections=1, pool_maxsize=len(sheet_ids)))
+
+# 前回の実行で書き込んだ各ページの入力と出力のハッシュを記録するデータベース
+state_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          'sync-state.sqlite3')
+state = None
+
+# 描画待ちのページ: (ページ名, シート名, テンプレート名, データ, 入力のハッシュ,
+#                     前回の出力のハッシュ)
+render_jobs = []
+# 書き込み待ちのページ: (ページ名, テンプレート名, テキスト, 状態データベースに記録する値)
+pending_pages = []
+# 非同期の書き込みが終わったページ: (ページ名, 状態データベースに記録する値, エラー)
+saved_pages = []
+
+# 実行全体での API リクエスト数、HTTP の転送バイト数、スロットルで待った秒数
+counters = collections.Counter()
+# テンプレート (ページを作る関数) ごと、段階ごとの計測値
+stats = collections.defaultdict(
+    lambda: collections.defaultdict(collections.Counter))
+# 'new', 'changed', 'unchanged' ごとのページ数
+page_counts = collections.Counter()
+# --dry-run のときに差分を書き出すファイル
+report = None
+
+# シート id -> (CSV テキスト, ETag/Last-Modified)
+sheet_texts = {}
+# (シート id, read_csv の引数) -> DataFrame
+sheet_frames = {}
+
+
+def snapshot_path(sheet_id: int, ext: str) -> str:
+    return os.path.join(snapshot_dir, '{}.{}'.format(sheet_id, ext))
+
+
+def fetch_sheet_text(sheet_id: int) -> (str, str):
+    '''シートの CSV を取得する
+
+    ETag/Last-Modified が前回と同じならディスク上のスナップショットを使う'''
+    headers = {}
+    meta = {}
+    if os.path.exists(snapshot_path(sheet_id, 'json')):
+        with open(snapshot_path(sheet_id, 'json')) as f:
+            meta = json.load(f)
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+
+    r = session.get(get_sheet_csv_url_by_id(sheet_id), headers=headers)
+    if r.status_code == 304:
+        with open(snapshot_path(sheet_id, 'csv'), encoding='utf-8') as f:
+            return f.read(), meta['validator']
+    r.raise_for_status()
     r.encoding = 'utf-8'
-    df = pd.read_csv(io.StringIO(r.text), **kargs)
+
+    etag = r.headers.get('ETag')
+    last_modified = r.headers.get('Last-Modified')
+    validator = etag or last_modified
+    if validator:
+        os.makedirs(snapshot_dir, exist_ok=True)
+        with open(snapshot_path(sheet_id, 'csv'), 'w', encoding='utf-8') as f:
+            f.write(r.text)
+        with open(snapshot_path(sheet_id, 'json'), 'w') as f:
+            json.dump({'etag': etag, 'last_modified': last_modified,
+                       'validator': validator}, f)
+    return r.text, validator
+
+
+def fetch_workbook(names=None, max_workers=8) -> None:
+    '''複数のシートを並列に取得する
+
+    `names` を省略した場合は sheet_ids にあるすべてのシートを取得する'''
+    if names is None:
+        ids = list(sheet_ids.values())
+    else:
+        ids = [get_sheet_id(name) for name in names]
+    ids = [i for i in set(ids) if i is not None and i not in sheet_texts]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for sheet_id, result in zip(ids, executor.map(fetch_sheet_text, ids)):
+            sheet_texts[sheet_id] = result
+
+
+def parse_sheet(sheet_id: int, **kargs) -> pd.DataFrame:
+    '''取得済みの CSV を DataFrame に変換する
+
+    シートが前回の実行から変わっていなければパース結果をディスクから読み込む'''
+    text, validator = sheet_texts[sheet_id]
+    key = hashlib.sha1(repr(sorted(kargs.items())).encode()).hexdigest()
+    path = snapshot_path(sheet_id, key + '.pkl')
+    if validator and os.path.exists(path):
+        with open(path, 'rb') as f:
+            cached_validator, df = pickle.load(f)
+        if cached_validator == validator:
+            return df
+
+    df = pd.read_csv(io.StringIO(text), **kargs)
     df = df.rename(
         columns=lambda x: x.replace('\n', '').replace('.', '')) # 列名の改行を除去
+    if validator:
+        with open(path, 'wb') as f:
+            pickle.dump((validator, df), f)
     return df
 
 
+def get_sheet(name: str, **kargs) -> pd.DataFrame:
+    '''スプレッドシートからシートを DataFrame として読み込む
+
+    同じシートを同じ引数で読み込んだ結果は実行中ずっと使い回す'''
+    sheet_id = get_sheet_id(name)
+    key = (sheet_id, repr(sorted(kargs.items())))
+    if key not in sheet_frames:
+        if sheet_id not in sheet_texts:
+            sheet_texts[sheet_id] = fetch_sheet_text(sheet_id)
+        sheet_frames[key] = parse_sheet(sheet_id, **kargs)
+    # 呼び出し側で列を追加したりするのでコピーを返す
+    return sheet_frames[key].copy()
+
+
 def get_sheet_csv_url(name: str) -> str:
+    return get_sheet_csv_url_by_id(get_sheet_id(name))
+
+
+def get_sheet_csv_url_by_id(sheet_id: int) -> str:
     url_base = 'https://docs.google.com/spreadsheets/d/e/2PACX-1vSWkD1CJvETQFWYfImMvpdGxJPmruNqh7HrCqc2d1FcE2m_hyBMjyOoFkbJFzxXBssgDapfng1IPUBB/pub?gid={sheet_id}&single=true&output=csv'
-    return url_base.format(sheet_id=get_sheet_id(name))
+    return url_base.format(sheet_id=sheet_id)
 
 
 def get_sheet_url(name: str) -> str:
@@ -72,41 +208,161 @@ def get_sheet_id(name: str) -> int:
     return None
 
 
+def open_state(path: str) -> sqlite3.Connection:
+    '''増分更新用の状態データベースを開く'''
+    conn = sqlite3.connect(path)
+    conn.execute('''CREATE TABLE IF NOT EXISTS pages (
+                        page_name TEXT PRIMARY KEY,
+                        input_hash TEXT NOT NULL,
+                        template_revid INTEGER,
+                        output_hash TEXT NOT NULL)''')
+    return conn
+
+
+def load_state(page_name: str):
+    '''前回ページを書き込んだときの (入力, テンプレートのリビジョン, 出力) を返す'''
+    return state.execute(
+        'SELECT input_hash, template_revid, output_hash FROM pages '
+        'WHERE page_name = ?', (page_name,)).fetchone()
+
+
+def store_state(page_name: str, input_hash: str, template_revid: int,
+                output_hash: str) -> None:
+    with state:
+        state.execute('INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?)',
+                      (page_name, input_hash, template_revid, output_hash))
+
+
+def hash_text(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def hash_data(*data) -> str:
+    '''ページの元になるデータのハッシュを求める'''
+    return hash_text(json.dumps(data, sort_keys=True, ensure_ascii=False,
+                                default=str))
+
+
 def update_wiki(sheet_name, page_name,
                 template_name=None, page_data_factory=None, data=None):
-    '''Wiki の各ページを更新するための高階関数'''
-    if data is None:
-        data = page_data_factory(sheet_name)
+    '''Wiki の各ページを更新するための高階関数
+
+    `--full` が指定されていなければ、元データとテンプレートが前回と同じページは
+    wiki 上の現在のテキストを取得せずに飛ばす'''
+    if args.page and page_name not in args.page:
+        return
     if template_name is None:
         template_name = page_name
-    page_text = render_template(template_name, data)
-    save_page(page_name, page_text, sheet_name, template_name)
+    if data is None:
+        with measure(template_name, 'data'):
+            data = page_data_factory(sheet_name)
+    if type(data) is not dict:
+        data = dict(data)
+
+    input_hash = hash_data(sheet_name, template_name, data)
+    with measure(template_name, 'template'):
+        load_template(template_name)
+    template_revid = templates[template_name][0]
+    previous = None if args.full else load_state(page_name)
+    if previous is not None and previous[:2] == (input_hash, template_revid):
+        page_counts['unchanged'] += 1
+        return
+
+    render_jobs.append((page_name, sheet_name, template_name, data,
+                        input_hash, previous and previous[2]))
+
+
+@functools.lru_cache(maxsize=None)
+def compile_source(source: str) -> Template:
+    return Template(source)
+
+
+def render_source(source: str, data: dict) -> (str, float):
+    '''テンプレートのソースにデータを流し込む (ワーカープロセスでも呼ばれる)
+
+    描画したテキストとかかった秒数を返す'''
+    start = time.perf_counter()
+    text = compile_source(source).render(data)
+    return text, time.perf_counter() - start
+
+
+def render_pages(workers: int = 1) -> None:
+    '''描画待ちのページをまとめて描画して書き込み待ちにする
+
+    `workers` が 2 以上ならプロセスプールで並列に描画する。結果の順番は
+    update_wiki() を呼んだ順のまま変わらない'''
+    sources = [templates[job[2]][1] for job in render_jobs]
+    datas = [job[3] for job in render_jobs]
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(render_source, sources, datas,
+                                        chunksize=16))
+    else:
+        results = list(map(render_source, sources, datas))
+
+    for job, (text, seconds) in zip(render_jobs, results):
+        page_name, sheet_name, template_name, _, input_hash, previous = job
+        stats[template_name]['render']['seconds'] += seconds
+        stats[template_name]['render']['calls'] += 1
+        page_text = add_footer(text, sheet_name, template_name)
+        record = (input_hash, templates[template_name][0],
+                  hash_text(page_text))
+        if previous != record[2]:
+            pending_pages.append((page_name, template_name, page_text, record))
+        else:
+            page_counts['unchanged'] += 1
+            if not (args.debug or args.dry_run):
+                store_state(page_name, *record)
+    render_jobs.clear()
+
+
+def normalize_frame(df: pd.DataFrame, fillna=None,
+                    to_int: bool = False) -> pd.DataFrame:
+    '''行ごとに描画する前に DataFrame の値を列単位でまとめて整える
+
+    `to_int` が真なら float の列の値を int にする。欠損値は `fillna` で埋める'''
+    df = df.copy()
+    if to_int:
+        for col in df.columns[df.dtypes == float]:
+            values = df[col].to_numpy()
+            isna = np.isnan(values)
+            column = np.empty(len(values), dtype=object)
+            column[isna] = fillna
+            column[~isna] = values[~isna].astype(np.int64).tolist()
+            df[col] = column
+    if fillna is not None:
+        df = df.fillna(fillna)
+    return df
+
+
+def render_rows(template_name: str, df: pd.DataFrame,
+                reverse: bool = False) -> str:
+    '''DataFrame の各行をテンプレートで描画してつなげる'''
+    template = load_template(template_name)
+    records = df.to_dict('records')
+    if reverse:
+        records.reverse()
+    return ''.join([template.render(record) + '\n\n' for record in records])
 
 
 def info_important_data_factory(sheet_name):
     '''「お知らせ/重要なお知らせ」ページの wiki を生成する'''
     df = get_sheet(sheet_name).fillna('-') # バージョンがないセルは '-' で埋める
-    block_text = ''
-    for i, row in reversed(list(df.iterrows())):
-        block_text += render_template('お知らせ/重要なお知らせ/ブロック', row) + '\n\n'
+    block_text = render_rows('お知らせ/重要なお知らせ/ブロック', df, reverse=True)
     return {'ブロック': block_text}
 
 
 def info_normal_data_factory(sheet_name):
     '''「お知らせ/一般情報」ページの wiki を生成する'''
     df = get_sheet(sheet_name)
-    block_text = ''
-    for i, row in reversed(list(df.iterrows())):
-        block_text += render_template('お知らせ/一般情報/ブロック', row) + '\n\n'
+    block_text = render_rows('お知らせ/一般情報/ブロック', df, reverse=True)
     return {'ブロック': block_text}
 
 
 def profile_data_factory(sheet_name):
     '''「プリズムスタァのプロフィール」ページの wiki を生成する'''
     df = get_sheet(sheet_name)
-    block_text = ''
-    for i, row in df.iterrows():
-        block_text += render_template('プリズムスタァのプロフィール/ブロック', row) + '\n\n'
+    block_text = render_rows('プリズムスタァのプロフィール/ブロック', df)
     return {'ブロック': block_text}
 
 
@@ -141,9 +397,7 @@ def fan_level_data_factory(sheet_name):
 def tutorial_bromide_data_factory(sheet_name):
     '''「チュートリアルでもらえるブロマイド」ページの wiki を生成する'''
     df = get_sheet(sheet_name)
-    block_text = ''
-    for i, row in df.iterrows():
-        block_text += render_template('チュートリアルでもらえるブロマイド/ブロック', row) + '\n\n'
+    block_text = render_rows('チュートリアルでもらえるブロマイド/ブロック', df)
     return {'ブロック': block_text}
 
 
@@ -155,13 +409,27 @@ def prism_point_gacha_bromide_data_factory(sheet_name):
     return {'テーブル': table}
 
 
-def update_bromide():
-    def to_int(i):
-        if type(i) is float:
-            return int(i)
-        else:
-            return i
+def filter_rows(df: pd.DataFrame, expression: str) -> pd.DataFrame:
+    '''`列名==値` や `列名!=値` の形式の条件に合う行だけを取り出す
 
+    それ以外の形式の条件は DataFrame.query() にそのまま渡す'''
+    match = re.fullmatch(r'\s*([^=!]+?)\s*(==|!=)\s*([^\'"=!&|]*?)\s*', expression)
+    if match is None:
+        return df.query(expression)
+    column, operator, value = match.groups()
+    series = df[column]
+    # 数値の列は文字列にすると 5 が '5.0' になって一致しないので、値のほうを
+    # 数値にして比べる。数値にできない値はどの行とも一致しない
+    if pd.api.types.is_numeric_dtype(series):
+        try:
+            value = float(value)
+        except ValueError:
+            value = None
+    mask = series == value
+    return df[mask if operator == '==' else ~mask]
+
+
+def update_bromide():
     df = get_sheet('🎴 ブロマイド', skiprows=1)
 
     # jinja2 の変数名のために調整
@@ -170,10 +438,16 @@ def update_bromide():
     df.loc[:, 'third'] = df['3rd']
     df.loc[:, 'チェンジ後最大ランク'] = df['最大ランク1']
 
-    for i, bromide in df.iterrows():
-        page_name = '{}{}{}'.format(
-            bromide['レア'], bromide['ブロマイド名'], bromide['キャラクター名'])
-        bromide = {k: to_int(v) for k,v in bromide.fillna('').to_dict().items()}
+    page_names = df['レア'].astype(str) + df['ブロマイド名'].astype(str) + \
+                 df['キャラクター名'].astype(str)
+    # --rows や --page で指定されたブロマイドだけを更新する
+    if args.rows:
+        df = filter_rows(df, args.rows)
+    if args.page:
+        df = df[page_names.isin(args.page)]
+    page_names = page_names[df.index]
+    bromides = normalize_frame(df, fillna='', to_int=True).to_dict('records')
+    for page_name, bromide in zip(page_names, bromides):
         update_wiki(
             sheet_name='🎴 ブロマイド',
             page_name=page_name,
@@ -182,20 +456,41 @@ def update_bromide():
             data=bromide)
 
 
+def build_item_index(df: pd.DataFrame, columns: list, values: list,
+                     exact: bool = False) -> dict:
+    '''(列名, 値) -> その値を持つ行のラベル の索引を一度の走査で作る
+
+    `exact` が偽ならセルに値が含まれている行を、真なら値と一致する行を対象にする。
+    プリズムや応援グッズのようなアイテムのページを作るのに使う'''
+    cells = df[columns].stack()
+    if exact:
+        found = cells[cells.isin(values)]
+    else:
+        pattern = '|'.join(map(re.escape, values))
+        found = cells.astype(str).str.findall(pattern).explode().dropna()
+    found = found.rename('value').reset_index(level=1).reset_index()
+    found.columns = ['row', 'column', 'value']
+    found = found.drop_duplicates()
+    return {key: group['row'].tolist()
+            for key, group in found.groupby(['column', 'value'], sort=False)}
+
+
 def update_item_prism():
     '''3種類のプリズムの各ページを更新する'''
     df = get_sheet('楽曲リスト', header=1)
     bromide_df = get_sheet('ブロマイド', header=1)
-    for prism_name in ['瞬きプリズム', '煌めきプリズム', '輝きプリズム']:
+    # 楽曲リストとプリズムを必要としているスタァの索引
+    songs_index = build_item_index(df, prism_names, colors)
+    stars_index = build_item_index(bromide_df, prism_names, colors, exact=True)
+    star_names = bromide_df['レア'] + bromide_df['ブロマイド名'] + \
+                 bromide_df['キャラクター名']
+    for prism_name in prism_names:
         for color in colors:
-            # 楽曲リストを求める
-            prism = df[df[prism_name].str.contains(color, na=False)]
-            prism = prism[['楽曲グループ', '楽曲名', '難易度', prism_name]]
+            prism = df.loc[songs_index.get((prism_name, color), []),
+                           ['楽曲グループ', '楽曲名', '難易度', prism_name]]
             songs_table_text = tabulate(prism, tablefmt='wikia',
                                   headers=prism.keys(), showindex=False)
-            # プリズムを必要としているスタァを求める
-            stars = bromide_df[bromide_df[prism_name] == color]
-            stars = stars['レア'] + stars['ブロマイド名'] + stars['キャラクター名']
+            stars = star_names.loc[stars_index.get((prism_name, color), [])]
             stars = ['* [[{}]]'.format(star) for _, star in stars.items()]
             stars_list_text = '\n'.join(stars)
 
@@ -212,9 +507,52 @@ def update_item_prism():
                 data=data)
 
 
-def load_template(name: str) -> str:
-    '''`name` という名前の bot 用テンプレートを wiki から読み込む'''
-    return Page(site, 'Template:bot/' + name).text
+# bot 用テンプレート名 -> (リビジョン id, ソース, コンパイル済みテンプレート)
+templates = {}
+
+
+def template_page_name(name: str) -> str:
+    return 'Template:bot/' + name
+
+
+def compile_template(name: str, page: Page) -> Template:
+    '''テンプレートをコンパイルしてキャッシュする
+
+    キャッシュ済みのものとリビジョン id が同じ場合はコンパイルし直さない。
+    存在しないテンプレートはリビジョン id を None とし、空のテンプレートにする'''
+    try:
+        revid = page.latest_revision_id
+    except pywikibot.NoPage:
+        revid = None
+    cached = templates.get(name)
+    if cached is not None and cached[0] == revid:
+        return cached[2]
+    source = page.text if revid is not None else ''
+    template = Template(source)
+    templates[name] = (revid, source, template)
+    return template
+
+
+def preload_templates(names: list = None) -> None:
+    '''Template:bot/ 以下のテンプレートを一括で読み込んでコンパイルする
+
+    `names` を指定した場合はそのテンプレートだけを読み込む'''
+    if names is None:
+        pages = site.allpages(prefix='bot/', namespace=10, content=False)
+    else:
+        pages = [Page(site, template_page_name(name)) for name in names]
+    for page in site.preloadpages(pages):
+        name = page.title(withNamespace=False)[len('bot/'):]
+        compile_template(name, page)
+
+
+def load_template(name: str) -> Template:
+    '''`name` という名前の bot 用テンプレートを読み込む
+
+    preload_templates() で読み込まれていないものだけ wiki から個別に取得する'''
+    if name in templates:
+        return templates[name][2]
+    return compile_template(name, Page(site, template_page_name(name)))
 
 
 def render_template(page_name: str, data: any) -> str:
@@ -222,69 +560,293 @@ def render_template(page_name: str, data: any) -> str:
     template = load_template(page_name)
     if type(data) is not dict:
         data = dict(data)
-    return Template(template).render(data)
+    return template.render(data)
 
 
-def save_page(page_name: str, text: str, sheet_name: str,
-              template_name: str) -> None:
-    '''実際に wiki のページを書き込む'''
-    if template_name is None:
-        template_name = page_name
-
-    # Bot 編集ページであることを知らせるフッターを付加して更新する
+def add_footer(text: str, sheet_name: str, template_name: str) -> str:
+    '''Bot 編集ページであることを知らせるフッターを付加する'''
     sheet_url = get_sheet_url(sheet_name)
     footer = '\n\n{{bot/編集の注意|template_name = %s | url = %s}}' \
                                               % (template_name, sheet_url)
-    text += footer
+    return text + footer
+
+
+def save_pages(groupsize: int = 50) -> None:
+    '''書き込み待ちのページの現在のテキストをまとめて取得し、変更があるものだけ書き込む
+
+    取得と書き込みの時間をテンプレートごとに計るため、テンプレートごとに取得する'''
+    groups = collections.OrderedDict()
+    for item in pending_pages:
+        groups.setdefault(item[1], []).append(item)
+
+    for template_name, items in groups.items():
+        pages = [Page(site, page_name) for page_name, _, _, _ in items]
+        # 取得した内容と存在するかどうかは各 Page オブジェクトに保持される
+        with measure(template_name, 'fetch'):
+            for _ in site.preloadpages(pages, groupsize=groupsize):
+                pass
+
+        with measure(template_name, 'save'):
+            for page, (page_name, _, text, record) in zip(pages, items):
+                def callback(page, err, page_name=page_name, record=record):
+                    saved_pages.append((page_name, record, err))
+                status = save_page(page, text, callback)
+                page_counts[status] += 1
+                if status == 'unchanged' and not (args.debug or args.dry_run):
+                    store_state(page_name, *record)
+    pending_pages.clear()
+
+
+def finish_saves() -> None:
+    '''非同期の書き込みがすべて終わるまで待ち、ページごとの結果を記録して表示する
+
+    状態データベースはメインスレッドからしか使えないので、ここでまとめて記録する'''
+    # 書き込みスレッドが pywikibot.Error 以外の例外で止まると task_done() が
+    # 呼ばれず page_put_queue.join() が終わらないので、スレッドが動いている
+    # 間だけ待つ
+    queue = pywikibot.page_put_queue
+    while queue.unfinished_tasks and pywikibot._putthread.is_alive():
+        pywikibot._putthread.join(1)
+    failed = []
+    for page_name, record, err in saved_pages:
+        if err is None:
+            store_state(page_name, *record)
+        else:
+            failed.append((page_name, err))
+    print('{} pages saved, {} failed'.format(len(saved_pages) - len(failed),
+                                             len(failed)))
+    for page_name, err in failed:
+        print('  {}: {}'.format(page_name, err))
+    if queue.unfinished_tasks:
+        print('{} saves were not finished because the put thread stopped'
+              .format(queue.unfinished_tasks))
+    saved_pages.clear()
+
+
+def format_diff(title: str, old: str, new: str) -> str:
+    '''ページの変更を unified diff 形式の文字列にする'''
+    hunks = PatchManager(old, new).hunks
+    return '--- {0}\n+++ {0}\n{1}\n'.format(
+        title, '\n'.join(str(hunk) for hunk in hunks))
+
+
+def save_page(page: Page, text: str, callback=None) -> str:
+    '''実際に wiki のページを書き込む
+
+    書き込みは pywikibot の書き込みキューに入れて非同期に行い、終わったら
+    `callback(page, err)` を呼ぶ。ページの状態に応じて 'new', 'changed',
+    'unchanged' のいずれかを返す'''
+    if not page.exists():
+        status, old = 'new', ''
+    elif page.text == text:
+        # ページに変更がない場合には何もしない
+        return 'unchanged'
+    else:
+        status, old = 'changed', page.text
 
-    # ページに変更がない場合には何もしない
-    page = Page(site, page_name)
-    if page.text == text:
-        return
+    if args.dry_run:
+        report.write(format_diff(page.title(), old, text))
+        return status
 
     page.text = text
     if args.debug:
         print(page.text)
     else:
-        page.save()
+        page.save(asynchronous=True, callback=callback)
+    return status
+
+
+def instrument() -> None:
+    '''pywikibot の API リクエスト数、HTTP の転送量、スロットルの待ち時間を数える'''
+    def count_response(response, *args, **kwargs):
+        counters['http_requests'] += 1
+        # response.content を読むとストリーミングで受け取るレスポンスを
+        # ここで全部読み込んでしまうので、ヘッダーの転送サイズを数える
+        # (chunked で送られたレスポンスは数えられない)
+        counters['bytes_received'] += int(
+            response.headers.get('Content-Length', 0))
+        if response.request.body:
+            counters['bytes_sent'] += len(response.request.body)
+
+    http.session.hooks['response'].append(count_response)
+    session.hooks['response'].append(count_response)
+
+    submit = api.Request.submit
+    wait = Throttle.wait
+
+    @functools.wraps(submit)
+    def counting_submit(self):
+        counters['api_requests'] += 1
+        return submit(self)
+
+    @functools.wraps(wait)
+    def counting_wait(self, seconds):
+        counters['throttle_wait'] += max(seconds, 0)
+        return wait(self, seconds)
+
+    api.Request.submit = counting_submit
+    Throttle.wait = counting_wait
+
+
+@contextlib.contextmanager
+def measure(group: str, stage: str):
+    '''with ブロックにかかった秒数と、その間の API リクエスト数などを記録する'''
+    before = counters.copy()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record = stats[group][stage]
+        record['seconds'] += time.perf_counter() - start
+        record['calls'] += 1
+        for key, value in counters.items():
+            record[key] += value - before[key]
+
+
+def write_stats(path: str, started: datetime.datetime) -> None:
+    '''実行 1 回分の計測値を JSON の 1 行として追記する'''
+    line = {
+        'started': started.isoformat(),
+        'seconds': (datetime.datetime.now() - started).total_seconds(),
+        'pages': page_counts,
+        'totals': counters,
+        'stats': stats,
+    }
+    if site.throttle.controller:
+        line['throttle'] = site.throttle.controller.metrics()
+    with open(path, 'a') as f:
+        f.write(json.dumps(line, ensure_ascii=False, sort_keys=True) + '\n')
+
+
+def write_summary(path: str) -> None:
+    '''変更されたページ数と各段階にかかった秒数を JSON で書き出す'''
+    summary = {
+        'pages': {status: page_counts[status]
+                  for status in ['new', 'changed', 'unchanged']},
+        'stats': stats,
+    }
+    with open(path, 'w') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2, sort_keys=True)
+
+
+# 更新するページのまとまり
+# name: --only で指定する名前, sheets: 使うシート, templates: 使うテンプレート,
+# pages: 更新するページ名 (シートを読むまでわからなければ None), run: 更新する関数
+Target = collections.namedtuple('Target', 'name sheets templates pages run')
+
+
+def factory_target(sheet_name: str, page_name: str, page_data_factory,
+                   block: bool = False) -> Target:
+    '''update_wiki() で 1 ページだけを更新する Target を作る'''
+    template_names = [page_name]
+    if block:
+        template_names.append(page_name + '/ブロック')
+
+    def run():
+        update_wiki(
+            sheet_name=sheet_name,
+            page_name=page_name,
+            page_data_factory=page_data_factory)
+    return Target(page_name, [sheet_name], template_names, [page_name], run)
+
+
+targets = [
+    factory_target('お知らせ/重要', 'お知らせ/重要なお知らせ',
+                   info_important_data_factory, block=True),
+    factory_target('お知らせ/一般', 'お知らせ/一般情報',
+                   info_normal_data_factory, block=True),
+    factory_target('プロフィール', 'プリズムスタァのプロフィール',
+                   profile_data_factory, block=True),
+    factory_target('応援グッズ', '応援グッズ', cheering_goods_data_factory),
+    factory_target('ファンレベル', 'ファンレベル', fan_level_data_factory),
+    factory_target('チュートリアル', 'チュートリアルでもらえるブロマイド',
+                   tutorial_bromide_data_factory, block=True),
+    factory_target('ブロマイド(PPガチャ)', 'Pポイントガチャで入手できるブロマイド',
+                   prism_point_gacha_bromide_data_factory),
+    Target('ブロマイド', ['🎴 ブロマイド'], ['ブロマイド'], None, update_bromide),
+    Target('プリズム', ['楽曲リスト', 'ブロマイド'], ['プリズム'],
+           ['{}({})'.format(prism_name, color)
+            for prism_name in prism_names for color in colors],
+           update_item_prism),
+]
+
+
+def select_targets(args) -> list:
+    '''--only と --page で指定されたページを含む Target だけを選ぶ
+
+    --rows はブロマイドのシートの行の条件なので、ブロマイドだけを選ぶ'''
+    selected = targets
+    if args.only:
+        unknown = set(args.only) - {target.name for target in targets}
+        if unknown:
+            raise ValueError('unknown target: ' + ', '.join(sorted(unknown)))
+        selected = [target for target in selected if target.name in args.only]
+    if args.rows:
+        if args.only and 'ブロマイド' not in args.only:
+            raise ValueError('--rows can only be used with --only ブロマイド')
+        selected = [target for target in selected
+                    if target.name == 'ブロマイド']
+    if args.page:
+        selected = [target for target in selected
+                    if target.pages is None or set(target.pages) & set(args.page)]
+    return selected
 
 
 def main(args):
-    update_wiki(
-        sheet_name='お知らせ/重要',
-        page_name='お知らせ/重要なお知らせ',
-        page_data_factory=info_important_data_factory)
-    update_wiki(
-        sheet_name='お知らせ/一般',
-        page_name='お知らせ/一般情報',
-        page_data_factory=info_normal_data_factory)
-    update_wiki(
-        sheet_name='プロフィール',
-        page_name='プリズムスタァのプロフィール',
-        page_data_factory=profile_data_factory)
-    update_wiki(
-        sheet_name='応援グッズ',
-        page_name='応援グッズ',
-        page_data_factory=cheering_goods_data_factory)
-    update_wiki(
-        sheet_name='ファンレベル',
-        page_name='ファンレベル',
-        page_data_factory=fan_level_data_factory)
-    update_wiki(
-        sheet_name='チュートリアル',
-        page_name='チュートリアルでもらえるブロマイド',
-        page_data_factory=tutorial_bromide_data_factory)
-    update_wiki(
-        sheet_name='ブロマイド(PPガチャ)',
-        page_name='Pポイントガチャで入手できるブロマイド',
-        page_data_factory=prism_point_gacha_bromide_data_factory)
-    update_bromide()
-    update_item_prism()
+    global state, report
+    started = datetime.datetime.now()
+    instrument()
+    state = open_state(state_path)
+    if args.dry_run:
+        report = open(args.report + '.diff', 'w')
+
+    # 何も指定されていなければすべてのシートとテンプレートをまとめて読み込む
+    selected = select_targets(args)
+    sheet_names = template_names = None
+    if selected is not targets:
+        sheet_names = [name for target in selected for name in target.sheets]
+        template_names = [name for target in selected
+                          for name in target.templates]
+    with measure('', 'fetch_workbook'):
+        fetch_workbook(sheet_names)
+    with measure('', 'preload_templates'):
+        preload_templates(template_names)
+    # 前のまとまりのページを書き込んでいる間に次のまとまりを描画する
+    for target in selected:
+        with measure('', target.name):
+            target.run()
+        with measure('', 'render_pages'):
+            render_pages(args.jobs)
+        with measure('', 'save_pages'):
+            save_pages()
+    with measure('', 'finish_saves'):
+        finish_saves()
+    if args.dry_run:
+        report.close()
+        write_summary(args.report + '.json')
+    write_stats(args.stats, started)
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('-d', '--debug', action='store_true',
                         help='デバッグモードで実行する')
+    parser.add_argument('--full', action='store_true',
+                        help='前回から変更のないページも含めてすべて更新する')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='ページの描画に使うプロセス数')
+    parser.add_argument('-n', '--dry-run', action='store_true',
+                        help='書き込まずに変更の差分と集計をファイルに書き出す')
+    parser.add_argument('--report', default='dry-run',
+                        help='--dry-run の差分 (.diff) と集計 (.json) のファイル名')
+    parser.add_argument('--stats', default='run-stats.jsonl',
+                        help='実行ごとの計測値を JSON Lines で追記するファイル')
+    parser.add_argument('--only', action='append',
+                        help='指定したまとまりのページだけを更新する '
+                             '(例: ブロマイド, プリズム, 応援グッズ)')
+    parser.add_argument('--rows',
+                        help='条件に合う行のブロマイドだけを更新する (例: レア==UR)')
+    parser.add_argument('--page', action='append',
+                        help='指定したタイトルのページだけを更新する')
     args = parser.parse_args()
     main(args)
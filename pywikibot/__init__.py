@@ -46,8 +46,6 @@ from pywikibot.bot import (
 from pywikibot.bot_choice import (
     QuitKeyboardInterrupt as _QuitKeyboardInterrupt,
 )
-from pywikibot.data.api import UploadWarning as _UploadWarning
-from pywikibot.diff import PatchManager
 from pywikibot.exceptions import (
     Error, InvalidTitle, BadTitle, NoPage, NoMoveTarget, SectionError,
     SiteDefinitionError, NoSuchSite, UnknownSite, UnknownFamily,
@@ -57,15 +55,13 @@ from pywikibot.exceptions import (
     PageSaveRelatedError, PageNotSaved, OtherPageSaveError,
     LockedPage, CascadeLockedPage, LockedNoPage, NoCreateError,
     EditConflict, PageDeletedConflict, PageCreatedConflict,
-    ServerError, FatalServerError, Server504Error,
+    ServerError, FatalServerError, Server504Error, Server429Error,
     CaptchaError, SpamfilterError, CircularRedirect, InterwikiRedirectPage,
     WikiBaseError, CoordinateGlobeUnknownException,
     DeprecatedPageNotFoundError as _DeprecatedPageNotFoundError,
     _EmailUserError,
 )
-from pywikibot.family import Family
 from pywikibot.i18n import translate
-from pywikibot.site import BaseSite
 from pywikibot.tools import (
     # __ to avoid conflict with ModuleDeprecationWrapper._deprecated
     deprecated as __deprecated,
@@ -75,12 +71,11 @@ from pywikibot.tools import (
     redirect_func,
     ModuleDeprecationWrapper as _ModuleDeprecationWrapper,
     PY2,
+    PYTHON_VERSION,
     UnicodeMixin,
 )
 from pywikibot.tools.formatter import color_format
 
-import pywikibot.textlib as textlib
-
 textlib_methods = (
     'unescape', 'replaceExcept', 'removeDisabledParts', 'removeHTMLParts',
     'isDisabled', 'interwikiFormat', 'interwikiSort',
@@ -111,7 +106,7 @@ __all__ = (
     'LockedPage', 'CascadeLockedPage', 'LockedNoPage', 'NoCreateError',
     'EditConflict', 'PageDeletedConflict', 'PageCreatedConflict',
     'UploadWarning',
-    'ServerError', 'FatalServerError', 'Server504Error',
+    'ServerError', 'FatalServerError', 'Server504Error', 'Server429Error',
     'CaptchaError', 'SpamfilterError', 'CircularRedirect',
     'InterwikiRedirectPage',
     'WikiBaseError', 'CoordinateGlobeUnknownException',
@@ -123,10 +118,58 @@ if PY2:
     # T111615: Python 2 requires __all__ is bytes
     globals()['__all__'] = tuple(bytes(item) for item in __all__)
 
-for _name in textlib_methods:
-    target = getattr(textlib, _name)
-    wrapped_func = redirect_func(target)
-    globals()[_name] = wrapped_func
+# Public names which are imported from their module when they are first
+# used, so that 'import pywikibot' does not load the site, page and
+# comms layers. Submodules which used to be imported by this module are
+# loaded on demand too.
+_lazy_names = {
+    'BaseSite': 'pywikibot.site',
+    'Family': 'pywikibot.family',
+    'PatchManager': 'pywikibot.diff',
+    'Page': 'pywikibot.page',
+    'FilePage': 'pywikibot.page',
+    'Category': 'pywikibot.page',
+    'Link': 'pywikibot.page',
+    'User': 'pywikibot.page',
+    'ItemPage': 'pywikibot.page',
+    'PropertyPage': 'pywikibot.page',
+    'Claim': 'pywikibot.page',
+    'html2unicode': 'pywikibot.page',
+    'url2unicode': 'pywikibot.page',
+    'unicode2html': 'pywikibot.page',
+}
+_lazy_names.update((_name, 'pywikibot.textlib') for _name in textlib_methods)
+_lazy_modules = ('comms', 'data', 'diff', 'echo', 'family', 'login', 'page',
+                 'site', 'textlib', 'throttle', 'version')
+
+
+def _load_lazy(name):
+    """
+    Import a public name or submodule and add it to the module globals.
+
+    @param name: a key of _lazy_names or an item of _lazy_modules
+    @type name: str
+    @raises AttributeError: name is neither
+    """
+    if name in _lazy_modules:
+        module_name = __name__ + '.' + name
+        __import__(module_name)
+        value = sys.modules[module_name]
+    elif name in _lazy_names:
+        __import__(_lazy_names[name])
+        value = getattr(sys.modules[_lazy_names[name]], name)
+        if name in textlib_methods:
+            value = redirect_func(value, source_module=__name__)
+    else:
+        raise AttributeError("module '{0}' has no attribute '{1}'"
+                             .format(__name__, name))
+    globals()[name] = value
+    return value
+
+
+def __getattr__(name):
+    """Load public names on first access (PEP 562, Python 3.7+)."""
+    return _load_lazy(name)
 
 
 deprecated = redirect_func(__deprecated)
@@ -283,6 +326,7 @@ class Coordinate(_WbRepresentation):
     @property
     def entity(self):
         """Return the entity uri of the globe."""
+        from pywikibot.page import ItemPage
         if not self._entity:
             if self.globe not in self.site.globes():
                 raise CoordinateGlobeUnknownException(
@@ -420,6 +464,7 @@ class Coordinate(_WbRepresentation):
         @type lazy_load: bool
         @return: pywikibot.ItemPage
         """
+        from pywikibot.page import ItemPage
         if isinstance(self._entity, ItemPage):
             return self._entity
 
@@ -776,6 +821,7 @@ class WbQuantity(_WbRepresentation):
     @property
     def unit(self):
         """Return _unit's entity uri or '1' if _unit is None."""
+        from pywikibot.page import ItemPage
         if isinstance(self._unit, ItemPage):
             return self._unit.concept_uri()
         return self._unit or '1'
@@ -800,6 +846,7 @@ class WbQuantity(_WbRepresentation):
         if not isinstance(self._unit, basestring):
             return self._unit
 
+        from pywikibot.page import ItemPage
         repo = repo or self.site
         self._unit = ItemPage.from_entity_uri(repo, self._unit, lazy_load)
         return self._unit
@@ -945,6 +992,7 @@ class _WbDataPage(_WbRepresentation):
         @param label: Label describing the data type in error messages.
         @type site: str
         """
+        from pywikibot.page import Page
         if not isinstance(page, Page):
             raise ValueError('Page must be a pywikibot.Page object.')
 
@@ -1010,6 +1058,7 @@ class _WbDataPage(_WbRepresentation):
         @type site: pywikibot.site.DataSite
         @rtype: pywikibot._WbDataPage
         """
+        from pywikibot.page import Page
         data_site = cls._get_data_site(site)
         page = Page(data_site, page_name)
         return cls(page, site)
@@ -1152,6 +1201,9 @@ def Site(code=None, fam=None, user=None, sysop=None, interface=None, url=None):
     @rtype: pywikibot.site.APISite
 
     """
+    from pywikibot.family import Family
+    from pywikibot.site import BaseSite
+
     # Either code and fam or only url
     if url and (code or fam):
         raise ValueError('URL to the wiki OR a pair of code and family name '
@@ -1236,20 +1288,6 @@ def Site(code=None, fam=None, user=None, sysop=None, interface=None, url=None):
 getSite = redirect_func(Site, old_name='getSite')
 
 
-# These imports depend on Wb* classes above.
-from pywikibot.page import (
-    Page,
-    FilePage,
-    Category,
-    Link,
-    User,
-    ItemPage,
-    PropertyPage,
-    Claim,
-)
-from pywikibot.page import html2unicode, url2unicode, unicode2html
-
-
 link_regex = re.compile(r'\[\[(?P<title>[^\]|[<>{}]*)(\|.*?)?\]\]')
 
 
@@ -1266,6 +1304,7 @@ def showDiff(oldtext, newtext, context=0):
     The differences are highlighted (only on compatible systems) to show which
     changes were made.
     """
+    from pywikibot.diff import PatchManager
     PatchManager(oldtext, newtext, context=context).print_hunks()
 
 
@@ -1315,7 +1354,7 @@ def _flush(stop=True):
             '{lightblue}Waiting for {num} pages to be put. '
             'Estimated time remaining: {sec}{default}', num=num, sec=sec))
 
-    while _putthread.isAlive() and page_put_queue.qsize() > 0:
+    while _putthread.is_alive() and page_put_queue.qsize() > 0:
         try:
             _putthread.join(1)
         except KeyboardInterrupt:
@@ -1349,7 +1388,7 @@ def async_manager():
 
 def async_request(request, *args, **kwargs):
     """Put a request on the queue, and start the daemon if necessary."""
-    if not _putthread.isAlive():
+    if not _putthread.is_alive():
         try:
             page_put_queue.mutex.acquire()
             try:
@@ -1369,8 +1408,14 @@ _putthread = threading.Thread(target=async_manager)
 _putthread.setName('Put-Thread')
 _putthread.setDaemon(True)
 
+if PYTHON_VERSION < (3, 7):
+    # modules have no __getattr__ hook, so import everything now
+    for _name in _lazy_modules + tuple(_lazy_names):
+        _load_lazy(_name)
+
 wrapper = _ModuleDeprecationWrapper(__name__)
-wrapper._add_deprecated_attr('ImagePage', FilePage)
+wrapper._add_deprecated_attr('ImagePage',
+                             replacement_name='pywikibot.page.FilePage')
 wrapper._add_deprecated_attr(
     'cookie_jar', replacement_name='pywikibot.comms.http.cookie_jar')
 wrapper._add_deprecated_attr(
@@ -1386,6 +1431,6 @@ wrapper._add_deprecated_attr(
     warning_message='pywikibot.QuitKeyboardInterrupt is deprecated; '
                     'use pywikibot.bot.QuitKeyboardInterrupt instead.')
 wrapper._add_deprecated_attr(
-    'UploadWarning', _UploadWarning,
+    'UploadWarning', replacement_name='pywikibot.data.api.UploadWarning',
     warning_message='pywikibot.UploadWarning is deprecated; '
                     'use APISite.upload with a warning handler instead.')
@@ -24,12 +24,18 @@ __docformat__ = 'epytext'
 
 import atexit
 import sys
+import threading
+import time
 
+from email.utils import mktime_tz, parsedate_tz
 from string import Formatter
 from warnings import warn
 
 import requests
 
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+
 try:
     import requests_oauthlib
 except ImportError as e:
@@ -37,9 +43,11 @@ except ImportError as e:
 
 if sys.version_info[0] > 2:
     from http import cookiejar as cookielib
+    from queue import Full, Queue
     from urllib.parse import quote, urlparse
 else:
     import cookielib
+    from Queue import Full, Queue
     from urllib2 import quote
     from urlparse import urlparse
 
@@ -49,7 +57,7 @@ from pywikibot import __release__
 from pywikibot.bot import calledModuleName
 from pywikibot.comms import threadedhttp
 from pywikibot.exceptions import (
-    FatalServerError, Server504Error, Server414Error
+    FatalServerError, Server504Error, Server414Error, Server429Error
 )
 from pywikibot.logging import critical, debug, error, log, warning
 from pywikibot.tools import (
@@ -107,12 +115,87 @@ except (IOError, cookielib.LoadError):
 else:
     debug('Loaded cookies from file.', _logger)
 
+
+def _http_adapter(pool_maxsize):
+    """Return a HTTPAdapter using the configured pool size and retries."""
+    retries = Retry(total=config.http_max_retries,
+                    backoff_factor=config.http_retry_backoff,
+                    status_forcelist=config.http_retry_status,
+                    raise_on_status=False)
+    return HTTPAdapter(pool_connections=config.http_pool_connections,
+                       pool_maxsize=pool_maxsize, max_retries=retries)
+
+
+def _mount_adapters(session):
+    """Mount the connection pool adapters on the session.
+
+    A host listed in config.http_pool_maxsize_per_host gets its own adapter;
+    requests picks the adapter with the longest matching prefix.
+    """
+    for scheme in ('http://', 'https://'):
+        session.mount(scheme, _http_adapter(config.http_pool_maxsize))
+        for host, maxsize in config.http_pool_maxsize_per_host.items():
+            session.mount(scheme + host + '/', _http_adapter(maxsize))
+    if not config.http_keep_alive:
+        session.headers['connection'] = 'close'
+
+
 session = requests.Session()
 session.cookies = cookie_jar
+_mount_adapters(session)
+
+# queue of requests for the HTTP worker threads started by _enqueue
+_request_queue = Queue(config.http_queue_size)
+_workers = []
+_workers_lock = threading.Lock()
+
+
+def _http_worker():
+    """Process queued requests until a None request is received."""
+    while True:
+        request = _request_queue.get()
+        try:
+            if request is None:
+                break
+            _http_process(session, request)
+        except Exception:
+            # exceptions raised in callbacks cannot be caught by the caller
+            error('Exception in HTTP worker thread:', exc_info=True)
+        finally:
+            if request is not None:
+                # never leave a caller waiting for the response data
+                request._done.set()
+            _request_queue.task_done()
+
+
+def _start_workers():
+    """Start the HTTP worker threads if they are not running yet."""
+    with _workers_lock:
+        if _workers:
+            return
+        for i in range(max(config.http_threads, 1)):
+            thread = threading.Thread(target=_http_worker,
+                                      name='HTTP-Thread-%d' % i)
+            thread.daemon = True
+            thread.start()
+            _workers.append(thread)
 
 
 # Prepare flush on quit
 def _flush():
+    # the workers are daemon threads: do not wait longer than one request
+    # may take for them to finish the queued requests
+    timeout = config.socket_timeout
+    if isinstance(timeout, tuple):
+        timeout = max(timeout)
+    deadline = time.time() + timeout
+    for thread in _workers:
+        try:
+            _request_queue.put(None, timeout=max(deadline - time.time(), 0))
+        except Full:
+            break
+    for thread in _workers:
+        thread.join(max(deadline - time.time(), 0))
     session.close()
     message = 'Closing network session.'
     if hasattr(sys, 'last_type'):
@@ -290,8 +373,11 @@ def request(site=None, uri=None, method='GET', params=None, body=None,
         to automatically chose the charset from the returned header (defaults
         to latin-1)
     @type charset: CodecInfo, str, None
-    @return: The received data
-    @rtype: a unicode string
+    @kwarg stream: return the request instead of the received data, to
+        read the response body with L{threadedhttp.HttpRequest.iter_raw}
+    @type stream: bool
+    @return: The received data, or the request if stream is True
+    @rtype: a unicode string or L{threadedhttp.HttpRequest}
     """
     # body and data parameters both map to the data parameter of
     # requests.Session.request.
@@ -320,6 +406,8 @@ def request(site=None, uri=None, method='GET', params=None, body=None,
     headers['user-agent'] = user_agent(site, format_string)
 
     r = fetch(baseuri, method, params, body, headers, **kwargs)
+    if kwargs.get('stream'):
+        return r
     return r.content
 
 
@@ -370,15 +458,37 @@ def _http_process(session, http_request):
         # Note that the connections are pooled which mean that a future
         # HTTPS request can succeed even if the certificate is invalid and
         # verify=True, when a request with verify=False happened before
+        stream = http_request.kwargs.pop('stream', False)
         response = session.request(method, uri, params=params, data=body,
                                    headers=headers, auth=auth, timeout=timeout,
-                                   verify=not ignore_validation)
+                                   verify=not ignore_validation, stream=stream)
     except Exception as e:
         http_request.data = e
     else:
         http_request.data = response
 
 
+def retry_after(response):
+    """
+    Return the seconds to wait given by the Retry-After header of a response.
+
+    @param response: the response
+    @type response: requests.Response
+    @return: seconds to wait or None if the header is missing or invalid
+    @rtype: float or None
+    """
+    value = response.headers.get('retry-after')
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        date = parsedate_tz(value)
+        if date is None:
+            return None
+        return max(mktime_tz(date) - time.time(), 0.0)
+
+
 def error_handling_callback(request):
     """
     Raise exceptions and log alerts.
@@ -401,6 +511,10 @@ def error_handling_callback(request):
     if request.status == 414:
         raise Server414Error('Too long GET request')
 
+    if request.status == 429:
+        raise Server429Error('Too many requests to %s' % request.hostname,
+                             retry_after(request.data))
+
     # HTTP status 207 is also a success status for Webdav FINDPROP,
     # used by the version module.
     if request.status not in (200, 207):
@@ -419,9 +533,11 @@ def _enqueue(uri, method="GET", params=None, body=None, headers=None, data=None,
     invoked, even if the default error handler detects a problem, so they
     must check request.exception before using the response data.
 
-    Note: multiple async requests do not automatically run concurrently,
-    as they are limited by the number of http threads in L{numthreads},
-    which is set to 1 by default.
+    Requests are run by a pool of config.http_threads worker threads, so
+    multiple async requests run concurrently. At most
+    config.http_queue_size requests wait for a free thread; further calls
+    block until there is room in the queue. Accessing the response data of
+    the returned request blocks until it has been processed.
 
     @see: L{requests.Session.request} for parameters.
 
@@ -449,6 +565,16 @@ def _enqueue(uri, method="GET", params=None, body=None, headers=None, data=None,
 
     callbacks += kwargs.pop('callbacks', [])
 
+    request = _make_request(uri, method, params, body, headers, callbacks,
+                            **kwargs)
+    request._queued = True
+    _start_workers()
+    _request_queue.put(request)
+    return request
+
+
+def _make_request(uri, method, params, body, headers, callbacks, **kwargs):
+    """Return a HttpRequest with the extra headers and user agent set."""
     all_headers = config.extra_headers.copy()
     all_headers.update(headers or {})
 
@@ -456,10 +582,8 @@ def _enqueue(uri, method="GET", params=None, body=None, headers=None, data=None,
     if not user_agent_format_string or '{' in user_agent_format_string:
         all_headers['user-agent'] = user_agent(None, user_agent_format_string)
 
-    request = threadedhttp.HttpRequest(
+    return threadedhttp.HttpRequest(
         uri, method, params, body, all_headers, callbacks, **kwargs)
-    _http_process(session, request)
-    return request
 
 
 def fetch(uri, method="GET", params=None, body=None, headers=None,
@@ -468,8 +592,8 @@ def fetch(uri, method="GET", params=None, body=None, headers=None,
     """
     Blocking HTTP request.
 
-    Note: The callback runs in the HTTP thread, where exceptions are logged
-    but are not able to be caught.
+    Unlike L{_enqueue}, the request and its callbacks are run in the
+    caller's thread.
 
     See L{requests.Session.request} for parameters.
 
@@ -501,7 +625,16 @@ def fetch(uri, method="GET", params=None, body=None, headers=None,
         elif use_fake_user_agent is True:
             headers['user-agent'] = fake_user_agent()
 
-    request = _enqueue(uri, method, params, body, headers, **kwargs)
+    # The request is processed in the caller's thread; a blocking request
+    # must not wait for a worker thread which might itself be waiting on it.
+    callbacks = []
+    callback = kwargs.pop('callback', None)
+    if callback:
+        callbacks.append(callback)
+    callbacks += kwargs.pop('callbacks', [])
+    request = _make_request(uri, method, params, body, headers, callbacks,
+                            **kwargs)
+    _http_process(session, request)
     assert(request._data is not None)  # if there's no data in the answer we're in trouble
     # Run the error handling callback in the callers thread so exceptions
     # may be caught.
@@ -9,6 +9,7 @@ __docformat__ = 'epytext'
 # standard python libraries
 import codecs
 import sys
+import threading
 
 if sys.version_info[0] > 2:
     from urllib.parse import urlparse
@@ -59,10 +60,19 @@ class HttpRequest(UnicodeMixin):
 
         self._parsed_uri = None
         self._data = None
+        # set when the request has been queued for an HTTP worker thread
+        self._queued = False
+        self._done = threading.Event()
 
     @property
     def data(self):
-        """Return the requests response tuple."""
+        """Return the requests response tuple.
+
+        If the request is still waiting for an HTTP worker thread, block
+        until it is done.
+        """
+        if self._data is None and self._queued:
+            self._done.wait()
         assert(self._data is not None)
         return self._data
 
@@ -71,9 +81,12 @@ class HttpRequest(UnicodeMixin):
         """Set the requests response and invoke each callback."""
         self._data = value
 
-        if self.callbacks:
-            for callback in self.callbacks:
-                callback(self)
+        try:
+            if self.callbacks:
+                for callback in self.callbacks:
+                    callback(self)
+        finally:
+            self._done.set()
 
     @property
     def exception(self):
@@ -93,6 +106,25 @@ class HttpRequest(UnicodeMixin):
         if not self.exception:
             return self.data.content
 
+    def iter_raw(self, chunk_size=2 ** 16):
+        """
+        Iterate over the raw response body in chunks.
+
+        If the request was made with stream=True, the body is read from the
+        connection while it is iterated.
+
+        @param chunk_size: number of bytes of each chunk
+        @type chunk_size: int
+        @rtype: iterable of bytes
+        """
+        if not self.exception:
+            return self.data.iter_content(chunk_size)
+
+    def close(self):
+        """Release the connection of a streamed response."""
+        if not self.exception:
+            self.data.close()
+
     @property
     def parsed_uri(self):
         """Return the parsed requested uri."""
@@ -165,6 +165,15 @@ fake_user_agent = False
 site_interface = 'APISite'
 # number of days to cache namespaces, api configuration, etc.
 API_config_expiry = 30
+# maximum size in MiB of the API cache; least recently used entries are
+# deleted when it grows larger. 0 disables the limit.
+API_cache_max_size = 100
+# Keep the site specific exception patterns of textlib, which are built
+# from the namespaces, magic words and interwiki prefixes of the site, in
+# regexes.sqlite3 of the API cache directory for API_config_expiry days, so
+# that other processes do not build them again. Compiled regexes cannot be
+# stored; each process still compiles the patterns it uses once.
+precompiled_regexes = False
 
 # The maximum number of bytes which uses a GET request, if not positive
 # it'll always use POST requests
@@ -629,6 +638,25 @@ maxthrottle = 60
 # 'put_throttle' seconds.
 put_throttle = 10
 
+# Use a token bucket throttle instead of fixed delays between requests.
+# Reads and writes each have a bucket which is refilled with one token every
+# minthrottle or put_throttle seconds and holds at most read_burst or
+# write_burst tokens, so short bursts of requests are not delayed.
+# All processes on this host share the buckets of a site through
+# throttle.sqlite3 in the user directory, instead of multiplying the delays
+# by the number of processes listed in throttle.ctrl.
+token_bucket_throttle = False
+read_burst = 10
+write_burst = 1
+
+# Adapt the throttle delays and the number of concurrent requests to the load
+# of the server. Fast responses shorten the delays, while slow responses,
+# maxlag errors and HTTP 429 responses lengthen them, down to minthrottle
+# (put_throttle for writes) and up to maxthrottle seconds. Responses slower
+# than adaptive_slow_response seconds count as slow.
+adaptive_throttle = False
+adaptive_slow_response = 2.0
+
 # Sometimes you want to know when a delay is inserted. If a delay is larger
 # than 'noisysleep' seconds, it is logged on the screen.
 noisysleep = 3.0
@@ -657,6 +685,27 @@ max_retries = 15
 # Minimum time to wait before resubmitting a failed API request.
 retry_wait = 5
 
+# Merge queries for page info, categoryinfo, pageprops, coordinates and the
+# latest revision which other threads make within this many seconds into one
+# API request. 0 disables merging.
+api_coalesce_window = 0
+
+# Decode the pages of preloadpages responses one at a time while the
+# response is received, instead of reading and decoding the whole response
+# first. This lowers the memory used for batches of large pages.
+api_stream_pages = False
+
+# Number of batches of pages which PreloadingGenerator loads in background
+# threads while the pages of the current batch are processed. 0 loads each
+# batch only when it is needed.
+preload_read_ahead = 0
+
+# Size preloadpages batches to about this many bytes of page text, using
+# the page lengths known from earlier queries, instead of a fixed number of
+# pages. Batches grow up to the API limit of titles per query, which is
+# higher for accounts with the apihighlimits right. 0 uses fixed batches.
+preload_batch_bytes = 0
+
 # ############# TABLE CONVERSION BOT SETTINGS ##############
 
 # will split long paragraphs for better reading the source.
@@ -781,6 +830,34 @@ persistent_http = False
 # read timeout, or a single value for both in a tuple (since requests 2.4.0).
 socket_timeout = (6.05, 45)
 
+# Size of the HTTP connection pools. http_pool_connections is the number of
+# hosts for which a pool is kept and http_pool_maxsize the number of
+# connections kept open in each pool. Use http_pool_maxsize_per_host to
+# override the pool size for single hosts, e.g.
+# http_pool_maxsize_per_host = {'ja.wikipedia.org': 20}
+http_pool_connections = 10
+http_pool_maxsize = 10
+http_pool_maxsize_per_host = {}
+
+# Keep HTTP connections open between requests. If False, each request
+# closes its connection ("Connection: close").
+http_keep_alive = True
+
+# Retry policy of the HTTP connection pool, applied before the API retries
+# configured by max_retries and retry_wait. http_max_retries is the number of
+# retries for connection errors and for responses whose status is listed in
+# http_retry_status; http_retry_backoff is the backoff factor in seconds
+# between them.
+http_max_retries = 0
+http_retry_backoff = 0.0
+http_retry_status = [502, 503, 504]
+
+# Number of threads running asynchronous HTTP requests (comms.http._enqueue)
+# and the maximum number of requests waiting for a free thread. If
+# http_queue_size is <= 0, the queue size is infinite.
+http_threads = 4
+http_queue_size = 64
+
 
 # ############# COSMETIC CHANGES SETTINGS ##############
 # The bot can make some additional changes to each page it edits, e.g. fix
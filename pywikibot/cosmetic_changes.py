@@ -310,6 +310,8 @@ class CosmeticChangesToolkit(object):
         """
         categories = None
         interwikiLinks = None
+        # the categories and interwiki links are read from the same text
+        parsed = textlib.ParsedWikitext(text)
 
         # Pywikibot is no longer allowed to touch categories on the
         # German Wikipedia. See
@@ -318,7 +320,7 @@ class CosmeticChangesToolkit(object):
         if not self.template and '{{Personendaten' not in text and \
            '{{SORTIERUNG' not in text and '{{DEFAULTSORT' not in text and \
            self.site.code not in ('et', 'it', 'bg', 'ru'):
-            categories = textlib.getCategoryLinks(text, site=self.site)
+            categories = textlib.getCategoryLinks(parsed, site=self.site)
 
         if not self.talkpage:  # and pywikibot.calledModuleName() <> 'interwiki':
             subpage = False
@@ -332,7 +334,7 @@ class CosmeticChangesToolkit(object):
                 if loc is not None and loc in self.title:
                     subpage = True
             interwikiLinks = textlib.getLanguageLinks(
-                text, insite=self.site, template_subpage=subpage)
+                parsed, insite=self.site, template_subpage=subpage)
 
             # Removing the interwiki
             text = textlib.removeLanguageLinks(text, site=self.site)
@@ -16,6 +16,7 @@ import json
 import os
 import pprint
 import re
+import threading
 import time
 import traceback
 
@@ -23,18 +24,15 @@ from collections import Container, MutableMapping
 from email.mime.nonmultipart import MIMENonMultipart
 from warnings import warn
 
-try:
-    import cPickle as pickle
-except ImportError:
-    import pickle
-
 import pywikibot
 
 from pywikibot import config, login
 
 from pywikibot.comms import http
+from pywikibot.data import cachestore, jsonstream
 from pywikibot.exceptions import (
-    Server504Error, Server414Error, FatalServerError, NoUsername,
+    Server504Error, Server414Error, Server429Error, FatalServerError,
+    NoUsername,
     Error,
     InvalidTitle
 )
@@ -169,6 +167,12 @@ class ParamInfo(Container):
 
     Provides cache aware fetching of parameter information.
 
+    The normalized information of each module is kept in the store
+    paraminfo.sqlite3 of the cache directory for config.API_config_expiry
+    days, keyed by the site, the 'generator' string of its siteinfo and the
+    module, so other processes load modules from there instead of the
+    server until the MediaWiki version of the site changes.
+
     Full support for MW 1.12+, when 'paraminfo' was introduced to the API.
     Partially supports MW 1.11, using data extracted from API 'help'.
     MW 1.10 not supported as module prefixes are not extracted from API 'help'.
@@ -230,6 +234,68 @@ class ParamInfo(Container):
         if self.modules_only_mode:
             self.paraminfo_keys = frozenset(['modules'])
 
+        self._store_prefix = None
+
+    @staticmethod
+    def _store():
+        """Return the store of parameter information fetched before."""
+        return cachestore.get_store(os.path.join(
+            CachedRequest._get_cache_dir(), 'paraminfo.sqlite3'))
+
+    def _store_key(self, module):
+        """
+        Return the key and description of a module in the store.
+
+        @return: key and description, or None if the store is not used
+        @rtype: tuple of str or None
+        """
+        if not config.API_config_expiry:
+            return None
+        if self._store_prefix is None:
+            try:
+                generator = self.site.siteinfo.get('generator', expiry=1)
+            except (APIError, KeyError):
+                return None
+            self._store_prefix = '{0!r}{1}:'.format(self.site, generator)
+        description = self._store_prefix + module
+        return (hashlib.sha256(description.encode('utf-8')).hexdigest(),
+                description)
+
+    def _load_stored(self, modules):
+        """
+        Load modules from the store.
+
+        @param modules: API modules to load
+        @type modules: set
+        @return: the loaded modules
+        @rtype: set
+        """
+        loaded = {}
+        expiry = config.API_config_expiry * 86400
+        for module in modules:
+            key = self._store_key(module)
+            if key is None:
+                return set()
+            entry = self._store().get(key[0], touch=False)
+            if entry and entry[0] == key[1] and entry[2] + expiry > time.time():
+                loaded[module] = entry[1]
+        if loaded:
+            pywikibot.debug('paraminfo loaded from store: {0}'.format(
+                ', '.join(sorted(loaded))), _logger)
+            self._paraminfo.update(loaded)
+            self._generate_submodules(loaded)
+        return set(loaded)
+
+    def _write_stored(self, modules):
+        """Write the normalized paraminfo of modules to the store."""
+        now = time.time()
+        expires = now + config.API_config_expiry * 86400
+        for module, data in modules.items():
+            key = self._store_key(module)
+            if key is None:
+                return
+            self._store().put(key[0], key[1], data, now, expires)
+
     def _add_submodules(self, name, modules):
         """Add the modules to the internal cache or check if equal."""
         # The current implementation here doesn't support submodules inside of
@@ -611,6 +677,10 @@ class ParamInfo(Container):
                           % modules, _logger=_logger)
             return
 
+        modules -= self._load_stored(modules)
+        if not modules:
+            return
+
         # If something went wrong in a batch it can add each module to the
         # batch and the generator will on the next iteration yield each module
         # separately
@@ -692,6 +762,7 @@ class ParamInfo(Container):
             self._paraminfo.update(normalized_result)
             self._generate_submodules(mod['path']
                                       for mod in normalized_result.values())
+            self._write_stored(normalized_result)
 
         if 'pageset' in modules and 'pageset' not in self._paraminfo:
             self._emulate_pageset()
@@ -1396,6 +1467,8 @@ class Request(MutableMapping):
         self.mime = mime  # this also sets self.mime_params
         self.throttle = throttle
         self.use_get = use_get
+        # decode query.pages while it is iterated, see L{jsonstream}
+        self.stream_pages = False
         if max_retries is None:
             self.max_retries = pywikibot.config.max_retries
         else:
@@ -1957,9 +2030,11 @@ class Request(MutableMapping):
                                                      headers, uri, body),
                                 _logger)
 
+                started = time.time()
+                stream = self.stream_pages and self.action == 'query'
                 rawdata = http.request(
                     site=self.site, uri=uri, method='GET' if use_get else 'POST',
-                    body=body, headers=headers)
+                    body=body, headers=headers, stream=stream)
             except Server504Error:
                 pywikibot.log(u"Caught HTTP 504 error; retrying")
                 self.wait()
@@ -1974,6 +2049,11 @@ class Request(MutableMapping):
                     pywikibot.warning('Caught HTTP 414 error, although not '
                                       'using GET.')
                     raise
+            except Server429Error as e:
+                pywikibot.log('Caught HTTP 429 error; retrying')
+                self.site.throttle.retry_after(e.retry_after)
+                self.wait(e.retry_after)
+                continue
             except FatalServerError:
                 # This error is not going to be fixed by just waiting
                 pywikibot.error(traceback.format_exc())
@@ -1985,14 +2065,28 @@ class Request(MutableMapping):
                 pywikibot.log(u"%s, %s" % (uri, paramstring))
                 self.wait()
                 continue
-            if not isinstance(rawdata, unicode):
-                rawdata = rawdata.decode(self.site.encoding())
-            pywikibot.debug((u"API response received from %s:\n" % self.site) +
-                            rawdata, _logger)
-            if rawdata.startswith(u"unknown_action"):
-                raise APIError(rawdata[:14], rawdata[16:])
+            self.site.throttle.record_response(time.time() - started)
+            if stream:
+                pywikibot.debug('Streaming API response from {0}'
+                                .format(self.site), _logger)
+                pages = jsonstream.PageStream(rawdata.iter_raw(),
+                                              self.site.encoding(),
+                                              close=rawdata.close)
+            else:
+                if not isinstance(rawdata, unicode):
+                    rawdata = rawdata.decode(self.site.encoding())
+                pywikibot.debug((u"API response received from %s:\n" % self.site) +
+                                rawdata, _logger)
+                if rawdata.startswith(u"unknown_action"):
+                    raise APIError(rawdata[:14], rawdata[16:])
             try:
-                result = json.loads(rawdata)
+                if stream:
+                    result = pages.read_head()
+                    if pages.streaming:
+                        # the page items are decoded while they are iterated
+                        result['query']['pages'] = pages
+                else:
+                    result = json.loads(rawdata)
             except ValueError:
                 # if the result isn't valid JSON, there must be a server
                 # problem. Wait a few seconds and try again
@@ -2208,11 +2302,35 @@ class Request(MutableMapping):
             except TypeError:
                 raise RuntimeError(result)
 
-    def wait(self):
-        """Determine how long to wait after a failed request."""
+    def submit_async(self, loop=None):
+        """
+        Return a coroutine which submits the request in a worker thread.
+
+        The request is retried and checked exactly like in L{submit}.
+        Requires Python 3.5 or newer.
+
+        @see: L{pywikibot.data.asyncapi.submit_async}
+        """
+        from pywikibot.data.asyncapi import submit_async
+        return submit_async(self, loop)
+
+    def wait(self, delay=None):
+        """
+        Determine how long to wait after a failed request.
+
+        @param delay: seconds to wait as requested by the server in a
+            Retry-After header; if None, wait retry_wait seconds and double
+            the next wait
+        @type delay: float or None
+        """
         self.max_retries -= 1
         if self.max_retries < 0:
             raise TimeoutError("Maximum retries attempted without success.")
+        if delay is not None:
+            pywikibot.warning('Waiting %s seconds before retrying as '
+                              'requested by the server.' % delay)
+            time.sleep(delay)
+            return
         pywikibot.warning(u"Waiting %s seconds before retrying."
                           % self.retry_wait)
         time.sleep(self.retry_wait)
@@ -2222,7 +2340,11 @@ class Request(MutableMapping):
 
 class CachedRequest(Request):
 
-    """Cached request."""
+    """Cached request.
+
+    Responses are kept in a L{cachestore.CacheStore} in the apicache
+    directory, keyed by the hash of L{_uniquedescriptionstr}.
+    """
 
     def __init__(self, expiry, *args, **kwargs):
         """Construct a CachedRequest object.
@@ -2318,6 +2440,16 @@ class CachedRequest(Request):
         return os.path.join(CachedRequest._get_cache_dir(),
                             self._create_file_name())
 
+    @classmethod
+    def _cache_store(cls):
+        """
+        Return the store for cache entries.
+
+        @rtype: L{cachestore.CacheStore}
+        """
+        return cachestore.get_store(
+            os.path.join(cls._get_cache_dir(), 'cache.sqlite3'))
+
     def _expired(self, dt):
         return dt + self.expiry < datetime.datetime.now()
 
@@ -2329,32 +2461,37 @@ class CachedRequest(Request):
         """
         self._add_defaults()
         try:
-            filename = self._cachefile_path()
-            with open(filename, 'rb') as f:
-                uniquedescr, self._data, self._cachetime = pickle.load(f)
+            key = self._create_file_name()
+            entry = self._cache_store().get(key)
+            if entry is None:
+                return False
+            uniquedescr, self._data, cachetime = entry
             assert(uniquedescr == self._uniquedescriptionstr())
+            self._cachetime = datetime.datetime.fromtimestamp(cachetime)
             if self._expired(self._cachetime):
                 self._data = None
                 return False
             pywikibot.debug(u"%s: cache hit (%s) for API request: %s"
-                            % (self.__class__.__name__, filename, uniquedescr),
+                            % (self.__class__.__name__, key, uniquedescr),
                             _logger)
             return True
-        except IOError:
-            # file not found
-            return False
         except Exception as e:
             pywikibot.output("Could not load cache: %r" % e)
             return False
 
     def _write_cache(self, data):
-        """Write data to self._cachefile_path()."""
-        data = [self._uniquedescriptionstr(), data, datetime.datetime.now()]
-        with open(self._cachefile_path(), 'wb') as f:
-            pickle.dump(data, f, protocol=config.pickle_protocol)
+        """Write data to the cache store."""
+        now = time.time()
+        expiry = self.expiry.days * 86400 + self.expiry.seconds
+        self._cache_store().put(
+            self._create_file_name(), self._uniquedescriptionstr(), data,
+            now, now + expiry,
+            max_size=config.API_cache_max_size * 2 ** 20)
 
     def submit(self):
         """Submit cached request."""
+        # the complete response is needed to cache it
+        self.stream_pages = False
         cached_available = self._load_cache()
         if not cached_available:
             self._data = super(CachedRequest, self).submit()
@@ -2970,6 +3107,181 @@ class PropertyGenerator(QueryGenerator):
         return self._props
 
 
+class CoalescedQuery(list):
+
+    """Page items of a merged query for the titles of one caller."""
+
+    def __init__(self, pageitems, props):
+        """Constructor."""
+        super(CoalescedQuery, self).__init__(pageitems)
+        self.props = props
+
+
+class RequestCoalescer(object):
+
+    """
+    Merge concurrent prop queries of a site into one request.
+
+    A call to L{query} waits config.api_coalesce_window seconds for calls from
+    other threads. All calls received in this time are sent as one
+    action=query request for the union of their prop modules and titles, and
+    each caller receives the page items of its own titles.
+
+    Calls are merged if they have the same other parameters; a parameter
+    which only one of them has prevents merging. Parameters ending in
+    'prop', like inprop or rvprop, are merged as well.
+    """
+
+    # keys of page items which are returned for every prop module
+    page_keys = frozenset(['pageid', 'ns', 'title', 'missing', 'invalid',
+                           'invalidreason', 'known', 'special'])
+
+    # keys of page items for prop modules returning a key of another name
+    prop_keys = {
+        'imageinfo': ('imageinfo', 'imagerepository'),
+        'pageimages': ('pageimage', 'thumbnail', 'original'),
+    }
+
+    def __init__(self, site, window=None, maxtitles=50):
+        """
+        Constructor.
+
+        @param site: the site to query
+        @type site: L{pywikibot.site.APISite}
+        @param window: seconds to wait for other calls; defaults to
+            config.api_coalesce_window
+        @type window: float
+        @param maxtitles: maximum number of titles of a merged request
+        @type maxtitles: int
+        """
+        self.site = site
+        self.window = window
+        self.maxtitles = maxtitles
+        self.lock = threading.Lock()
+        self._batch = None
+        self.requests = 0
+        self.calls = 0
+
+    @staticmethod
+    def _values(value):
+        """Return a parameter value as a list of strings."""
+        if isinstance(value, basestring):
+            return value.split('|')
+        if isinstance(value, (list, tuple, set, frozenset)):
+            return [unicode(v) for v in value]
+        return [unicode(value)]
+
+    def _accepts(self, batch, titles, parameters):
+        """Return whether a call can be added to a pending batch."""
+        if len(set(batch['titles']) | set(titles)) > self.maxtitles:
+            return False
+        # parameters such as rvsection change the result of a module, so
+        # they must be the same in both directions
+        return (self._fixed(batch['parameters']) ==
+                self._fixed(parameters))
+
+    @staticmethod
+    def _fixed(parameters):
+        """Return the parameters which are not merged."""
+        return dict((key, value) for key, value in parameters.items()
+                    if not key.endswith('prop'))
+
+    def _add(self, batch, titles, props, parameters):
+        """Add a call to a batch."""
+        batch['props'].update(props)
+        for title in titles:
+            if title not in batch['titles']:
+                batch['titles'].append(title)
+        for key, value in parameters.items():
+            if key.endswith('prop') and key in batch['parameters']:
+                merged = batch['parameters'][key]
+                merged.extend(v for v in value if v not in merged)
+            else:
+                batch['parameters'][key] = list(value)
+
+    def _submit(self, batch):
+        """Submit the merged request of a batch and store the page items."""
+        self.requests += 1
+        query = self.site._generator(PropertyGenerator,
+                                     type_arg='|'.join(sorted(batch['props'])),
+                                     titles=batch['titles'],
+                                     **batch['parameters'])
+        query.set_maximum_items(-1)  # suppress use of limit parameters
+        batch['pageitems'] = list(query)
+
+    def _select(self, pageitem, props, merged):
+        """Return the keys of a page item which belong to the given props."""
+        if 'info' in props:
+            # info keys are not known; drop the keys of other modules only
+            drop = set()
+            for prop in merged - props:
+                drop.update(self.prop_keys.get(prop, (prop, )))
+            return dict((key, value) for key, value in pageitem.items()
+                        if key not in drop)
+        keep = set(self.page_keys)
+        for prop in props:
+            keep.update(self.prop_keys.get(prop, (prop, )))
+        return dict((key, value) for key, value in pageitem.items()
+                    if key in keep)
+
+    def query(self, titles, prop, **parameters):
+        """
+        Query prop modules for titles together with concurrent calls.
+
+        @param titles: the titles to query
+        @type titles: list of str
+        @param prop: the "prop=" modules, separated by '|'
+        @type prop: str
+        @param parameters: further API parameters
+        @return: the page items of the titles; one title may have several
+            items if the query was continued
+        @rtype: L{CoalescedQuery}
+        """
+        props = set(prop.split('|'))
+        parameters = dict((key, self._values(value))
+                          for key, value in parameters.items())
+        window = self.window
+        if window is None:
+            window = config.api_coalesce_window
+        with self.lock:
+            self.calls += 1
+            batch = self._batch
+            leader = batch is None or not self._accepts(batch, titles,
+                                                        parameters)
+            if leader:
+                batch = {'props': set(), 'titles': [], 'parameters': {},
+                         'done': threading.Event(), 'error': None}
+                self._batch = batch
+            self._add(batch, titles, props, parameters)
+        if leader:
+            time.sleep(window)
+            with self.lock:
+                if self._batch is batch:
+                    self._batch = None
+            try:
+                self._submit(batch)
+            except Exception as e:
+                batch['error'] = e
+            finally:
+                batch['done'].set()
+        else:
+            batch['done'].wait()
+        if batch['error'] is not None:
+            raise batch['error']
+
+        merged = frozenset(batch['props'])
+        if merged == props:
+            return CoalescedQuery(
+                [pageitem for pageitem in batch['pageitems']
+                 if any(self.site.sametitle(pageitem['title'], title)
+                        for title in titles)], merged)
+        pageitems = [self._select(pageitem, props, merged)
+                     for pageitem in batch['pageitems']
+                     if any(self.site.sametitle(pageitem['title'], title)
+                            for title in titles)]
+        return CoalescedQuery(pageitems, merged & props)
+
+
 class ListGenerator(QueryGenerator):
 
     """Iterator for queries of type action=query&list=foo.
@@ -3171,6 +3483,8 @@ def update_page(page, pagedict, props=[]):
         page._isredir = 'redirect' in pagedict
     if 'touched' in pagedict:
         page._timestamp = pagedict['touched']
+    if 'length' in pagedict:
+        page._length = pagedict['length']
     if 'protection' in pagedict:
         if 'restrictiontypes' in pagedict:
             page._applicable_protections = set(pagedict['restrictiontypes'])
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+Asyncio interface to the MediaWiki API.
+
+This module requires Python 3.5 or newer.
+
+API requests are submitted by L{api.Request.submit} in a pool of worker
+threads, so retries, maxlag handling, warnings and the site throttle behave
+exactly as for blocking requests while many read queries are in flight at
+once. The number of concurrent requests is limited by config.http_threads
+unless a different limit is given to L{AsyncSite}, which runs its requests
+in a thread pool of that size.
+
+The module uses the async and await syntax, so the Python 2 checks and the
+documentation build, which runs on Python 3.4, skip it.
+
+Example::
+
+    async def main(site):
+        async_site = AsyncSite(site)
+        async for page in async_site.preloadpages(pages):
+            print(page.title(), len(page.text))
+
+    asyncio.get_event_loop().run_until_complete(main(pywikibot.Site()))
+"""
+#
+# (C) Pywikibot team, 2017
+#
+# Distributed under the terms of the MIT license.
+#
+from __future__ import absolute_import, unicode_literals
+
+import asyncio
+import collections
+import itertools
+
+from concurrent.futures import ThreadPoolExecutor
+
+from pywikibot import config
+from pywikibot.tools import itergroup
+
+_executor = None
+
+
+def _get_executor():
+    """Return the thread pool used to submit requests."""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=config.http_threads)
+    return _executor
+
+
+async def submit_async(request, loop=None):
+    """
+    Submit a request without blocking the event loop.
+
+    @param request: the request to submit
+    @type request: L{api.Request}
+    @param loop: the event loop to use; defaults to the current one
+    @return: a dict containing data retrieved from api.php
+    @rtype: dict
+    """
+    loop = loop or asyncio.get_event_loop()
+    return await loop.run_in_executor(_get_executor(), request.submit)
+
+
+class AsyncSite(object):
+
+    """
+    Asyncio facade for an APISite.
+
+    Attributes which are not coroutines are taken from the wrapped site.
+    """
+
+    def __init__(self, site, concurrency=None, loop=None):
+        """
+        Constructor.
+
+        @param site: the site to query
+        @type site: L{pywikibot.site.APISite}
+        @param concurrency: maximum number of requests in flight at once;
+            defaults to config.http_threads. The requests are run in a
+            thread pool of this size.
+        @type concurrency: int
+        @param loop: the event loop to use; defaults to the current one
+        """
+        self.site = site
+        self.concurrency = concurrency or config.http_threads
+        self.loop = loop or asyncio.get_event_loop()
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency)
+
+    def __getattr__(self, name):
+        """Delegate other attributes to the wrapped site."""
+        return getattr(self.site, name)
+
+    @property
+    def limit(self):
+        """
+        Return how many requests may be in flight now.
+
+        This is less than 'concurrency' while the
+        L{pywikibot.throttle.RateController} of the site throttle backs off.
+
+        @rtype: int
+        """
+        controller = getattr(getattr(self.site, 'throttle', None),
+                             'controller', None)
+        if controller:
+            return min(self.concurrency, controller.concurrency)
+        return self.concurrency
+
+    async def run(self, func, *args):
+        """Run a blocking site call in the worker threads."""
+        async with self._semaphore:
+            return await self.loop.run_in_executor(self._executor,
+                                                   func, *args)
+
+    async def submit(self, request):
+        """Submit an L{api.Request} for this site."""
+        return await self.run(request.submit)
+
+    async def simple_request(self, **kwargs):
+        """Submit a request with all kwargs as API parameters."""
+        return await self.submit(self.site._simple_request(**kwargs))
+
+    def preloadpages(self, pagelist, groupsize=50, **kwargs):
+        """
+        Return an asynchronous iterator of preloaded pages.
+
+        Up to 'concurrency' batches of 'groupsize' pages are loaded at
+        once. Pages are yielded in the order of pagelist.
+
+        @see: L{pywikibot.site.APISite.preloadpages} for the parameters.
+        @rtype: L{AsyncPreloadingGenerator}
+        """
+        return AsyncPreloadingGenerator(self, pagelist, groupsize, **kwargs)
+
+
+class AsyncPreloadingGenerator(object):
+
+    """Asynchronous iterator loading batches of pages concurrently."""
+
+    def __init__(self, async_site, pagelist, groupsize=50, **kwargs):
+        """
+        Constructor.
+
+        @param async_site: the site to load the pages from
+        @type async_site: L{AsyncSite}
+        @param pagelist: the pages to load
+        @type pagelist: iterable of L{pywikibot.page.BasePage}
+        @param groupsize: how many pages to query at a time
+        @type groupsize: int
+        @param kwargs: passed to L{pywikibot.site.APISite.preloadpages}
+        """
+        self.async_site = async_site
+        self.kwargs = kwargs
+        self._groups = itergroup(pagelist, groupsize)
+        self._pending = collections.deque()
+        self._pages = collections.deque()
+
+    def _load(self, group):
+        """Load a group of pages in a worker thread."""
+        return list(self.async_site.site.preloadpages(
+            group, groupsize=len(group), **self.kwargs))
+
+    def _schedule(self):
+        """Start loading groups until 'limit' groups are pending."""
+        missing = self.async_site.limit - len(self._pending)
+        for group in itertools.islice(self._groups, max(missing, 0)):
+            self._pending.append(self.async_site.loop.create_task(
+                self.async_site.run(self._load, group)))
+
+    def __aiter__(self):
+        """Return the iterator itself."""
+        return self
+
+    async def __anext__(self):
+        """Return the next preloaded page."""
+        while not self._pages:
+            self._schedule()
+            if not self._pending:
+                raise StopAsyncIteration
+            self._pages.extend(await self._pending.popleft())
+        return self._pages.popleft()
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+SQLite store for cached API responses.
+
+All entries of a cache directory are kept in one SQLite database instead of
+a pickle file per request. Entries are indexed by the hash of the request
+description, their expiry time and the time of their last access, so they
+can be looked up, pruned and evicted without reading every entry. Responses
+are stored as zlib compressed JSON.
+
+The database uses write-ahead logging, so processes reading from the cache
+are not blocked by a process writing to it.
+"""
+#
+# (C) Pywikibot team, 2017
+#
+# Distributed under the terms of the MIT license.
+#
+from __future__ import absolute_import, unicode_literals
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+_stores = {}
+_lock = threading.Lock()
+
+
+def get_store(path):
+    """
+    Return the store of a database file, opening it if needed.
+
+    @param path: path of the database file
+    @type path: str
+    @rtype: L{CacheStore}
+    """
+    path = os.path.abspath(path)
+    with _lock:
+        if path not in _stores:
+            _stores[path] = CacheStore(path)
+        return _stores[path]
+
+
+class CacheStore(object):
+
+    """Indexed store of API responses."""
+
+    schema = '''
+        CREATE TABLE IF NOT EXISTS entries (
+            key TEXT PRIMARY KEY,
+            description TEXT NOT NULL,
+            data BLOB NOT NULL,
+            size INTEGER NOT NULL,
+            cachetime REAL NOT NULL,
+            expires REAL NOT NULL,
+            accessed REAL NOT NULL,
+            hits INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS entries_expires ON entries (expires);
+        CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed);
+    '''
+
+    # columns returned by L{entries}
+    columns = ('key', 'description', 'size', 'cachetime', 'expires',
+               'accessed', 'hits')
+
+    # check the size of the store after this many writes
+    evict_interval = 100
+
+    def __init__(self, path):
+        """
+        Constructor.
+
+        @param path: path of the database file
+        @type path: str
+        """
+        self.path = path
+        self.lock = threading.RLock()
+        self._writes = 0
+        self._db = sqlite3.connect(path, timeout=30, isolation_level=None,
+                                   check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.executescript(self.schema)
+
+    @staticmethod
+    def encode(data):
+        """Serialize a response."""
+        text = json.dumps(data, separators=(',', ':'))
+        return sqlite3.Binary(zlib.compress(text.encode('utf-8')))
+
+    @staticmethod
+    def decode(blob):
+        """Deserialize a response."""
+        return json.loads(zlib.decompress(bytes(blob)).decode('utf-8'))
+
+    def get(self, key, touch=True):
+        """
+        Return an entry.
+
+        @param key: the hash of the request description
+        @type key: str
+        @param touch: whether to record the access for the eviction
+        @type touch: bool
+        @return: the request description, the response and the time it was
+            cached as a timestamp, or None if there is no such entry
+        @rtype: tuple or None
+        """
+        with self.lock:
+            row = self._db.execute(
+                'SELECT description, data, cachetime FROM entries '
+                'WHERE key = ?', (key, )).fetchone()
+            if row is None:
+                return None
+            if touch:
+                self._db.execute('UPDATE entries SET accessed = ?, '
+                                 'hits = hits + 1 WHERE key = ?',
+                                 (time.time(), key))
+        return row[0], self.decode(row[1]), row[2]
+
+    def put(self, key, description, data, cachetime, expires, max_size=None):
+        """
+        Store an entry.
+
+        @param key: the hash of the request description
+        @type key: str
+        @param description: the request description
+        @type description: str
+        @param data: the response
+        @type data: dict
+        @param cachetime: when the response was received as a timestamp
+        @type cachetime: float
+        @param expires: when the entry expires as a timestamp
+        @type expires: float
+        @param max_size: if given, least recently used entries are evicted
+            from time to time to keep the store below this many bytes
+        @type max_size: int
+        """
+        blob = self.encode(data)
+        with self.lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO entries (key, description, data, '
+                'size, cachetime, expires, accessed) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (key, description, blob, len(blob), cachetime, expires,
+                 cachetime))
+            self._writes += 1
+            if max_size and self._writes % self.evict_interval == 0:
+                self.evict(max_size)
+
+    def delete(self, key):
+        """Delete an entry."""
+        with self.lock:
+            self._db.execute('DELETE FROM entries WHERE key = ?', (key, ))
+
+    def entries(self, match=None, expired=False):
+        """
+        Return the entries without their responses.
+
+        @param match: only return entries whose description contains this
+        @type match: str
+        @param expired: only return expired entries
+        @type expired: bool
+        @return: dicts with the keys in L{columns}
+        @rtype: list of dict
+        """
+        query = 'SELECT {0} FROM entries'.format(', '.join(self.columns))
+        conditions = []
+        args = []
+        if match:
+            conditions.append("description LIKE ? ESCAPE '\\'")
+            args.append('%{0}%'.format(match.replace('\\', '\\\\')
+                                            .replace('%', '\\%')
+                                            .replace('_', '\\_')))
+        if expired:
+            conditions.append('expires < ?')
+            args.append(time.time())
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        with self.lock:
+            rows = self._db.execute(query, args).fetchall()
+        return [dict(zip(self.columns, row)) for row in rows]
+
+    def size(self):
+        """
+        Return the number of entries and their size in bytes.
+
+        @rtype: tuple of int
+        """
+        with self.lock:
+            count, size = self._db.execute(
+                'SELECT COUNT(*), SUM(size) FROM entries').fetchone()
+        return count, size or 0
+
+    def prune(self, now=None):
+        """
+        Delete the expired entries.
+
+        @param now: the current time as a timestamp
+        @type now: float
+        @return: number of deleted entries
+        @rtype: int
+        """
+        with self.lock:
+            cursor = self._db.execute('DELETE FROM entries WHERE expires < ?',
+                                      (now or time.time(), ))
+        return cursor.rowcount
+
+    def evict(self, max_size):
+        """
+        Delete expired and least recently used entries.
+
+        @param max_size: the maximum size of the store in bytes
+        @type max_size: int
+        @return: number of deleted entries
+        @rtype: int
+        """
+        with self.lock:
+            deleted = self.prune()
+            count, size = self.size()
+            if size <= max_size:
+                return deleted
+            keys = []
+            for key, entry_size in self._db.execute(
+                    'SELECT key, size FROM entries '
+                    'ORDER BY accessed').fetchall():
+                if size <= max_size:
+                    break
+                keys.append((key, ))
+                size -= entry_size
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                self._db.executemany('DELETE FROM entries WHERE key = ?',
+                                     keys)
+            finally:
+                self._db.execute('COMMIT')
+        return deleted + len(keys)
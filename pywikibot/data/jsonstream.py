@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental decoding of API responses.
+
+L{PageStream} reads a JSON response from an iterable of byte chunks. All
+members except the items of query.pages are decoded into the 'result'
+dict; the page items are decoded one at a time while the stream is
+iterated. Chunks are dropped as soon as the items in them are decoded, so
+neither the whole response body nor all page items of a batch are kept in
+memory at once.
+"""
+#
+# (C) Pywikibot team, 2017
+#
+# Distributed under the terms of the MIT license.
+#
+from __future__ import absolute_import, unicode_literals
+
+import codecs
+import json
+
+_decoder = json.JSONDecoder()
+
+_WHITESPACE = ' \t\n\r'
+
+
+class PageStream(object):
+
+    """
+    Iterator over the page items of a streamed query response.
+
+    L{read_head} must be called first. It decodes the response up to the
+    first page item and returns the members seen so far. Iterating the
+    stream then yields the page items; the members following query.pages
+    are added to 'result' when the iteration is finished.
+    """
+
+    # drop the consumed part of the buffer once it is this long
+    trim_size = 2 ** 16
+
+    def __init__(self, chunks, encoding='utf-8', close=None):
+        """
+        Constructor.
+
+        @param chunks: the response body
+        @type chunks: iterable of bytes
+        @param encoding: the encoding of the response body
+        @type encoding: str
+        @param close: called when the stream has been read or is closed
+        @type close: callable
+        """
+        self.result = {}
+        self.streaming = False
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder(encoding)()
+        self._close = close
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+        self._parser = None
+
+    def _read(self, size=1):
+        """
+        Append at least size characters to the buffer.
+
+        @return: whether any characters were added
+        @rtype: bool
+        """
+        added = 0
+        while not self._eof and added < size:
+            try:
+                chunk = next(self._chunks)
+            except StopIteration:
+                text = self._decoder.decode(b'', final=True)
+                self._eof = True
+                self.close()
+            else:
+                text = self._decoder.decode(chunk)
+            if self._pos >= self.trim_size:
+                self._buffer = self._buffer[self._pos:]
+                self._pos = 0
+            self._buffer += text
+            added += len(text)
+        return added > 0
+
+    def _peek(self):
+        """Return the next non-whitespace character without consuming it."""
+        while True:
+            while (self._pos < len(self._buffer) and
+                   self._buffer[self._pos] in _WHITESPACE):
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._read():
+                raise ValueError('Unexpected end of JSON response')
+
+    def _expect(self, chars):
+        """Consume and return the next character, which must be in chars."""
+        char = self._peek()
+        if char not in chars:
+            raise ValueError('Expected {0!r} at position {1} of the JSON '
+                             'response, got {2!r}'.format(chars, self._pos,
+                                                          char))
+        self._pos += 1
+        return char
+
+    def _decode(self):
+        """Decode the value at the current position."""
+        self._peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self._buffer, self._pos)
+            except ValueError:
+                # incomplete value; read as much as is buffered again, so
+                # that a long value is decoded a logarithmic number of times
+                if not self._read(len(self._buffer) - self._pos):
+                    raise
+                continue
+            # a number is only complete if something follows it
+            if end < len(self._buffer) or self._eof:
+                self._pos = end
+                return value
+            self._read()
+
+    def _members(self):
+        """Yield the keys of the object at the current position."""
+        self._expect('{')
+        if self._peek() == '}':
+            self._pos += 1
+            return
+        while True:
+            key = self._decode()
+            self._expect(':')
+            # the caller consumes the value before resuming
+            yield key
+            if self._expect(',}') == '}':
+                return
+
+    def _items(self):
+        """Yield the values of the object or array at the current position."""
+        if self._peek() == '{':
+            for key in self._members():
+                yield self._decode()
+            return
+        self._expect('[')
+        if self._peek() == ']':
+            self._pos += 1
+            return
+        while True:
+            yield self._decode()
+            if self._expect(',]') == ']':
+                return
+
+    def _parse(self):
+        """Decode the response, yielding self before the page items."""
+        for key in self._members():
+            if key != 'query' or self._peek() != '{':
+                self.result[key] = self._decode()
+                continue
+            query = self.result.setdefault('query', {})
+            for query_key in self._members():
+                if query_key == 'pages' and self._peek() in '{[':
+                    yield self
+                    for item in self._items():
+                        yield item
+                else:
+                    query[query_key] = self._decode()
+        try:
+            self._peek()
+        except ValueError:
+            return
+        raise ValueError('Extra data after the JSON response')
+
+    def read_head(self):
+        """
+        Decode the response up to the first page item.
+
+        If the response has no query.pages, it is decoded completely and
+        'streaming' remains False.
+
+        @return: the decoded members
+        @rtype: dict
+        @raises ValueError: the response is not valid JSON
+        """
+        self._parser = self._parse()
+        for _ in self._parser:
+            self.streaming = True
+            break
+        return self.result
+
+    def __iter__(self):
+        """Yield the page items and decode the rest of the response."""
+        try:
+            for item in self._parser:
+                yield item
+        finally:
+            self.close()
+
+    def close(self):
+        """Release the response."""
+        if self._close:
+            self._close()
+            self._close = None
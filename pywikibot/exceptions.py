@@ -12,6 +12,7 @@ Error: Base class, all exceptions should the subclass of this class.
   - InvalidTitle: Invalid page title
   - CaptchaError: Captcha is asked and config.solve_captcha == False
   - Server504Error: Server timed out with HTTP 504 code
+  - Server429Error: Server returned HTTP 429, too many requests
   - PageNotFound: Page not found (deprecated)
   - i18n.TranslationError: i18n/l10n message not available
   - UnknownExtension: Extension is not defined for this site
@@ -476,6 +477,22 @@ class Server414Error(Error):
     pass
 
 
+class Server429Error(Error):
+
+    """Server returned with HTTP 429 code, too many requests."""
+
+    def __init__(self, arg, retry_after=None):
+        """
+        Constructor.
+
+        @param retry_after: seconds to wait as given by the Retry-After
+            header, or None if the header is missing
+        @type retry_after: float or None
+        """
+        super(Server429Error, self).__init__(arg)
+        self.retry_after = retry_after
+
+
 class BadTitle(Error):
 
     """Server responded with BadTitle."""
@@ -25,11 +25,13 @@ __version__ = '$Id$'
 
 import calendar
 import codecs
+import collections
 import datetime
 import itertools
 import json
 import re
 import sys
+import threading
 import time
 
 from datetime import timedelta
@@ -1953,14 +1955,43 @@ def RepeatingGenerator(generator, key_func=lambda x: x, sleep_duration=60,
 
 
 @deprecated_args(pageNumber='groupsize', step='groupsize', lookahead=None)
-def PreloadingGenerator(generator, groupsize=50):
+def PreloadingGenerator(generator, groupsize=50, read_ahead=None):
     """
     Yield preloaded pages taken from another generator.
 
+    With read_ahead, the next batches of pages are loaded in background
+    threads while the pages of the current batch are processed. At most
+    read_ahead + 1 batches are held in memory, and every request still
+    waits for the site throttle.
+
     @param generator: pages to iterate over
     @param groupsize: how many pages to preload at once
     @type groupsize: int
-    """
+    @param read_ahead: how many batches to load in advance; defaults to
+        config.preload_read_ahead
+    @type read_ahead: int
+    """
+    if read_ahead is None:
+        read_ahead = config.preload_read_ahead
+    if not read_ahead:
+        for site, pages in _preload_groups(generator, groupsize):
+            for i in site.preloadpages(pages, groupsize):
+                yield i
+        return
+
+    pending = collections.deque()
+    for site, pages in _preload_groups(generator, groupsize):
+        pending.append(_PreloadThread(site, pages, groupsize))
+        while len(pending) > read_ahead:
+            for i in pending.popleft().result():
+                yield i
+    while pending:
+        for i in pending.popleft().result():
+            yield i
+
+
+def _preload_groups(generator, groupsize):
+    """Yield the site and the pages of each batch to preload."""
     # pages may be on more than one site, for example if an interwiki
     # generator is used, so use a separate preloader for each site
     sites = {}
@@ -1970,13 +2001,40 @@ def PreloadingGenerator(generator, groupsize=50):
         sites.setdefault(site, []).append(page)
         if len(sites[site]) >= groupsize:
             # if this site is at the groupsize, process it
-            group = sites.pop(site)
-            for i in site.preloadpages(group, groupsize):
-                yield i
+            yield site, sites.pop(site)
     for site, pages in sites.items():
         # process any leftover sites that never reached the groupsize
-        for i in site.preloadpages(pages, groupsize):
-            yield i
+        yield site, pages
+
+
+class _PreloadThread(threading.Thread):
+
+    """Thread preloading one batch of pages."""
+
+    def __init__(self, site, pages, groupsize):
+        """Constructor and start the thread."""
+        super(_PreloadThread, self).__init__(name='Preload-Thread')
+        self.daemon = True
+        self.site = site
+        self.pages = pages
+        self.groupsize = groupsize
+        self.error = None
+        self.start()
+
+    def run(self):
+        """Load the pages."""
+        try:
+            self.pages = list(self.site.preloadpages(self.pages,
+                                                     self.groupsize))
+        except Exception as e:
+            self.error = e
+
+    def result(self):
+        """Wait for the thread and return the preloaded pages."""
+        self.join()
+        if self.error:
+            raise self.error
+        return self.pages
 
 
 @deprecated_args(step='groupsize')
@@ -65,7 +65,9 @@ from pywikibot.exceptions import (
     PageSaveRelatedError,
 )
 from pywikibot.family import WikimediaFamily
-from pywikibot.throttle import Throttle
+from pywikibot.throttle import (
+    RateController, Throttle, TokenBucketThrottle,
+)
 from pywikibot.tools import (
     compute_file_hash,
     itergroup, UnicodeMixin, ComparableMixin, SelfCallMixin, SelfCallString,
@@ -803,7 +805,16 @@ class BaseSite(ComparableMixin):
     def throttle(self):
         """Return this Site's throttle. Initialize a new one if needed."""
         if not hasattr(self, "_throttle"):
-            self._throttle = Throttle(self, multiplydelay=True)
+            if pywikibot.config.adaptive_throttle:
+                controller = RateController()
+            else:
+                controller = None
+            if pywikibot.config.token_bucket_throttle:
+                self._throttle = TokenBucketThrottle(self,
+                                                     controller=controller)
+            else:
+                self._throttle = Throttle(self, multiplydelay=True,
+                                          controller=controller)
         return self._throttle
 
     @property
@@ -1866,6 +1877,7 @@ class APISite(BaseSite):
         self._siteinfo = Siteinfo(self)
         self._paraminfo = api.ParamInfo(self)
         self._interwikimap = _InterwikiMap(self)
+        self._coalescer = api.RequestCoalescer(self)
         self.tokens = TokenWallet(self)
 
     def __getstate__(self):
@@ -1873,12 +1885,14 @@ class APISite(BaseSite):
         new = super(APISite, self).__getstate__()
         del new['tokens']
         del new['_interwikimap']
+        del new['_coalescer']
         return new
 
     def __setstate__(self, attrs):
         """Restore things removed in __getstate__."""
         super(APISite, self).__setstate__(attrs)
         self._interwikimap = _InterwikiMap(self)
+        self._coalescer = api.RequestCoalescer(self)
         self.tokens = TokenWallet(self)
 
     @classmethod
@@ -2946,6 +2960,25 @@ class APISite(BaseSite):
         except api.APIError:
             return (0, 0, 0)
 
+    def _prop_query(self, page, prop, **args):
+        """
+        Return a query of prop modules for a single page.
+
+        If config.api_coalesce_window is set, the query is merged with
+        concurrent queries of other threads.
+
+        @param page: the page to query
+        @type page: L{pywikibot.page.BasePage}
+        @param prop: the "prop=" modules, separated by '|'
+        @type prop: str
+        @return: iterable of page items with a 'props' attribute
+        """
+        title = page.title(withSection=False)
+        if pywikibot.config.api_coalesce_window:
+            return self._coalescer.query([title], prop, **args)
+        return self._generator(api.PropertyGenerator, type_arg=prop,
+                               titles=title.encode(self.encoding()), **args)
+
     def _update_page(self, page, query):
         for pageitem in query:
             if not self.sametitle(pageitem['title'],
@@ -2955,27 +2988,20 @@ class APISite(BaseSite):
 
     def loadpageinfo(self, page, preload=False):
         """Load page info from api and store in page attributes."""
-        title = page.title(withSection=False)
         inprop = 'protection'
         if preload:
             inprop += '|preload'
 
-        query = self._generator(api.PropertyGenerator,
-                                type_arg="info",
-                                titles=title.encode(self.encoding()),
-                                inprop=inprop)
+        query = self._prop_query(page, 'info', inprop=inprop)
         self._update_page(page, query)
 
     def loadcoordinfo(self, page):
         """Load [[mw:Extension:GeoData]] info."""
-        title = page.title(withSection=False)
-        query = self._generator(api.PropertyGenerator,
-                                type_arg="coordinates",
-                                titles=title.encode(self.encoding()),
-                                coprop=['type', 'name', 'dim',
-                                        'country', 'region',
-                                        'globe'],
-                                coprimary='all')
+        query = self._prop_query(page, 'coordinates',
+                                 coprop=['type', 'name', 'dim',
+                                         'country', 'region',
+                                         'globe'],
+                                 coprimary='all')
         self._update_page(page, query)
 
     @need_extension('PageImages')
@@ -2988,20 +3014,12 @@ class APISite(BaseSite):
 
         @raises APIError: PageImages extension is not installed
         """
-        title = page.title(withSection=False)
-        query = self._generator(api.PropertyGenerator,
-                                type_arg='pageimages',
-                                titles=title.encode(self.encoding()),
-                                piprop=['name'])
+        query = self._prop_query(page, 'pageimages', piprop=['name'])
         self._update_page(page, query)
 
     def loadpageprops(self, page):
         """Load page props for the given page."""
-        title = page.title(withSection=False)
-        query = self._generator(api.PropertyGenerator,
-                                type_arg="pageprops",
-                                titles=title.encode(self.encoding()),
-                                )
+        query = self._prop_query(page, 'pageprops')
         self._update_page(page, query)
 
     def loadimageinfo(self, page, history=False,
@@ -3255,6 +3273,54 @@ class APISite(BaseSite):
                 priority, page = heapq.heappop(prio_queue)
                 yield page
 
+    def _preload_batches(self, pagelist, groupsize):
+        """
+        Yield batches of pages of about config.preload_batch_bytes bytes.
+
+        The size of a page is its length from a previous prop=info query if
+        it is known, otherwise the average length of the pages loaded so far.
+        Before any page has been loaded, batches have groupsize pages. A
+        batch holds at least one page and at most as many as the API
+        accepts for one query.
+
+        @param pagelist: an iterable that returns Page objects
+        @param groupsize: number of pages of the first batch
+        @type groupsize: int
+        """
+        budget = pywikibot.config.preload_batch_bytes
+        parameter = self._paraminfo.parameter('query+info', 'prop')
+        if self.logged_in() and self.has_right('apihighlimits'):
+            limit = int(parameter['highlimit'])
+        else:
+            limit = int(parameter['limit'])
+
+        average = float(budget) / groupsize
+        loaded_bytes = loaded_pages = 0
+        batch = []
+        batch_bytes = 0
+        for page in pagelist:
+            size = getattr(page, '_length', None)
+            if size is None:
+                size = average
+            if batch and (len(batch) >= limit or
+                          batch_bytes + size > budget):
+                yield batch
+                # the pages of the batch have been loaded now
+                for loaded in batch:
+                    if getattr(loaded, '_length', None) is not None:
+                        loaded_bytes += loaded._length
+                        loaded_pages += 1
+                if loaded_pages:
+                    average = max(float(loaded_bytes) / loaded_pages, 1)
+                batch = []
+                batch_bytes = 0
+                if getattr(page, '_length', None) is None:
+                    size = average
+            batch.append(page)
+            batch_bytes += size
+        if batch:
+            yield batch
+
     def preloadpages(self, pagelist, groupsize=50, templates=False,
                      langlinks=False, pageprops=False):
         """Return a generator to a list of preloaded pages.
@@ -3262,6 +3328,9 @@ class APISite(BaseSite):
         Pages are iterated in the same order than in the underlying pagelist.
         In case of duplicates in a groupsize batch, return the first entry.
 
+        If config.preload_batch_bytes is set, the number of pages of a batch
+        is adapted to the size of the pages, see L{_preload_batches}.
+
         @param pagelist: an iterable that returns Page objects
         @param groupsize: how many Pages to query at a time
         @type groupsize: int
@@ -3285,7 +3354,11 @@ class APISite(BaseSite):
 
         rvprop = ['ids', 'flags', 'timestamp', 'user', 'comment', 'content']
 
-        for sublist in itergroup(pagelist, groupsize):
+        if pywikibot.config.preload_batch_bytes > 0:
+            batches = self._preload_batches(pagelist, groupsize)
+        else:
+            batches = itergroup(pagelist, groupsize)
+        for sublist in batches:
             # Do not use p.pageid property as it will force page loading.
             pageids = [str(p._pageid) for p in sublist
                        if hasattr(p, "_pageid") and p._pageid > 0]
@@ -3308,6 +3381,8 @@ class APISite(BaseSite):
             else:
                 rvgen.request['titles'] = list(cache.keys())
             rvgen.request['rvprop'] = rvprop
+            # pages are yielded in the order of pagelist anyway
+            rvgen.request.stream_pages = pywikibot.config.api_stream_pages
             pywikibot.output(u"Retrieving %s pages from %s."
                              % (len(cache), self))
 
@@ -4009,12 +4084,20 @@ class APISite(BaseSite):
         # TODO if sysop: something
 
         # assemble API request
-        rvgen = self._generator(api.PropertyGenerator, total=total, **rvargs)
-        if step:
-            rvgen.set_query_increment = step
+        if (latest and revids is None and not rollback and
+                pywikibot.config.api_coalesce_window):
+            # the current revision of a single page can be merged with
+            # concurrent queries
+            del rvargs['titles']
+            rvgen = self._prop_query(page, rvargs.pop('type_arg'), **rvargs)
+        else:
+            rvgen = self._generator(api.PropertyGenerator, total=total,
+                                    **rvargs)
+            if step:
+                rvgen.set_query_increment = step
 
-        if latest or "revids" in rvgen.request:
-            rvgen.set_maximum_items(-1)  # suppress use of rvlimit parameter
+            if latest or "revids" in rvgen.request:
+                rvgen.set_maximum_items(-1)  # suppress use of rvlimit parameter
 
         for pagedata in rvgen:
             if not self.sametitle(pagedata['title'],
@@ -4077,10 +4160,7 @@ class APISite(BaseSite):
 
     def getcategoryinfo(self, category):
         """Retrieve data on contents of category."""
-        cititle = category.title(withSection=False)
-        ciquery = self._generator(api.PropertyGenerator,
-                                  type_arg="categoryinfo",
-                                  titles=cititle.encode(self.encoding()))
+        ciquery = self._prop_query(category, 'categoryinfo')
         self._update_page(category, ciquery)
 
     def categoryinfo(self, category):
@@ -16,10 +16,14 @@ from __future__ import absolute_import, unicode_literals
 __version__ = '$Id$'
 #
 
+import bisect
 import collections
 import datetime
+import hashlib
+import os
 import re
 import sys
+import time
 
 if sys.version_info[0] > 2:
     from html.parser import HTMLParser
@@ -51,6 +55,15 @@ from pywikibot.tools import (
 # cache for replaceExcept to avoid recompile or regexes each call
 _regex_cache = {}
 
+# cache for _MultiTemplateMatchBuilder; kept apart from _regex_cache, which
+# _get_regexes fills with the default regexes when it is empty
+_template_regex_cache = {}
+
+# lookups of _get_regexes and _MultiTemplateMatchBuilder which found a
+# compiled regex in their cache ('hits') or compiled one ('misses'), and
+# the misses which used a pattern from the regex store ('stored')
+_regex_cache_stats = collections.Counter()
+
 # This regex is only for use by extract_templates_and_params_regex.
 # It does not support template variables consisting of nested templates,
 # system variables like {{CURRENTYEAR}}, or template variables like {{{1}}}.
@@ -192,6 +205,12 @@ class _MultiTemplateMatchBuilder(object):
             raise ValueError(
                 '{0!r} is not a valid template'.format(template))
 
+        key = ('template', old, flags, repr(self.site))
+        if key in _template_regex_cache:
+            _regex_cache_stats['hits'] += 1
+            return _template_regex_cache[key]
+        _regex_cache_stats['misses'] += 1
+
         if namespace.case == 'first-letter':
             pattern = '[' + \
                       re.escape(old[0].upper()) + \
@@ -208,6 +227,7 @@ class _MultiTemplateMatchBuilder(object):
                                    r':|[mM][sS][gG]:)?' + pattern +
                                    r'(?P<parameters>\s*\|.+?|) *}}',
                                    flags)
+        _template_regex_cache[key] = templateRegex
         return templateRegex
 
     def search_any_predicate(self, templates):
@@ -225,6 +245,9 @@ def _create_default_regexes():
         # preformatted text
         'pre':          re.compile(r'(?is)<pre[ >].*?</pre>'),
         'source':       re.compile(r'(?is)<source .*?</source>'),
+        # alias of 'source'
+        ('source', 'alias'): re.compile(
+            r'(?is)<syntaxhighlight .*?</syntaxhighlight>'),
         'score':        re.compile(r'(?is)<score[ >].*?</score>'),
         # inline references
         'ref':          re.compile(r'(?is)<ref[ >].*?</ref>'),
@@ -263,8 +286,63 @@ def _create_default_regexes():
     })
 
 
+def _regex_store_key(key, site):
+    """
+    Return the key and description of a site specific regex in the store.
+
+    @return: key and description, or None if the store is not used
+    @rtype: tuple of str or None
+    """
+    if not (config.precompiled_regexes and config.API_config_expiry):
+        return None
+    try:
+        generator = site.siteinfo.get('generator', expiry=1)
+    except (pywikibot.Error, KeyError):
+        return None
+    description = '{0!r}{1}:regex:{2}'.format(site, generator, key)
+    return (hashlib.sha256(description.encode('utf-8')).hexdigest(),
+            description)
+
+
+def _regex_store():
+    """Return the store of site specific regex patterns."""
+    from pywikibot.data import api, cachestore
+    return cachestore.get_store(os.path.join(
+        api.CachedRequest._get_cache_dir(), 'regexes.sqlite3'))
+
+
+def _site_regex(key, site):
+    """
+    Compile a site specific regex of _regex_cache.
+
+    When config.precompiled_regexes is set, the pattern is loaded from the
+    store regexes.sqlite3 of the API cache directory, or built from the
+    site information and written to it. Compiled regexes cannot be stored,
+    so they are still compiled once per process.
+    """
+    re_text, re_var = _regex_cache[key]
+    store_key = _regex_store_key(key, site)
+    if store_key:
+        entry = _regex_store().get(store_key[0], touch=False)
+        if (entry and entry[0] == store_key[1] and
+                entry[2] + config.API_config_expiry * 86400 > time.time()):
+            _regex_cache_stats['stored'] += 1
+            return re.compile(entry[1], re.VERBOSE)
+    pattern = re_text % re_var(site)
+    if store_key:
+        now = time.time()
+        _regex_store().put(store_key[0], store_key[1], pattern, now,
+                           now + config.API_config_expiry * 86400)
+    return re.compile(pattern, re.VERBOSE)
+
+
 def _get_regexes(keys, site):
-    """Fetch compiled regexes."""
+    """
+    Fetch compiled regexes.
+
+    Site specific regexes are cached by the key and the representation of
+    the site, so every site object of a wiki shares them.
+    """
     if not _regex_cache:
         _create_default_regexes()
 
@@ -283,24 +361,27 @@ def _get_regexes(keys, site):
                             'site=None', 'a valid site', 3)
                         site = pywikibot.Site()
 
-                    if (exc, site) not in _regex_cache:
-                        re_text, re_var = _regex_cache[exc]
-                        _regex_cache[(exc, site)] = re.compile(
-                            re_text % re_var(site), re.VERBOSE)
+                    key = (exc, repr(site))
+                    if key in _regex_cache:
+                        _regex_cache_stats['hits'] += 1
+                    else:
+                        _regex_cache_stats['misses'] += 1
+                        _regex_cache[key] = _site_regex(exc, site)
 
-                    result.append(_regex_cache[(exc, site)])
+                    result.append(_regex_cache[key])
                 else:
+                    _regex_cache_stats['hits'] += 1
                     result.append(_regex_cache[exc])
             else:
                 # nowiki, noinclude, includeonly, timeline, math and other
                 # extensions
+                _regex_cache_stats['misses'] += 1
                 _regex_cache[exc] = re.compile(
                     r'(?is)<{0}>.*?</{0}>'.format(exc))
                 result.append(_regex_cache[exc])
             # handle alias
             if exc == 'source':
-                dontTouchRegexes.append(re.compile(
-                    r'(?is)<syntaxhighlight .*?</syntaxhighlight>'))
+                dontTouchRegexes.append(_regex_cache['source', 'alias'])
         else:
             # assume it's a regular expression
             dontTouchRegexes.append(exc)
@@ -308,47 +389,53 @@ def _get_regexes(keys, site):
     return result
 
 
-def replaceExcept(text, old, new, exceptions, caseInsensitive=False,
-                  allowoverlap=False, marker='', site=None, count=0):
+def _expand_replacement(new, match):
     """
-    Return text with 'old' replaced by 'new', ignoring specified types of text.
+    Return the replacement string for a match of replaceExcept.
 
-    Skips occurrences of 'old' within exceptions; e.g., within nowiki tags or
-    HTML comments. If caseInsensitive is true, then use case insensitive
-    regex matching. If allowoverlap is true, overlapping occurrences are all
-    replaced (watch out when using this, it might lead to infinite loops!).
+    We cannot just insert the new string, as it may contain regex
+    group references such as \\2 or \\g<name>.
+    On the other hand, this approach does not work because it
+    can't handle lookahead or lookbehind (see bug T123185):
 
-    @type text: unicode
-    @param old: a compiled or uncompiled regular expression
-    @param new: a unicode string (which can contain regular
-        expression references), or a function which takes
-        a match object as parameter. See parameter repl of
-        re.sub().
-    @param exceptions: a list of strings which signal what to leave out,
-        e.g. ['math', 'table', 'template']
-    @type caseInsensitive: bool
-    @param marker: a string that will be added to the last replacement;
-        if nothing is changed, it is added at the end
-    @param count: how many replacements to do at most. See parameter
-        count of re.sub().
-    @type count: int
+     replacement = old.sub(new, text[match.start():match.end()])
+     text = text[:match.start()] + replacement + text[match.end():]
+
+    So we have to process the group references manually.
     """
-    # if we got a string, compile it as a regular expression
-    if isinstance(old, basestring):
-        if caseInsensitive:
-            old = re.compile(old, re.IGNORECASE | re.UNICODE)
-        else:
-            old = re.compile(old)
+    replacement = ''
 
-    # early termination if not relevant
-    if not old.search(text):
-        return text + marker
+    group_regex = re.compile(r'\\(\d+)|\\g<(.+?)>')
+    last = 0
+    for group_match in group_regex.finditer(new):
+        group_id = group_match.group(1) or group_match.group(2)
+        try:
+            group_id = int(group_id)
+        except ValueError:
+            pass
+        try:
+            replacement += new[last:group_match.start()]
+            replacement += match.group(group_id) or ''
+        except IndexError:
+            raise IndexError(
+                'Invalid group reference: {0}\nGroups found: {1}'
+                ''.format(group_id, match.groups()))
+        last = group_match.end()
+    replacement += new[last:]
+    return replacement
+
+
+def _replace_in_text(text, old, new, dontTouchRegexes, allowoverlap, count,
+                     index, replaced, markerpos):
+    """
+    Replace matches of old in text, searching the changed text each time.
 
-    dontTouchRegexes = _get_regexes(exceptions, site)
+    This is the reference algorithm of replaceExcept. It starts at index
+    with replaced replacements already done.
 
-    index = 0
-    replaced = 0
-    markerpos = len(text)
+    @return: the new text and the position of the marker
+    @rtype: tuple
+    """
     while not count or replaced < count:
         if index > len(text):
             break
@@ -378,40 +465,7 @@ def replaceExcept(text, old, new, exceptions, caseInsensitive=False,
                 # as a parameter.
                 replacement = new(match)
             else:
-                # it is not a function, but a string.
-
-                # it is a little hack to make \n work. It would be better
-                # to fix it previously, but better than nothing.
-                new = new.replace('\\n', '\n')
-
-                # We cannot just insert the new string, as it may contain regex
-                # group references such as \2 or \g<name>.
-                # On the other hand, this approach does not work because it
-                # can't handle lookahead or lookbehind (see bug T123185):
-                #
-                #  replacement = old.sub(new, text[match.start():match.end()])
-                #  text = text[:match.start()] + replacement + text[match.end():]
-
-                # So we have to process the group references manually.
-                replacement = ''
-
-                group_regex = re.compile(r'\\(\d+)|\\g<(.+?)>')
-                last = 0
-                for group_match in group_regex.finditer(new):
-                    group_id = group_match.group(1) or group_match.group(2)
-                    try:
-                        group_id = int(group_id)
-                    except ValueError:
-                        pass
-                    try:
-                        replacement += new[last:group_match.start()]
-                        replacement += match.group(group_id) or ''
-                    except IndexError:
-                        raise IndexError(
-                            'Invalid group reference: {0}\nGroups found: {1}'
-                            ''.format(group_id, match.groups()))
-                    last = group_match.end()
-                replacement += new[last:]
+                replacement = _expand_replacement(new, match)
 
             text = text[:match.start()] + replacement + text[match.end():]
 
@@ -425,8 +479,334 @@ def replaceExcept(text, old, new, exceptions, caseInsensitive=False,
                 index += 1
             markerpos = match.start() + len(replacement)
             replaced += 1
-    text = text[:markerpos] + marker + text[markerpos:]
-    return text
+    return text, markerpos
+
+
+def _looks_behind(regex):
+    """Return whether a regex may look further back than one character."""
+    return '(?<' in getattr(regex, 'pattern', '')
+
+
+class _ExceptionIndex(object):
+
+    """
+    Leftmost matches of regexes in a text which does not change.
+
+    Every search is kept with the position it started from. The leftmost
+    match from a position is also the leftmost match from every position
+    up to its start, so the text between two exceptions is scanned only
+    once for every regex, however many replacements look at it.
+    """
+
+    def __init__(self, text):
+        """Constructor."""
+        self.text = text
+        self._searches = {}
+
+    def search(self, regex, index):
+        """Return regex.search(text, index)."""
+        starts, matches = self._searches.setdefault(regex, ([], []))
+        i = bisect.bisect_right(starts, index) - 1
+        if i >= 0 and (matches[i] is None or index <= matches[i].start()):
+            return matches[i]
+        match = regex.search(self.text, index)
+        starts.insert(i + 1, index)
+        matches.insert(i + 1, match)
+        return match
+
+    def next(self, regexes, index):
+        """Return the match of regexes which starts first after index."""
+        nextMatch = None
+        for regex in regexes:
+            match = self.search(regex, index)
+            if match and (nextMatch is None or
+                          match.start() < nextMatch.start()):
+                nextMatch = match
+        return nextMatch
+
+
+class ExceptReplacer(object):
+
+    """
+    Apply several replacements to a text, ignoring specified types of text.
+
+    Each call of L{replace} gives the same result as L{replaceExcept} on
+    the current text, but the exception matches found in the text are kept
+    until the text changes. Rules which do not change the text, which are
+    most rules of a fix on most pages, therefore share one scan of the
+    exceptions.
+    """
+
+    def __init__(self, text, site=None):
+        """
+        Constructor.
+
+        @param text: the text to change
+        @type text: unicode
+        @param site: the site of the text, used by site dependent exceptions
+        @type site: BaseSite
+        """
+        self.text = text
+        self.site = site
+        self._index = None
+
+    def replace(self, old, new, exceptions, caseInsensitive=False,
+                allowoverlap=False, count=0):
+        """
+        Replace 'old' by 'new' in the text, ignoring specified exceptions.
+
+        See L{replaceExcept} for the parameters.
+
+        @return: whether the text was changed
+        @rtype: bool
+        """
+        text = self._replace(old, new, exceptions, caseInsensitive,
+                             allowoverlap, count)[0]
+        if text == self.text:
+            return False
+        self.text = text
+        self._index = None
+        return True
+
+    def _replace(self, old, new, exceptions, caseInsensitive, allowoverlap,
+                 count):
+        """Return the replaced text and the position of the marker."""
+        text = self.text
+        # if we got a string, compile it as a regular expression
+        if isinstance(old, basestring):
+            if caseInsensitive:
+                old = re.compile(old, re.IGNORECASE | re.UNICODE)
+            else:
+                old = re.compile(old)
+
+        # early termination if not relevant
+        if not old.search(text):
+            return text, len(text)
+
+        dontTouchRegexes = _get_regexes(exceptions, self.site)
+        if not callable(new):
+            # it is a little hack to make \n work. It would be better
+            # to fix it previously, but better than nothing.
+            new = new.replace('\\n', '\n')
+
+        # The text is searched from the same positions as the changed text
+        # of the reference algorithm. Matches from a position can only
+        # differ if the regexes look at the text before it; \b, \B and ^
+        # look at a single character, which is compared below.
+        if allowoverlap or _looks_behind(old) or any(
+                _looks_behind(regex) for regex in dontTouchRegexes):
+            return _replace_in_text(text, old, new, dontTouchRegexes,
+                                    allowoverlap, count, 0, 0, len(text))
+
+        if self._index is None:
+            self._index = _ExceptionIndex(text)
+        parts = []
+        last = ''
+        done = 0
+        index = 0
+        replaced = 0
+        while not count or replaced < count:
+            if index > len(text):
+                break
+            match = old.search(text, index)
+            if not match:
+                break
+            nextExceptionMatch = self._index.next(dontTouchRegexes, index)
+            if nextExceptionMatch is not None \
+                    and nextExceptionMatch.start() <= match.start():
+                index = nextExceptionMatch.end()
+                continue
+
+            if callable(new):
+                replacement = new(match)
+            else:
+                replacement = _expand_replacement(new, match)
+            before = text[done:match.start()]
+            parts += [before, replacement]
+            last = replacement[-1:] or before[-1:] or last
+            done = index = match.end()
+            replaced += 1
+            if not match.group():
+                index += 1
+            elif last != text[done - 1]:
+                # the character before index has changed
+                head = ''.join(parts)
+                return _replace_in_text(
+                    head + text[done:], old, new, dontTouchRegexes, False,
+                    count, len(head), replaced, len(head))
+
+        if not replaced:
+            return text, len(text)
+        head = ''.join(parts)
+        return head + text[done:], len(head)
+
+
+def replaceExcept(text, old, new, exceptions, caseInsensitive=False,
+                  allowoverlap=False, marker='', site=None, count=0):
+    """
+    Return text with 'old' replaced by 'new', ignoring specified types of text.
+
+    Skips occurrences of 'old' within exceptions; e.g., within nowiki tags or
+    HTML comments. If caseInsensitive is true, then use case insensitive
+    regex matching. If allowoverlap is true, overlapping occurrences are all
+    replaced (watch out when using this, it might lead to infinite loops!).
+
+    Use L{ExceptReplacer} to apply several replacements to the same text.
+
+    @type text: unicode
+    @param old: a compiled or uncompiled regular expression
+    @param new: a unicode string (which can contain regular
+        expression references), or a function which takes
+        a match object as parameter. See parameter repl of
+        re.sub(). The match object may be a match on the text
+        before earlier replacements.
+    @param exceptions: a list of strings which signal what to leave out,
+        e.g. ['math', 'table', 'template']
+    @type caseInsensitive: bool
+    @param marker: a string that will be added to the last replacement;
+        if nothing is changed, it is added at the end
+    @param count: how many replacements to do at most. See parameter
+        count of re.sub().
+    @type count: int
+    """
+    text, markerpos = ExceptReplacer(text, site)._replace(
+        old, new, exceptions, caseInsensitive, allowoverlap, count)
+    return text[:markerpos] + marker + text[markerpos:]
+
+
+# regexes of the parts removed by removeDisabledParts
+_DISABLED_PARTS = {
+    'comments':        r'<!--.*?-->',
+    'includeonly':     r'<includeonly>.*?</includeonly>',
+    'nowiki':          r'<nowiki>.*?</nowiki>',
+    'pre':             r'<pre>.*?</pre>',
+    'source':          r'<source .*?</source>',
+    'syntaxhighlight': r'<syntaxhighlight .*?</syntaxhighlight>',
+}
+
+# compiled regexes of removeDisabledParts by the removed tags
+_disabled_parts_cache = {}
+
+
+def _disabled_parts_tags(tags, include):
+    """Return the tags of removeDisabledParts which are removed."""
+    if '*' in tags:
+        tags = list(_DISABLED_PARTS.keys())
+    # add alias
+    tags = set(tags) - set(include)
+    if 'source' in tags:
+        tags.add('syntaxhighlight')
+    return frozenset(tags)
+
+
+def _disabled_parts_regex(tags):
+    """Return the regex matching the disabled parts of tags."""
+    if tags not in _disabled_parts_cache:
+        _disabled_parts_cache[tags] = re.compile(
+            '|'.join([_DISABLED_PARTS[tag] for tag in tags]),
+            re.IGNORECASE | re.DOTALL)
+    return _disabled_parts_cache[tags]
+
+
+class ParsedWikitext(object):
+
+    """
+    Wikitext with memoized results of scanning it.
+
+    L{removeDisabledParts}, L{getCategoryLinks}, L{getLanguageLinks},
+    L{extract_templates_and_params} and L{replace_links} accept an instance
+    instead of the text. The positions of the disabled parts such as
+    comments, nowiki and pre tags, the text without them, the matches of the
+    regexes for categories and inter-language links and the templates are
+    computed when they are first needed and then shared by these functions.
+
+    An instance belongs to one text; create a new instance for a changed
+    text.
+    """
+
+    def __init__(self, text):
+        """
+        Constructor.
+
+        @param text: the wikitext
+        @type text: unicode
+        """
+        self.text = text
+        self._cache = {}
+
+    def __repr__(self):
+        """Return internal representation."""
+        return '{0}({1!r})'.format(self.__class__.__name__, self.text)
+
+    def _memoize(self, key, function, *args):
+        """Return function(*args), computing it once for each key."""
+        if key not in self._cache:
+            self._cache[key] = function(*args)
+        return self._cache[key]
+
+    def disabled_spans(self, tags=['*'], include=[]):
+        """
+        Return the positions of the parts where wiki markup is disabled.
+
+        See L{removeDisabledParts} for the parameters.
+
+        @return: the start and end of the parts, in order
+        @rtype: list of tuple
+        """
+        tags = _disabled_parts_tags(tags, include)
+        if not tags:
+            return []
+        return self._memoize(
+            ('disabled', tags),
+            lambda: [match.span() for match in
+                     _disabled_parts_regex(tags).finditer(self.text)])
+
+    def without_disabled_parts(self, tags=['*'], include=[]):
+        """
+        Return the text without the parts where wiki markup is disabled.
+
+        See L{removeDisabledParts} for the parameters.
+
+        @rtype: unicode
+        """
+        spans = self.disabled_spans(tags, include)
+        if not spans:
+            return self.text
+
+        def remove():
+            parts = []
+            end = 0
+            for start, next_end in spans:
+                parts.append(self.text[end:start])
+                end = next_end
+            parts.append(self.text[end:])
+            return ''.join(parts)
+
+        return self._memoize(
+            ('without', _disabled_parts_tags(tags, include)), remove)
+
+    def matches(self, regex, tags=['*'], include=[]):
+        """
+        Return the matches of a regex in the text without disabled parts.
+
+        @param regex: the regex
+        @type regex: compiled regex
+        @return: the matches, whose positions are in the text returned by
+            L{without_disabled_parts}
+        @rtype: list
+        """
+        text = self.without_disabled_parts(tags, include)
+        return self._memoize(
+            ('matches', regex.pattern, regex.flags,
+             _disabled_parts_tags(tags, include)),
+            lambda: list(regex.finditer(text)))
+
+
+def _parsed(text):
+    """Return a L{ParsedWikitext} of text unless it is one."""
+    if isinstance(text, ParsedWikitext):
+        return text
+    return ParsedWikitext(text)
 
 
 def removeDisabledParts(text, tags=['*'], include=[]):
@@ -444,23 +824,11 @@ def removeDisabledParts(text, tags=['*'], include=[]):
     Or, in alternative, default parts that shall not be removed can be
     specified in the 'include' param.
 
+    @type text: unicode or L{ParsedWikitext}
     """
-    regexes = {
-        'comments':        r'<!--.*?-->',
-        'includeonly':     r'<includeonly>.*?</includeonly>',
-        'nowiki':          r'<nowiki>.*?</nowiki>',
-        'pre':             r'<pre>.*?</pre>',
-        'source':          r'<source .*?</source>',
-        'syntaxhighlight': r'<syntaxhighlight .*?</syntaxhighlight>',
-    }
-    if '*' in tags:
-        tags = list(regexes.keys())
-    # add alias
-    tags = set(tags) - set(include)
-    if 'source' in tags:
-        tags.add('syntaxhighlight')
-    toRemoveR = re.compile('|'.join([regexes[tag] for tag in tags]),
-                           re.IGNORECASE | re.DOTALL)
+    if isinstance(text, ParsedWikitext):
+        return text.without_disabled_parts(tags, include)
+    toRemoveR = _disabled_parts_regex(_disabled_parts_tags(tags, include))
     return toRemoveR.sub('', text)
 
 
@@ -586,7 +954,7 @@ def replace_links(text, replace, site=None):
     remaining.
 
     @param text: the text in which to replace links
-    @type text: basestring
+    @type text: basestring or L{ParsedWikitext}
     @param replace: either a callable which reacts like described above.
         The callable must accept four parameters link, text, groups, rng and
         allows for user interaction. The groups are a dict containing 'title',
@@ -655,6 +1023,8 @@ def replace_links(text, replace, site=None):
         raise ValueError('If "replace" is not a tuple or list of pages, '
                          'the "site" argument must be provided.')
 
+    if isinstance(text, ParsedWikitext):
+        text = text.text
     linktrail = site.linktrail()
     link_pattern = re.compile(
         r'\[\[(?P<title>.*?)(#(?P<section>.*?))?(\|(?P<label>.*?))?\]\]'
@@ -824,6 +1194,7 @@ def getLanguageLinks(text, insite=None, template_subpage=False):
     Do not call this routine directly, use Page.interwiki() method
     instead.
 
+    @type text: unicode or L{ParsedWikitext}
     """
     if insite is None:
         insite = pywikibot.Site()
@@ -838,7 +1209,6 @@ def getLanguageLinks(text, insite=None, template_subpage=False):
     tags = ['comments', 'nowiki', 'pre', 'source']
     if not template_subpage:
         tags += ['includeonly']
-    text = removeDisabledParts(text, tags)
 
     # This regular expression will find every link that is possibly an
     # interwiki link.
@@ -849,7 +1219,8 @@ def getLanguageLinks(text, insite=None, template_subpage=False):
     # TODO: There is no semantic difference between hyphens and
     #       underscores -> fold them.
     interwikiR = re.compile(r'\[\[([a-zA-Z\-]+)\s?:([^\[\]\n]*)\]\]')
-    for lang, pagetitle in interwikiR.findall(text):
+    for match in _parsed(text).matches(interwikiR, tags):
+        lang, pagetitle = match.groups()
         lang = lang.lower()
         # Check if it really is in fact an interwiki link to a known
         # language, or if it's e.g. a category tag or an internal link
@@ -1080,6 +1451,7 @@ def interwikiSort(sites, insite=None):
 def getCategoryLinks(text, site=None, include=[], expand_text=False):
     """Return a list of category links found in text.
 
+    @type text: unicode or L{ParsedWikitext}
     @param include: list of tags which should not be removed by
         removeDisabledParts() and where CategoryLinks can be searched.
     @type include: list
@@ -1092,11 +1464,10 @@ def getCategoryLinks(text, site=None, include=[], expand_text=False):
         site = pywikibot.Site()
     # Ignore category links within nowiki tags, pre tags, includeonly tags,
     # and HTML comments
-    text = removeDisabledParts(text, include=include)
     catNamespace = '|'.join(site.namespaces.CATEGORY)
     R = re.compile(r'\[\[\s*(?P<namespace>%s)\s*:\s*(?P<rest>.+?)\]\]'
                    % catNamespace, re.I)
-    for match in R.finditer(text):
+    for match in _parsed(text).matches(R, include=include):
         if expand_text and '{{' in match.group('rest'):
             rest = site.expand_text(match.group('rest'))
         else:
@@ -1382,8 +1753,10 @@ def extract_templates_and_params(text, remove_disabled_parts=None, strip=None):
     e.g. {{a| foo | 2 <!-- --> = bar | baz }} is {{a|1=foo|2=baz}}
     To replicate that behaviour, enable both remove_disabled_parts and strip.
 
-    @param text: The wikitext from which templates are extracted
-    @type text: unicode or string
+    @param text: The wikitext from which templates are extracted. The
+        templates of a L{ParsedWikitext} are extracted once for each set of
+        options.
+    @type text: unicode or string or L{ParsedWikitext}
     @param remove_disabled_parts: Remove disabled wikitext such as comments
         and pre. If None (default), this is enabled when mwparserfromhell
         is not available or is disabled in the config, and disabled if
@@ -1406,6 +1779,15 @@ def extract_templates_and_params(text, remove_disabled_parts=None, strip=None):
     if strip is None:
         strip = not use_mwparserfromhell
 
+    if isinstance(text, ParsedWikitext):
+        templates = text._memoize(
+            ('templates', remove_disabled_parts, strip,
+             use_mwparserfromhell),
+            extract_templates_and_params,
+            removeDisabledParts(text) if remove_disabled_parts else text.text,
+            False, strip)
+        return [(name, OrderedDict(params)) for name, params in templates]
+
     if remove_disabled_parts:
         text = removeDisabledParts(text)
 
@@ -1466,14 +1848,16 @@ def extract_templates_and_params_regex(text, remove_disabled_parts=True,
     is not used.
 
     @param text: The wikitext from which templates are extracted
-    @type text: unicode or string
+    @type text: unicode or string or L{ParsedWikitext}
     @return: list of template name and params
     @rtype: list of tuple
     """
     # remove commented-out stuff etc.
     if remove_disabled_parts:
         thistxt = removeDisabledParts(text)
-    else:
+    if isinstance(text, ParsedWikitext):
+        text = text.text
+    if not remove_disabled_parts:
         thistxt = text
 
     # marker for inside templates or parameters
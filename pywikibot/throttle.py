@@ -10,7 +10,10 @@ from __future__ import absolute_import, unicode_literals
 __version__ = '$Id$'
 #
 
+import bisect
+import collections
 import math
+import sqlite3
 import threading
 import time
 
@@ -27,6 +30,129 @@ _logger = "wiki.throttle"
 pid = False
 
 
+class RateController(object):
+
+    """Adapt the rate of access to the load of the wiki server.
+
+    The controller multiplies the throttle delays by 'factor' and never lets
+    them drop below 'backoff' seconds. Fast responses shorten the delays and
+    allow more concurrent requests, while slow responses, maxlag errors and
+    HTTP 429 responses lengthen them. After a Retry-After header no request
+    is made until the given time has passed.
+
+    A controller is plugged into a L{Throttle}, which passes the server
+    responses on to it; see L{metrics} for the effective request rate.
+    """
+
+    min_factor = 0.25
+    max_factor = 8.0
+
+    # length in seconds of the window used to calculate the request rate
+    window = 60
+
+    def __init__(self, max_concurrency=None, slow_response=None):
+        """
+        Constructor.
+
+        @param max_concurrency: maximum number of concurrent requests;
+            defaults to config.http_threads
+        @type max_concurrency: int
+        @param slow_response: responses taking longer than this many seconds
+            slow down the requests; defaults to config.adaptive_slow_response
+        @type slow_response: float
+        """
+        self.lock = threading.Lock()
+        self.max_concurrency = max_concurrency or config.http_threads
+        self.slow_response = slow_response or config.adaptive_slow_response
+        self.factor = 1.0
+        self.backoff = 0.0
+        self.concurrency = 1
+        self.blocked_until = 0.0
+        self.response_time = None
+        self.counts = collections.Counter()
+        self._requests = collections.deque()
+
+    def delay(self, delay):
+        """Return the delay in seconds adjusted to the server load."""
+        return max(delay * self.factor, self.backoff)
+
+    def blocked_for(self):
+        """Return the seconds to wait because of a Retry-After header."""
+        return max(self.blocked_until - time.time(), 0.0)
+
+    def _slow_down(self, factor, backoff=False):
+        """Lengthen the delays and halve the concurrent requests."""
+        self.factor = min(self.factor * factor, self.max_factor)
+        if backoff:
+            self.backoff = min(max(1.0, self.backoff * 2),
+                               config.maxthrottle)
+        self.concurrency = max(1, self.concurrency // 2)
+
+    def request(self):
+        """Count a request made to the server."""
+        now = time.time()
+        with self.lock:
+            self.counts['requests'] += 1
+            self._requests.append(now)
+            while self._requests[0] < now - self.window:
+                self._requests.popleft()
+
+    def response(self, seconds):
+        """Adapt to a successful response which took 'seconds'."""
+        with self.lock:
+            self.counts['responses'] += 1
+            if self.response_time is None:
+                self.response_time = seconds
+            else:
+                self.response_time = 0.8 * self.response_time + 0.2 * seconds
+            if seconds > self.slow_response:
+                self.counts['slow'] += 1
+                self._slow_down(1.5)
+            else:
+                self.factor = max(self.factor * 0.9, self.min_factor)
+                self.backoff = self.backoff / 2 if self.backoff > 0.1 else 0.0
+                self.concurrency = min(self.concurrency + 1,
+                                       self.max_concurrency)
+
+    def lag(self, lagtime):
+        """Back off because the server reported 'lagtime' seconds of lag."""
+        with self.lock:
+            self.counts['lag'] += 1
+            self._slow_down(2, backoff=True)
+
+    def retry_after(self, seconds=None):
+        """Back off because the server refused a request.
+
+        @param seconds: seconds to wait as given by the Retry-After header
+        @type seconds: float or None
+        """
+        with self.lock:
+            self.counts['retry_after'] += 1
+            self._slow_down(2, backoff=True)
+            if seconds:
+                self.blocked_until = max(self.blocked_until,
+                                         time.time() + seconds)
+
+    def metrics(self):
+        """Return the state of the controller and the request counts.
+
+        'rate' is the number of requests per second during the last
+        'window' seconds.
+
+        @rtype: dict
+        """
+        now = time.time()
+        with self.lock:
+            recent = sum(1 for t in self._requests if t >= now - self.window)
+            metrics = dict(self.counts)
+            metrics.update(factor=self.factor, backoff=self.backoff,
+                           concurrency=self.concurrency,
+                           response_time=self.response_time,
+                           blocked_for=max(self.blocked_until - now, 0.0),
+                           rate=float(recent) / self.window)
+        return metrics
+
+
 class Throttle(object):
 
     """Control rate of access to wiki server.
@@ -37,12 +163,16 @@ class Throttle(object):
     Each Site initiates one Throttle object (site.throttle) to control the
     rate of access.
 
+    If a L{RateController} is given, the delays are adapted to the server
+    load reported to L{lag}, L{retry_after} and L{record_response}.
+
     """
 
     def __init__(self, site, mindelay=None, maxdelay=None, writedelay=None,
-                 multiplydelay=True):
+                 multiplydelay=True, controller=None):
         """Constructor."""
         self.lock = threading.RLock()
+        self.controller = controller
         self.mysite = str(site)
         self.ctrlfilename = config.datafilepath('throttle.ctrl')
         self.mindelay = mindelay
@@ -166,6 +296,12 @@ class Throttle(object):
             thisdelay = self.writedelay
         else:
             thisdelay = self.delay
+        if self.controller:
+            # the adjusted delay must stay within the configured bounds;
+            # writes are never made faster than writedelay
+            lowest = self.writedelay if write else self.mindelay
+            thisdelay = min(max(lowest, self.controller.delay(thisdelay)),
+                            self.maxdelay)
         if self.multiplydelay:  # We're checking for multiple processes
             if time.time() > self.checktime + self.checkdelay:
                 self.checkMultiplicity()
@@ -188,9 +324,11 @@ class Throttle(object):
             ago = now - self.last_read
         if ago < thisdelay:
             delta = thisdelay - ago
-            return delta
         else:
-            return 0.0
+            delta = 0.0
+        if self.controller:
+            delta = max(delta, self.controller.blocked_for())
+        return delta
 
     def drop(self):
         """Remove me from the list of running bot processes."""
@@ -272,6 +410,8 @@ class Throttle(object):
                 self.last_write = time.time()
             else:
                 self.last_read = time.time()
+        if self.controller:
+            self.controller.request()
 
     def lag(self, lagtime):
         """Seize the throttle lock due to server lag.
@@ -279,6 +419,8 @@ class Throttle(object):
         This will prevent any thread from accessing this site.
 
         """
+        if self.controller:
+            self.controller.lag(lagtime)
         started = time.time()
         with self.lock:
             # start at 1/2 the current server lag time
@@ -288,3 +430,203 @@ class Throttle(object):
             wait = delay - (time.time() - started)
 
             self.wait(wait)
+
+    def retry_after(self, seconds=None):
+        """Slow down because the server refused a request with HTTP 429.
+
+        The caller waits before retrying; with a controller, other
+        requests also wait until 'seconds' have passed.
+
+        @param seconds: seconds to wait as given by the Retry-After header
+        @type seconds: float or None
+        """
+        if self.controller:
+            self.controller.retry_after(seconds)
+
+    def record_response(self, seconds):
+        """Record that the server answered a request in 'seconds'."""
+        if self.controller:
+            self.controller.response(seconds)
+
+
+class TokenBucketThrottle(Throttle):
+
+    """Control rate of access to wiki server with token buckets.
+
+    Reads and writes each use a bucket refilled with one token every
+    'delay' or 'writedelay' seconds and holding at most config.read_burst
+    or config.write_burst tokens. A request takes one token and waits only
+    if the bucket is empty, so bursts up to the bucket size are not delayed.
+
+    The buckets are stored in an SQLite database shared by all processes on
+    this host, so concurrent bots using the same site share one rate
+    instead of each scaling its delays by the number of running processes.
+
+    The time spent waiting is counted in a histogram, see L{wait_times}.
+    """
+
+    # upper bounds in seconds of the wait time histogram bins
+    histogram_bins = (0, 0.1, 0.5, 1, 2, 5, 10, 30, 60)
+
+    def __init__(self, site, mindelay=None, maxdelay=None, writedelay=None,
+                 read_burst=None, write_burst=None, dbfilename=None,
+                 controller=None):
+        """Constructor."""
+        super(TokenBucketThrottle, self).__init__(
+            site, mindelay, maxdelay, writedelay, multiplydelay=False,
+            controller=controller)
+        self.process_multiplicity = 1
+        self.read_burst = max(read_burst or config.read_burst, 1)
+        self.write_burst = max(write_burst or config.write_burst, 1)
+        self.dbfilename = dbfilename or config.datafilepath(
+            'throttle.sqlite3')
+        self._histogram = {False: [0] * (len(self.histogram_bins) + 1),
+                           True: [0] * (len(self.histogram_bins) + 1)}
+        self._db = None
+
+    @property
+    def db(self):
+        """Return the connection to the shared bucket database."""
+        if self._db is None:
+            self._db = sqlite3.connect(self.dbfilename, timeout=30,
+                                       isolation_level=None,
+                                       check_same_thread=False)
+            self._db.execute('CREATE TABLE IF NOT EXISTS buckets ('
+                             'site TEXT, write INTEGER, tokens REAL, '
+                             'updated REAL, blocked_until REAL, '
+                             'PRIMARY KEY (site, write))')
+        return self._db
+
+    def _bucket(self, write):
+        """Return the rate in tokens per second and the size of a bucket."""
+        delay = self.getDelay(write)
+        burst = self.write_burst if write else self.read_burst
+        return (1.0 / delay if delay > 0 else None), burst
+
+    def _take(self, write, tokens=1):
+        """Take tokens from the shared bucket and return the time to wait.
+
+        Tokens are taken even if the bucket does not hold enough of them; the
+        bucket then goes below zero and later requests wait accordingly.
+        """
+        rate, burst = self._bucket(write)
+        db = self.db
+        with self.lock:
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                now = time.time()
+                row = db.execute('SELECT tokens, updated, blocked_until '
+                                 'FROM buckets WHERE site = ? AND write = ?',
+                                 (self.mysite, write)).fetchone()
+                if row is None:
+                    available, blocked_until = float(burst), 0.0
+                else:
+                    available, updated, blocked_until = row
+                    if rate:
+                        available += (now - updated) * rate
+                    available = min(available, burst)
+                wait = max(blocked_until - now, 0.0)
+                if rate:
+                    available -= tokens
+                    if available < 0:
+                        wait = max(wait, -available / rate)
+                db.execute('INSERT OR REPLACE INTO buckets '
+                           'VALUES (?, ?, ?, ?, ?)',
+                           (self.mysite, write, available, now,
+                            blocked_until))
+            finally:
+                db.execute('COMMIT')
+        return wait
+
+    def waittime(self, write=False):
+        """Return waiting time in seconds if a query would be made right now."""
+        rate, burst = self._bucket(write)
+        with self.lock:
+            row = self.db.execute('SELECT tokens, updated, blocked_until '
+                                  'FROM buckets WHERE site = ? AND write = ?',
+                                  (self.mysite, write)).fetchone()
+        if row is None:
+            return 0.0
+        available, updated, blocked_until = row
+        now = time.time()
+        wait = max(blocked_until - now, 0.0)
+        if rate:
+            available = min(available + (now - updated) * rate, burst)
+            if available < 1:
+                wait = max(wait, (1 - available) / rate)
+        if self.controller:
+            wait = max(wait, self.controller.blocked_for())
+        return wait
+
+    def checkMultiplicity(self):
+        """Do nothing; processes share the buckets instead."""
+        pass
+
+    def drop(self):
+        """Do nothing; there is no list of running processes to leave."""
+        pass
+
+    def __call__(self, requestsize=1, write=False):
+        """Block the calling thread until a token is available.
+
+        Parameter requestsize is ignored; each request takes one token.
+        """
+        wait = self._take(write)
+        if self.controller:
+            wait = max(wait, self.controller.blocked_for())
+        self._histogram[write][
+            bisect.bisect_left(self.histogram_bins, wait)] += 1
+        self.wait(wait)
+        with self.lock:
+            if write:
+                self.last_write = time.time()
+            else:
+                self.last_read = time.time()
+        if self.controller:
+            self.controller.request()
+
+    def _block(self, seconds):
+        """Block all processes accessing this site for 'seconds'."""
+        blocked_until = time.time() + seconds
+        with self.lock:
+            self.db.execute('BEGIN IMMEDIATE')
+            try:
+                # create the buckets not used yet so the block is kept
+                for write, burst in ((False, self.read_burst),
+                                     (True, self.write_burst)):
+                    self.db.execute(
+                        'INSERT OR IGNORE INTO buckets '
+                        'VALUES (?, ?, ?, ?, 0)',
+                        (self.mysite, write, float(burst), time.time()))
+                self.db.execute(
+                    'UPDATE buckets SET blocked_until = '
+                    'MAX(blocked_until, ?) WHERE site = ?',
+                    (blocked_until, self.mysite))
+            finally:
+                self.db.execute('COMMIT')
+        return blocked_until
+
+    def lag(self, lagtime):
+        """Block all processes accessing this site due to server lag."""
+        if self.controller:
+            self.controller.lag(lagtime)
+        # start at 1/2 the current server lag time
+        # wait at least 5 seconds but not more than 120 seconds
+        blocked_until = self._block(min(max(5, lagtime // 2), 120))
+        self.wait(blocked_until - time.time())
+
+    def retry_after(self, seconds=None):
+        """Block all processes accessing this site after HTTP 429."""
+        super(TokenBucketThrottle, self).retry_after(seconds)
+        if seconds:
+            self._block(seconds)
+
+    def wait_times(self, write=False):
+        """Return the histogram of the waits before reads or writes.
+
+        @return: list of tuples (upper bound in seconds, number of waits);
+            the upper bound of the last bin is None
+        @rtype: list
+        """
+        bounds = list(self.histogram_bins) + [None]
+        return list(zip(bounds, self._histogram[write]))
@@ -1689,6 +1689,12 @@ class ModuleDeprecationWrapper(types.ModuleType):
             elif '.' in self._deprecated[attr][0]:
                 try:
                     package_name = self._deprecated[attr][0].split('.', 1)[0]
+                    try:
+                        # the replacement may be in a submodule which the
+                        # package does not import itself
+                        __import__(self._deprecated[attr][0].rsplit('.', 1)[0])
+                    except ImportError:
+                        pass
                     module = __import__(package_name)
                     context = {package_name: module}
                     replacement = eval(self._deprecated[attr][0], context)
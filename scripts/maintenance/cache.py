@@ -5,13 +5,19 @@ This script runs commands on each entry in the API caches.
 
 Syntax:
 
-    python pwb.py cache [-password] [-delete] [-c "..."] [-o "..."] [dir ...]
+    python pwb.py cache [-password] [-delete] [-c "..."] [-o "..."]
+                        [-match:...] [-prune] [-maxsize:...] [-migrate]
+                        [dir ...]
 
 If no directory are specified, it will detect the API caches.
 
 If no command is specified, it will print the filename of all entries.
 If only -delete is specified, it will delete all entries.
 
+The entries are kept in the database cache.sqlite3 of each directory. Entries
+of older versions are kept in a file per entry; they are processed as well
+until they are moved into the database with -migrate.
+
 -delete           Delete each command filtered. If that option is set the
                   default output will be nothing.
 
@@ -21,6 +27,16 @@ If only -delete is specified, it will delete all entries.
 -o                Output command which is output when the filter evaluated to
                   True. If it returns None it won't output anything.
 
+-match:text       Only process entries whose key contains text. This is
+                  checked in the database before any entry is loaded.
+
+-prune            Delete the expired entries from the database and exit.
+
+-maxsize:MiB      Delete expired and least recently used entries until the
+                  database is smaller than MiB and exit.
+
+-migrate          Move entries from files into the database and exit.
+
 Example commands:
   Print the filename of any entry with 'wikidata' in the key:
 
@@ -69,10 +85,11 @@ import datetime
 import hashlib
 import os
 import pickle
+import time
 
 import pywikibot
 
-from pywikibot.data import api
+from pywikibot.data import api, cachestore
 
 # The follow attributes are used by eval()
 from pywikibot.page import User
@@ -80,7 +97,7 @@ from pywikibot.site import APISite, DataSite, LoginStatus
 
 __all__ = (
     'User', 'APISite', 'DataSite', 'LoginStatus',
-    'ParseError', 'CacheEntry', 'process_entries', 'main',
+    'ParseError', 'CacheEntry', 'process_entries', 'migrate_entries', 'main',
     'has_password', 'is_logout', 'empty_response', 'not_accessed',
     'incorrect_hash',
     'older_than', 'newer_than', 'older_than_one_day', 'recent',
@@ -97,10 +114,20 @@ class CacheEntry(api.CachedRequest):
 
     """A Request cache entry."""
 
-    def __init__(self, directory, filename):
-        """Constructor."""
+    def __init__(self, directory, filename, store=None):
+        """
+        Constructor.
+
+        @param directory: the cache directory
+        @type directory: str
+        @param filename: the file name of the entry or its key in the store
+        @type filename: str
+        @param store: the store of the entry; None for an entry in a file
+        @type store: L{cachestore.CacheStore}
+        """
         self.directory = directory
         self.filename = filename
+        self.store = store
 
     def __str__(self):
         """Return string equivalent of object."""
@@ -125,8 +152,15 @@ class CacheEntry(api.CachedRequest):
 
     def _load_cache(self):
         """Load the cache entry."""
-        with open(self._cachefile_path(), 'rb') as f:
-            self.key, self._data, self._cachetime = pickle.load(f)
+        if self.store is None:
+            with open(self._cachefile_path(), 'rb') as f:
+                self.key, self._data, self._cachetime = pickle.load(f)
+            return True
+        entry = self.store.get(self.filename, touch=False)
+        if entry is None:
+            raise ValueError('Entry {0} not found'.format(self.filename))
+        self.key, self._data, cachetime = entry
+        self._cachetime = datetime.datetime.fromtimestamp(cachetime)
         return True
 
     def parse_key(self):
@@ -210,16 +244,67 @@ class CacheEntry(api.CachedRequest):
 
     def _delete(self):
         """Delete the cache entry."""
-        os.remove(self._cachefile_path())
+        if self.store is None:
+            os.remove(self._cachefile_path())
+        else:
+            self.store.delete(self.filename)
+
+
+def _get_store(cache_path):
+    """Return the store of a cache directory or None if there is none."""
+    path = os.path.join(cache_path, 'cache.sqlite3')
+    if os.path.isfile(path):
+        return cachestore.get_store(path)
+    return None
+
+
+def _entry_files(cache_path):
+    """Return the paths of the entries kept in files."""
+    if not os.path.isdir(cache_path):
+        return [cache_path]
+    return [os.path.join(cache_path, filename)
+            for filename in os.listdir(cache_path)
+            if '.sqlite3' not in filename]
+
+
+def _process_entry(entry, func, output_func, action_func):
+    """Parse a loaded entry and run the commands on it."""
+    try:
+        entry.parse_key()
+    except ParseError:
+        pywikibot.error(u'Problems parsing %s with key %s'
+                        % (entry.filename, entry.key))
+        pywikibot.exception()
+        return
+
+    try:
+        entry._rebuild()
+    except Exception as e:
+        pywikibot.error(u'Problems loading %s with key %s, %r'
+                        % (entry.filename, entry.key, entry._parsed_key))
+        pywikibot.exception(e, tb=True)
+        return
+
+    if func is None or func(entry):
+        if output_func or action_func is None:
+            if output_func is None:
+                output = entry
+            else:
+                output = output_func(entry)
+            if output is not None:
+                pywikibot.output(output)
+        if action_func:
+            action_func(entry)
 
 
 def process_entries(cache_path, func, use_accesstime=None, output_func=None,
-                    action_func=None):
+                    action_func=None, match=None):
     """
     Check the contents of the cache.
 
-    This program tries to use file access times to determine
-    whether cache files are being used.
+    Entries in the database are selected by their key without loading
+    them. For entries in files, this program tries to use file access
+    times to determine whether cache files are being used.
     However file access times are not always usable.
     On many modern filesystems, they have been disabled.
     On unix, check the filesystem mount options. You may
@@ -230,6 +315,8 @@ def process_entries(cache_path, func, use_accesstime=None, output_func=None,
          - None  = detect
          - False = dont use
          - True  = always use
+    @param match: only process entries whose key contains this
+    @type match: str
     """
     if not cache_path:
         cache_path = os.path.join(pywikibot.config2.base_dir, 'apicache')
@@ -238,13 +325,20 @@ def process_entries(cache_path, func, use_accesstime=None, output_func=None,
         pywikibot.error('%s: no such file or directory' % cache_path)
         return
 
-    if os.path.isdir(cache_path):
-        filenames = [os.path.join(cache_path, filename)
-                     for filename in os.listdir(cache_path)]
-    else:
-        filenames = [cache_path]
-
-    for filepath in filenames:
+    store = _get_store(cache_path) if os.path.isdir(cache_path) else None
+    if store:
+        for row in store.entries(match=match):
+            entry = CacheEntry(cache_path, row['key'], store)
+            entry.hits = row['hits']
+            try:
+                entry._load_cache()
+            except ValueError as e:
+                pywikibot.error('Failed loading {0}'.format(row['key']))
+                pywikibot.exception(e, tb=True)
+                continue
+            _process_entry(entry, func, output_func, action_func)
+
+    for filepath in _entry_files(cache_path):
         filename = os.path.basename(filepath)
         cache_dir = os.path.dirname(filepath)
         if use_accesstime is not False:
@@ -268,32 +362,43 @@ def process_entries(cache_path, func, use_accesstime=None, output_func=None,
             os.utime(filepath, (stinfo.st_atime, stinfo.st_mtime))
             entry.stinfo = stinfo
 
-        try:
-            entry.parse_key()
-        except ParseError:
-            pywikibot.error(u'Problems parsing %s with key %s'
-                            % (entry.filename, entry.key))
-            pywikibot.exception()
+        if match and match not in entry.key:
             continue
 
+        _process_entry(entry, func, output_func, action_func)
+
+
+def migrate_entries(cache_path):
+    """
+    Move the entries kept in files into the database.
+
+    The entries expire after config.API_config_expiry days, the longest
+    expiry of any cached request.
+
+    @return: number of moved entries
+    @rtype: int
+    """
+    if not os.path.isdir(cache_path):
+        pywikibot.error('%s: no such directory' % cache_path)
+        return 0
+
+    store = cachestore.get_store(os.path.join(cache_path, 'cache.sqlite3'))
+    expiry = pywikibot.config2.API_config_expiry * 86400
+    count = 0
+    for filepath in _entry_files(cache_path):
+        entry = CacheEntry(cache_path, os.path.basename(filepath))
         try:
-            entry._rebuild()
+            entry._load_cache()
         except Exception as e:
-            pywikibot.error(u'Problems loading %s with key %s, %r'
-                            % (entry.filename, entry.key, entry._parsed_key))
+            pywikibot.error('Failed loading {0}'.format(filepath))
             pywikibot.exception(e, tb=True)
             continue
-
-        if func is None or func(entry):
-            if output_func or action_func is None:
-                if output_func is None:
-                    output = entry
-                else:
-                    output = output_func(entry)
-                if output is not None:
-                    pywikibot.output(output)
-            if action_func:
-                action_func(entry)
+        cachetime = time.mktime(entry._cachetime.timetuple())
+        store.put(entry.filename, entry.key, entry._data, cachetime,
+                  cachetime + expiry)
+        os.remove(filepath)
+        count += 1
+    return count
 
 
 def _parse_command(command, name):
@@ -333,6 +438,11 @@ def empty_response(entry):
 
 def not_accessed(entry):
     """Entry has never been accessed."""
+    if entry.store is not None:
+        if entry.hits == 0:
+            return entry
+        return
+
     if not hasattr(entry, 'stinfo'):
         return
 
@@ -392,6 +502,10 @@ def main():
     delete = False
     command = None
     output = None
+    match = None
+    prune = False
+    max_size = None
+    migrate = False
 
     for arg in local_args:
         if command == '':
@@ -400,6 +514,14 @@ def main():
             output = arg
         elif arg == '-delete':
             delete = True
+        elif arg.startswith('-match:'):
+            match = arg[len('-match:'):]
+        elif arg == '-prune':
+            prune = True
+        elif arg.startswith('-maxsize:'):
+            max_size = float(arg[len('-maxsize:'):]) * 2 ** 20
+        elif arg == '-migrate':
+            migrate = True
         elif arg == '-password':
             command = 'has_password(entry)'
         elif arg == '-c':
@@ -431,6 +553,26 @@ def main():
             cache_paths += [
                 os.path.join(os.path.expanduser('~/.pywikibot'), 'apicache')]
 
+    if prune or max_size is not None or migrate:
+        for cache_path in cache_paths:
+            if migrate:
+                count = migrate_entries(cache_path)
+                pywikibot.output('{0}: moved {1} entries into the database'
+                                 .format(cache_path, count))
+            store = (_get_store(cache_path)
+                     if os.path.isdir(cache_path) else None)
+            if store is None:
+                continue
+            if prune:
+                count = store.prune()
+                pywikibot.output('{0}: deleted {1} expired entries'
+                                 .format(cache_path, count))
+            if max_size is not None:
+                count = store.evict(max_size)
+                pywikibot.output('{0}: deleted {1} entries'
+                                 .format(cache_path, count))
+        return
+
     if delete:
         action_func = CacheEntry._delete
     else:
@@ -454,7 +596,7 @@ def main():
         if len(cache_paths) > 1:
             pywikibot.output(u'Processing %s' % cache_path)
         process_entries(cache_path, filter_func, output_func=output_func,
-                        action_func=action_func)
+                        action_func=action_func, match=match)
 
 
 if __name__ == '__main__':
@@ -445,15 +445,14 @@ class XmlDumpReplacePageGenerator(object):
                 if self.isTitleExcepted(entry.title) \
                         or self.isTextExcepted(entry.text):
                     continue
-                new_text = entry.text
+                replacer = textlib.ExceptReplacer(entry.text, site=self.site)
                 for replacement in self.replacements:
                     # This doesn't do an actual replacement but just
                     # checks if at least one does apply
-                    new_text = textlib.replaceExcept(
-                        new_text, replacement.old_regex, replacement.new,
-                        self.excsInside + replacement.get_inside_exceptions(),
-                        site=self.site)
-                if new_text != entry.text:
+                    replacer.replace(
+                        replacement.old_regex, replacement.new,
+                        self.excsInside + replacement.get_inside_exceptions())
+                if replacer.text != entry.text:
                     yield pywikibot.Page(self.site, entry.title)
 
         except KeyboardInterrupt:
@@ -617,7 +616,7 @@ class ReplaceRobot(Bot):
             pywikibot.warn(
                 'You must pass the target page as the "page" parameter to '
                 'apply_replacements().', DeprecationWarning, stacklevel=2)
-        new_text = original_text
+        replacer = textlib.ExceptReplacer(original_text, site=self.site)
         exceptions = _get_text_exceptions(self.exceptions)
         skipped_containers = set()
         for replacement in self.replacements:
@@ -641,15 +640,13 @@ class ReplaceRobot(Bot):
                         'title is on the exceptions list.'.format(
                             replacement.description, page.title(asLink=True)))
                 continue
-            old_text = new_text
-            new_text = textlib.replaceExcept(
-                new_text, replacement.old_regex, replacement.new,
-                exceptions + replacement.get_inside_exceptions(),
-                allowoverlap=self.allowoverlap, site=self.site)
-            if old_text != new_text:
+            if replacer.replace(
+                    replacement.old_regex, replacement.new,
+                    exceptions + replacement.get_inside_exceptions(),
+                    allowoverlap=self.allowoverlap):
                 applied.add(replacement)
 
-        return new_text
+        return replacer.text
 
     @deprecated('apply_replacements')
     def doReplacements(self, original_text, page=None):
@@ -76,11 +76,13 @@ library_test_modules = [
     'ui',
     'ui_options',
     'thread',
+    'throttle',
     'tests',
     'date',
     'timestamp',
     'mediawikiversion',
     'tools',
+    'lazy_import',
     'tools_chars',
     'tools_ip',
     'xmlreader',
@@ -91,6 +93,9 @@ library_test_modules = [
     'dry_api',
     'dry_site',
     'api',
+    'asyncapi',
+    'cachestore',
+    'jsonstream',
     'exceptions',
     'oauth',
     'family',
@@ -142,6 +147,7 @@ script_test_modules = [
     'uploadbot',
     'weblinkchecker',
     'cache',
+    'main',
 ]
 
 disabled_test_modules = [
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""Tests for the asyncio API interface."""
+#
+# (C) Pywikibot team, 2017
+#
+# Distributed under the terms of the MIT license.
+#
+from __future__ import absolute_import, unicode_literals
+
+import threading
+
+from pywikibot import config
+from pywikibot.tools import PYTHON_VERSION
+
+from tests.aspects import unittest, TestCase
+
+if PYTHON_VERSION >= (3, 5):
+    import asyncio
+
+    from pywikibot.data import asyncapi
+
+
+class FakeRequest(object):
+
+    """Request returning a fixed result from submit."""
+
+    def __init__(self, result):
+        """Constructor."""
+        self.result = result
+        self.thread = None
+
+    def submit(self):
+        """Return the result and remember the calling thread."""
+        self.thread = threading.current_thread()
+        return self.result
+
+
+class FakeSite(object):
+
+    """Site recording the batches passed to preloadpages."""
+
+    def __init__(self):
+        """Constructor."""
+        self.groups = []
+
+    def preloadpages(self, pagelist, groupsize=50):
+        """Yield the pages of the batch."""
+        self.groups.append(list(pagelist))
+        for page in pagelist:
+            yield page
+
+
+@unittest.skipIf(PYTHON_VERSION < (3, 5), 'asyncio requires Python 3.5')
+class AsyncApiTestCase(TestCase):
+
+    """Test submitting requests and preloading pages with asyncio."""
+
+    net = False
+
+    def setUp(self):
+        """Create a new event loop."""
+        super(AsyncApiTestCase, self).setUp()
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        """Close the event loop."""
+        asyncio.set_event_loop(None)
+        self.loop.close()
+        super(AsyncApiTestCase, self).tearDown()
+
+    def test_submit_async(self):
+        """Test that the request is submitted in a worker thread."""
+        request = FakeRequest({'query': {}})
+        result = self.loop.run_until_complete(
+            asyncapi.submit_async(request, self.loop))
+        self.assertEqual(result, {'query': {}})
+        self.assertIsNot(request.thread, threading.current_thread())
+
+    def test_preloadpages_order(self):
+        """Test that preloaded pages keep the order of pagelist."""
+        site = FakeSite()
+        async_site = asyncapi.AsyncSite(site, concurrency=3, loop=self.loop)
+
+        generator = async_site.preloadpages(range(25), groupsize=4)
+        pages = []
+        while True:
+            try:
+                pages.append(self.loop.run_until_complete(
+                    generator.__anext__()))
+            except StopAsyncIteration:
+                break
+        self.assertEqual(pages, list(range(25)))
+        self.assertEqual(len(site.groups), 7)
+        self.assertEqual(sorted(len(group) for group in site.groups),
+                         [1, 4, 4, 4, 4, 4, 4])
+
+    def test_concurrency(self):
+        """Test that concurrency is not limited by config.http_threads."""
+        http_threads = config.http_threads
+        self.addCleanup(setattr, config, 'http_threads', http_threads)
+        config.http_threads = 1
+        async_site = asyncapi.AsyncSite(FakeSite(), concurrency=3,
+                                        loop=self.loop)
+        # each call returns only when all three calls are running
+        barrier = threading.Barrier(3, timeout=5)
+        calls = [async_site.run(barrier.wait) for _ in range(3)]
+        self.assertEqual(
+            sorted(self.loop.run_until_complete(asyncio.gather(*calls))),
+            [0, 1, 2])
+
+
+if __name__ == '__main__':  # pragma: no cover
+    try:
+        unittest.main()
+    except SystemExit:
+        pass
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""Tests for the API cache store."""
+#
+# (C) Pywikibot team, 2017
+#
+# Distributed under the terms of the MIT license.
+#
+from __future__ import absolute_import, unicode_literals
+
+import os
+import shutil
+import tempfile
+import time
+
+from pywikibot.data.cachestore import CacheStore
+
+from tests.aspects import unittest, TestCase
+
+
+class CacheStoreTestCase(TestCase):
+
+    """Test storing, pruning and evicting cache entries."""
+
+    net = False
+
+    def setUp(self):
+        """Create a store in a temporary directory."""
+        super(CacheStoreTestCase, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.store = CacheStore(os.path.join(self.directory, 'cache.sqlite3'))
+
+    def tearDown(self):
+        """Remove the temporary directory."""
+        self.store._db.close()
+        shutil.rmtree(self.directory)
+        super(CacheStoreTestCase, self).tearDown()
+
+    def _put(self, key, description=None, expires=3600, data=None):
+        """Store an entry which expires in 'expires' seconds."""
+        now = time.time()
+        self.store.put(key, description or key, data or {'key': key},
+                       now, now + expires)
+
+    def test_get(self):
+        """Test that entries are returned as stored."""
+        data = {'query': {'pages': {'1': {'title': 'Ä', 'pageid': 1}}}}
+        self._put('a', 'Site(test)', data=data)
+        description, result, cachetime = self.store.get('a')
+        self.assertEqual(description, 'Site(test)')
+        self.assertEqual(result, data)
+        self.assertAlmostEqual(cachetime, time.time(), delta=5)
+        self.assertIsNone(self.store.get('b'))
+
+    def test_hits(self):
+        """Test that reading an entry is recorded unless not touching."""
+        self._put('a')
+        self.store.get('a', touch=False)
+        self.assertEqual(self.store.entries()[0]['hits'], 0)
+        self.store.get('a')
+        self.assertEqual(self.store.entries()[0]['hits'], 1)
+
+    def test_entries(self):
+        """Test selecting entries by their description."""
+        self._put('a', "[('list', 'watchlistraw')]")
+        self._put('b', "[('meta', 'userinfo')]")
+        self._put('c', "[('meta', 'user_info')]")
+        self.assertEqual([row['key'] for row in
+                          self.store.entries(match='watchlistraw')], ['a'])
+        self.assertEqual([row['key'] for row in
+                          self.store.entries(match='user_')], ['c'])
+        self.assertEqual(len(self.store.entries()), 3)
+
+    def test_prune(self):
+        """Test that expired entries are deleted."""
+        self._put('a', expires=-10)
+        self._put('b')
+        self.assertEqual([row['key'] for row in
+                          self.store.entries(expired=True)], ['a'])
+        self.assertEqual(self.store.prune(), 1)
+        self.assertEqual(self.store.size()[0], 1)
+        self.assertIsNone(self.store.get('a'))
+
+    def test_evict(self):
+        """Test that least recently used entries are deleted first."""
+        for key in 'abcd':
+            self._put(key)
+        self.store._db.execute('UPDATE entries SET accessed = accessed - 60')
+        self.store.get('a')
+        count, size = self.store.size()
+        self.assertEqual(count, 4)
+        self.assertEqual(self.store.evict(size // 2), 2)
+        keys = sorted(row['key'] for row in self.store.entries())
+        self.assertEqual(len(keys), 2)
+        self.assertIn('a', keys)
+
+
+if __name__ == '__main__':  # pragma: no cover
+    try:
+        unittest.main()
+    except SystemExit:
+        pass
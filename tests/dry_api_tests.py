@@ -8,15 +8,24 @@
 from __future__ import absolute_import, unicode_literals
 
 import datetime
+import json
+import os
+import shutil
+import tempfile
+import threading
 
 import pywikibot
+from pywikibot.data import cachestore
 from pywikibot.data.api import (
     CachedRequest,
     ParamInfo,
+    PropertyGenerator,
     Request,
+    RequestCoalescer,
     QueryGenerator,
 )
 from pywikibot.family import Family
+from pywikibot.tools import PY2
 
 from tests import join_images_path
 from tests.utils import DummySiteinfo
@@ -24,6 +33,11 @@ from tests.aspects import (
     unittest, TestCase, DefaultDrySiteTestCase, SiteAttributeTestCase,
 )
 
+if PY2:
+    from mock import patch
+else:
+    from unittest.mock import patch
+
 
 class DryCachedRequestTests(SiteAttributeTestCase):
 
@@ -460,6 +474,83 @@ class ParamInfoDictTests(DefaultDrySiteTestCase):
         self.assertIn('email', param['type'])
 
 
+class StoreSiteinfo(object):
+
+    """Siteinfo returning a fixed generator."""
+
+    def __init__(self, generator):
+        """Constructor."""
+        self.generator = generator
+
+    def get(self, key, expiry=False):
+        """Return the generator."""
+        assert key == 'generator'
+        return self.generator
+
+
+class StoreSite(object):
+
+    """Site with a siteinfo and a version for ParamInfo."""
+
+    def __init__(self, generator):
+        """Constructor."""
+        self.siteinfo = StoreSiteinfo(generator)
+
+    def __repr__(self):
+        """Return the representation of the site."""
+        return 'Site("test", "test")'
+
+    def version(self):
+        """Return the version."""
+        return self.siteinfo.generator.split(' ')[1]
+
+
+class ParamInfoStoreTests(TestCase):
+
+    """Test keeping paraminfo in the store."""
+
+    net = False
+
+    modules = {
+        'query+info': {'name': 'info', 'path': 'query+info', 'prefix': 'in',
+                       'parameters': [{'name': 'prop', 'multi': ''}]},
+        'parse': {'name': 'parse', 'path': 'parse', 'prefix': '',
+                  'parameters': []},
+    }
+
+    def setUp(self):
+        """Use a store in a temporary directory."""
+        super(ParamInfoStoreTests, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.store = cachestore.CacheStore(
+            os.path.join(self.directory, 'paraminfo.sqlite3'))
+        self._store = ParamInfo._store
+        ParamInfo._store = staticmethod(lambda: self.store)
+
+    def tearDown(self):
+        """Remove the temporary directory."""
+        ParamInfo._store = self._store
+        self.store._db.close()
+        shutil.rmtree(self.directory)
+        super(ParamInfoStoreTests, self).tearDown()
+
+    def test_load(self):
+        """Test that stored modules are loaded by another instance."""
+        ParamInfo(StoreSite('MediaWiki 1.30.0'))._write_stored(self.modules)
+        paraminfo = ParamInfo(StoreSite('MediaWiki 1.30.0'))
+        self.assertEqual(paraminfo._load_stored(set(['query+info', 'login'])),
+                         set(['query+info']))
+        self.assertEqual(paraminfo._paraminfo,
+                         {'query+info': self.modules['query+info']})
+
+    def test_generator_changed(self):
+        """Test that modules of another MediaWiki version are not used."""
+        ParamInfo(StoreSite('MediaWiki 1.30.0'))._write_stored(self.modules)
+        paraminfo = ParamInfo(StoreSite('MediaWiki 1.31.0'))
+        self.assertEqual(paraminfo._load_stored(set(self.modules)), set())
+        self.assertEqual(paraminfo._paraminfo, {})
+
+
 class QueryGenTests(DefaultDrySiteTestCase):
 
     """Test QueryGenerator with a real site."""
@@ -473,5 +564,164 @@ class QueryGenTests(DefaultDrySiteTestCase):
         self.assertCountEqual(qGen1.request._params.items(), qGen2.request._params.items())
 
 
+class FakeStreamedResponse(object):
+
+    """HTTP request whose body is read in chunks."""
+
+    def __init__(self, data):
+        """Constructor."""
+        self.data = json.dumps(data).encode('utf-8')
+        self.closed = False
+
+    def iter_raw(self, chunk_size=2 ** 16):
+        """Return the body in chunks of five bytes."""
+        return [self.data[i:i + 5] for i in range(0, len(self.data), 5)]
+
+    def close(self):
+        """Record that the response was released."""
+        self.closed = True
+
+
+class StreamPagesTests(DefaultDrySiteTestCase):
+
+    """Test iterating a query whose pages are decoded while reading."""
+
+    def test_stream_pages(self):
+        """Test that pages of a streamed response are yielded."""
+        response = FakeStreamedResponse({
+            'batchcomplete': '',
+            'query': {'pages': {'2': {'pageid': 2, 'title': 'B'},
+                                '1': {'pageid': 1, 'title': 'A'}}}})
+        gen = PropertyGenerator('info', site=self.site,
+                                parameters={'titles': 'A|B'})
+        gen.request.stream_pages = True
+        with patch.object(type(gen.request), 'submit', Request.submit):
+            with patch('pywikibot.comms.http.request',
+                       return_value=response) as request:
+                titles = [page['title'] for page in gen]
+        self.assertEqual(titles, ['B', 'A'])
+        self.assertTrue(request.call_args[1]['stream'])
+        self.assertTrue(response.closed)
+
+
+class FakeQuery(list):
+
+    """Query result recording set_maximum_items."""
+
+    def set_maximum_items(self, value):
+        """Record the maximum number of items."""
+        self.limit = value
+
+
+class CoalescingSite(object):
+
+    """Site returning a page item per title and recording the requests."""
+
+    def __init__(self):
+        """Constructor."""
+        self.requests = []
+
+    def sametitle(self, title1, title2):
+        """Compare titles."""
+        return title1 == title2
+
+    def _generator(self, gen_class, type_arg=None, **args):
+        """Return page items with a key for each prop module."""
+        self.requests.append(dict(args, prop=type_arg))
+        pageitems = FakeQuery()
+        for title in args['titles']:
+            pageitem = {'title': title, 'pageid': 1, 'lastrevid': 2}
+            for prop in type_arg.split('|'):
+                pageitem[prop] = prop
+            pageitems.append(pageitem)
+        return pageitems
+
+
+class RequestCoalescerTests(TestCase):
+
+    """Test merging concurrent prop queries."""
+
+    net = False
+
+    def setUp(self):
+        """Create a coalescer with a fake site."""
+        super(RequestCoalescerTests, self).setUp()
+        self.site = CoalescingSite()
+        self.coalescer = RequestCoalescer(self.site, window=0.5)
+
+    def _query(self, results, name, titles, prop, **parameters):
+        """Query in a thread and store the result."""
+        def query():
+            results[name] = self.coalescer.query(titles, prop, **parameters)
+        thread = threading.Thread(target=query)
+        thread.start()
+        return thread
+
+    def test_merge(self):
+        """Test that concurrent queries are merged into one request."""
+        results = {}
+        threads = [
+            self._query(results, 'info', ['A'], 'info', inprop='protection'),
+            self._query(results, 'cat', ['A', 'B'], 'categoryinfo'),
+            self._query(results, 'props', ['B'], 'pageprops',
+                        inprop=['preload']),
+        ]
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(self.site.requests), 1)
+        request = self.site.requests[0]
+        self.assertEqual(request['prop'], 'categoryinfo|info|pageprops')
+        self.assertCountEqual(request['titles'], ['A', 'B'])
+        self.assertCountEqual(request['inprop'], ['protection', 'preload'])
+
+        self.assertEqual(results['info'].props, set(['info']))
+        self.assertEqual(results['info'],
+                         [{'title': 'A', 'pageid': 1, 'lastrevid': 2,
+                           'info': 'info'}])
+        self.assertCountEqual([item['title'] for item in results['cat']],
+                              ['A', 'B'])
+        self.assertEqual(results['props'],
+                         [{'title': 'B', 'pageid': 1,
+                           'pageprops': 'pageprops'}])
+
+    def test_conflicting_parameters(self):
+        """Test that queries with other parameters are not merged."""
+        results = {}
+        threads = [
+            self._query(results, 'rev', ['A'], 'revisions', rvsection=0),
+            self._query(results, 'rev1', ['A'], 'revisions', rvsection=1),
+        ]
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(self.site.requests), 2)
+        self.assertEqual(self.coalescer.calls, 2)
+
+    def test_one_sided_parameters(self):
+        """Test that a parameter of only one query prevents merging."""
+        for first, second in (({'rvsection': 1}, {}),
+                              ({}, {'rvstartid': 5})):
+            self.site.requests = []
+            results = {}
+            threads = [
+                self._query(results, 'first', ['A'], 'revisions', **first),
+                self._query(results, 'second', ['B'], 'revisions', **second),
+            ]
+            for thread in threads:
+                thread.join()
+            self.assertEqual(len(self.site.requests), 2)
+            self.assertCountEqual(
+                [request['titles'] for request in self.site.requests],
+                [['A'], ['B']])
+
+    def test_error(self):
+        """Test that errors are raised in all waiting threads."""
+        def fail(*args, **kwargs):
+            raise pywikibot.Error('failed')
+        self.site._generator = fail
+        self.coalescer.window = 0
+        self.assertRaises(pywikibot.Error, self.coalescer.query,
+                          ['A'], 'info')
+
+
 if __name__ == '__main__':  # pragma: no cover
     unittest.main()
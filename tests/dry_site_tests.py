@@ -98,6 +98,69 @@ class TestDrySite(DefaultDrySiteTestCase):
                          user_agent(x, format_string='Foo ({script_comments})'))
 
 
+class SizedPage(object):
+
+    """Page with a known length, or one set when it is loaded."""
+
+    def __init__(self, length=None, loaded_length=None):
+        """Constructor."""
+        self._length = length
+        self.loaded_length = loaded_length
+
+
+class TestPreloadBatches(DefaultDrySiteTestCase):
+
+    """Test sizing preloadpages batches by the length of the pages."""
+
+    dry = True
+
+    def setUp(self):
+        """Set the limits of the dry site."""
+        super(TestPreloadBatches, self).setUp()
+        self.site = self.get_site()
+        self.site._paraminfo['query+info'] = {
+            'prop': {'limit': 50, 'highlimit': 500}}
+        self.site._userinfo = {'name': None, 'groups': [], 'rights': []}
+        self.site._username = [None, None]
+        self._budget = pywikibot.config.preload_batch_bytes
+        pywikibot.config.preload_batch_bytes = 1000
+
+    def tearDown(self):
+        """Restore the budget."""
+        pywikibot.config.preload_batch_bytes = self._budget
+        super(TestPreloadBatches, self).tearDown()
+
+    def _sizes(self, pages, groupsize=10):
+        """Return the number of pages of each batch."""
+        sizes = []
+        for batch in self.site._preload_batches(pages, groupsize):
+            sizes.append(len(batch))
+            for page in batch:
+                # simulate loading the page
+                if page.loaded_length is not None:
+                    page._length = page.loaded_length
+        return sizes
+
+    def test_known_lengths(self):
+        """Test that known lengths fill batches up to the budget."""
+        pages = [SizedPage(300) for _ in range(7)] + [SizedPage(5000)]
+        self.assertEqual(self._sizes(pages), [3, 3, 1, 1])
+
+    def test_running_average(self):
+        """Test that unknown lengths are estimated from loaded pages."""
+        pages = [SizedPage(loaded_length=20) for _ in range(100)]
+        # the first batch has groupsize pages, then 1000 / 20 pages
+        self.assertEqual(self._sizes(pages), [10, 50, 40])
+
+    def test_limits(self):
+        """Test that batches do not exceed the API limit of the account."""
+        pages = [SizedPage(1) for _ in range(700)]
+        self.assertEqual(self._sizes(pages), [50] * 14)
+        self.site._userinfo.update(name='bot', rights=['apihighlimits'])
+        self.site._username = ['bot', None]
+        self.assertEqual(self._sizes(pages), [500, 200])
+
+
 class TestSetAction(DeprecationTestCase):
 
     """Test the deprecated setAction function."""
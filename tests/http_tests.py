@@ -9,6 +9,8 @@ from __future__ import absolute_import, unicode_literals
 
 import json
 import re
+import threading
+import time
 import warnings
 
 import requests
@@ -51,6 +53,15 @@ class HttpTestCase(TestCase):
         self.assertIsInstance(r.content, unicode)
         self.assertIsInstance(r.raw, bytes)
 
+    def test_async_callback(self):
+        """Test that http._enqueue runs callbacks in a worker thread."""
+        threads = []
+        r = http._enqueue('http://www.wikipedia.org/', callback=lambda r:
+                          threads.append(threading.current_thread()))
+        self.assertEqual(r.status, 200)
+        self.assertEqual(len(threads), 1)
+        self.assertNotEqual(threads[0], threading.current_thread())
+
     def test_fetch(self):
         """Test http.fetch using http://www.wikipedia.org/."""
         r = http.fetch('http://www.wikipedia.org/')
@@ -127,6 +138,113 @@ class TestGetAuthenticationConfig(TestCase):
             self.assertEqual(http.get_authentication(url), auth)
 
 
+class HttpAdapterTestCase(TestCase):
+
+    """Test the connection pool configuration of the http session."""
+
+    net = False
+
+    def setUp(self):
+        """Set up test by configuring the connection pools."""
+        super(HttpAdapterTestCase, self).setUp()
+        self._config = (config.http_pool_maxsize,
+                        config.http_pool_maxsize_per_host,
+                        config.http_keep_alive, config.http_max_retries)
+        config.http_pool_maxsize = 5
+        config.http_pool_maxsize_per_host = {'ja.wikipedia.org': 20}
+        config.http_max_retries = 3
+
+    def tearDown(self):
+        """Tear down test by resetting the config."""
+        (config.http_pool_maxsize, config.http_pool_maxsize_per_host,
+         config.http_keep_alive, config.http_max_retries) = self._config
+        super(HttpAdapterTestCase, self).tearDown()
+
+    def test_pool_maxsize(self):
+        """Test default and per host pool sizes."""
+        session = requests.Session()
+        http._mount_adapters(session)
+        adapter = session.get_adapter('https://ja.wikipedia.org/w/api.php')
+        self.assertEqual(adapter._pool_maxsize, 20)
+        adapter = session.get_adapter('https://en.wikipedia.org/w/api.php')
+        self.assertEqual(adapter._pool_maxsize, 5)
+        self.assertEqual(adapter.max_retries.total, 3)
+
+    def test_keep_alive(self):
+        """Test that disabling keep-alive closes each connection."""
+        session = requests.Session()
+        http._mount_adapters(session)
+        self.assertNotEqual(session.headers.get('connection'), 'close')
+        config.http_keep_alive = False
+        session = requests.Session()
+        http._mount_adapters(session)
+        self.assertEqual(session.headers['connection'], 'close')
+
+
+class FlushTestCase(TestCase):
+
+    """Test closing the http session at exit."""
+
+    net = False
+
+    def setUp(self):
+        """Set up test by replacing the workers and the session."""
+        super(FlushTestCase, self).setUp()
+        self._saved = (http._workers, http._request_queue, http.session,
+                       config.socket_timeout)
+        self.release = threading.Event()
+        # a worker stuck in a request which does not read the queue
+        thread = threading.Thread(target=self.release.wait)
+        thread.daemon = True
+        thread.start()
+        http._workers = [thread, thread]
+        http._request_queue = http.Queue(1)
+        http.session = requests.Session()
+        config.socket_timeout = 0.1
+
+    def tearDown(self):
+        """Tear down test by restoring the workers and the session."""
+        self.release.set()
+        (http._workers, http._request_queue, http.session,
+         config.socket_timeout) = self._saved
+        super(FlushTestCase, self).tearDown()
+
+    def test_stuck_worker(self):
+        """Test that a stuck worker does not block the exit."""
+        start = time.time()
+        http._flush()
+        self.assertLess(time.time() - start, 5)
+        self.assertTrue(http._workers[0].is_alive())
+
+
+class RetryAfterTestCase(TestCase):
+
+    """Test parsing the Retry-After header."""
+
+    net = False
+
+    def _response(self, value=None):
+        """Return a response with the given Retry-After header."""
+        response = requests.Response()
+        if value is not None:
+            response.headers['Retry-After'] = value
+        return response
+
+    def test_seconds(self):
+        """Test a delay in seconds."""
+        self.assertEqual(http.retry_after(self._response('120')), 120)
+
+    def test_date(self):
+        """Test an HTTP date."""
+        self.assertEqual(http.retry_after(
+            self._response('Wed, 21 Oct 2015 07:28:00 GMT')), 0)
+        self.assertIsNone(http.retry_after(self._response('soon')))
+
+    def test_missing(self):
+        """Test a response without the header."""
+        self.assertIsNone(http.retry_after(self._response()))
+
+
 class HttpsCertificateTestCase(TestCase):
 
     """HTTPS certificate test."""
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""Tests for the incremental decoding of API responses."""
+#
+# (C) Pywikibot team, 2017
+#
+# Distributed under the terms of the MIT license.
+#
+from __future__ import absolute_import, unicode_literals
+
+import json
+
+from pywikibot.data.jsonstream import PageStream
+
+from tests.aspects import unittest, TestCase
+
+
+def chunked(text, size):
+    """Split the UTF-8 encoding of text into chunks of size bytes."""
+    data = text.encode('utf-8')
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+class PageStreamTestCase(TestCase):
+
+    """Test decoding query.pages while it is iterated."""
+
+    net = False
+
+    response = {
+        'batchcomplete': '',
+        'continue': {'rvcontinue': '123|456', 'continue': '||'},
+        'query': {
+            'normalized': [{'from': 'a', 'to': 'A'}],
+            'pages': {
+                '1': {'pageid': 1, 'title': 'A', 'revisions': [
+                    {'revid': 10, '*': 'テキスト\n' * 50}]},
+                '-1': {'title': 'B', 'missing': ''},
+                '2': {'pageid': 2, 'title': 'C', 'size': 12345},
+            },
+            'userinfo': {'id': 0, 'name': '127.0.0.1'},
+        },
+        'limits': {'revisions': 50},
+    }
+
+    def _stream(self, response, size, closed):
+        """Return a stream reading the response in chunks of size bytes."""
+        text = json.dumps(response, ensure_ascii=False, indent=1)
+        return PageStream(chunked(text, size),
+                          close=lambda: closed.append(True))
+
+    def test_pages(self):
+        """Test that page items are yielded and the rest is decoded."""
+        for size in (1, 7, 2 ** 16):
+            closed = []
+            stream = self._stream(self.response, size, closed)
+            head = stream.read_head()
+            self.assertTrue(stream.streaming)
+            self.assertEqual(head['continue'], self.response['continue'])
+            self.assertEqual(head['query']['normalized'],
+                             self.response['query']['normalized'])
+            self.assertNotIn('userinfo', head['query'])
+            pages = list(stream)
+            self.assertEqual(
+                sorted(pages, key=lambda page: page['title']),
+                sorted(self.response['query']['pages'].values(),
+                       key=lambda page: page['title']))
+            self.assertEqual(head['query']['userinfo'],
+                             self.response['query']['userinfo'])
+            self.assertEqual(head['limits'], {'revisions': 50})
+            self.assertEqual(closed, [True])
+
+    def test_page_list(self):
+        """Test the page list of formatversion=2."""
+        response = {'query': {'pages': [{'title': 'A'}, {'title': 'B'}]}}
+        stream = self._stream(response, 3, [])
+        self.assertEqual(stream.read_head(), {'query': {}})
+        self.assertEqual(list(stream), response['query']['pages'])
+        self.assertEqual(stream.result, {'query': {}})
+
+    def test_empty_pages(self):
+        """Test that empty page containers yield nothing."""
+        for pages in ({}, []):
+            stream = self._stream({'query': {'pages': pages}}, 2, [])
+            stream.read_head()
+            self.assertTrue(stream.streaming)
+            self.assertEqual(list(stream), [])
+
+    def test_no_pages(self):
+        """Test that responses without pages are decoded completely."""
+        response = {'error': {'code': 'maxlag', 'info': 'Waiting: 5 s'},
+                    'servedby': 'db1', 'number': 123456}
+        closed = []
+        stream = self._stream(response, 1, closed)
+        self.assertEqual(stream.read_head(), response)
+        self.assertFalse(stream.streaming)
+        self.assertEqual(closed, [True])
+
+    def test_invalid(self):
+        """Test that invalid responses raise ValueError."""
+        for text in ('', '<html>', '{"query": {"pages": {"1": {}', '{}x',
+                     '{"a" 1}'):
+            stream = PageStream(chunked(text, 2))
+            with self.assertRaises(ValueError):
+                stream.read_head()
+                list(stream)
+
+
+if __name__ == '__main__':  # pragma: no cover
+    try:
+        unittest.main()
+    except SystemExit:
+        pass
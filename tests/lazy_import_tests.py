@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""Tests for the names which pywikibot imports on first use."""
+#
+# (C) Pywikibot team, 2017
+#
+# Distributed under the terms of the MIT license.
+#
+from __future__ import absolute_import, unicode_literals
+
+import sys
+
+import pywikibot
+
+from pywikibot.tools import PYTHON_VERSION
+
+from tests.aspects import unittest, TestCase
+from tests.utils import execute
+
+
+class LazyImportTestCase(TestCase):
+
+    """Test loading public names of pywikibot on demand."""
+
+    net = False
+
+    @unittest.skipIf(PYTHON_VERSION < (3, 7),
+                     'modules are imported eagerly before Python 3.7')
+    def test_import(self):
+        """Test that importing pywikibot does not load the site layer."""
+        result = execute([
+            sys.executable, '-c',
+            'import sys, pywikibot; '
+            'print(sorted(name for name in ("pywikibot.page", '
+            '"pywikibot.site", "pywikibot.data.api", "pywikibot.comms.http") '
+            'if name in sys.modules))'])
+        self.assertEqual(result['exit_code'], 0, result['stderr'])
+        self.assertEqual(result['stdout'].strip(), '[]')
+
+    def test_names(self):
+        """Test that lazy names are the objects of their modules."""
+        from pywikibot import page, site
+        self.assertIs(pywikibot.Page, page.Page)
+        self.assertIs(pywikibot.unicode2html, page.unicode2html)
+        self.assertIs(pywikibot.BaseSite, site.BaseSite)
+        self.assertIs(pywikibot.site, site)
+        from pywikibot import Category
+        self.assertIs(Category, page.Category)
+
+    def test_unknown_name(self):
+        """Test that unknown names still raise AttributeError."""
+        self.assertFalse(hasattr(pywikibot, 'NoSuchName'))
+        self.assertRaises(AttributeError, getattr, pywikibot, 'no_such_name')
+
+    def test_put_thread(self):
+        """Test that the put thread is not started by the import."""
+        result = execute([
+            sys.executable, '-c',
+            'import pywikibot; print(pywikibot._putthread.is_alive())'])
+        self.assertEqual(result['exit_code'], 0, result['stderr'])
+        self.assertEqual(result['stdout'].strip(), 'False')
+
+
+if __name__ == '__main__':  # pragma: no cover
+    try:
+        unittest.main()
+    except SystemExit:
+        pass
@@ -0,0 +1,602 @@
+# -*- coding: utf-8 -*-
+"""Tests for the main.py script updating the wiki from the spreadsheet."""
+#
+# (C) Pywikibot team, 2017
+#
+# Distributed under the terms of the MIT license.
+#
+from __future__ import absolute_import, unicode_literals
+
+import argparse
+import io
+import runpy
+import shutil
+import tempfile
+
+try:
+    from unittest.mock import patch, Mock
+except ImportError:
+    from mock import patch, Mock
+
+import pywikibot
+
+from tests.aspects import unittest, require_modules, TestCase
+
+try:
+    with patch('pywikibot.Site'):
+        import main
+except ImportError:
+    main = None
+
+
+class FakePage(object):
+
+    """Page with a fixed text which records its saves."""
+
+    def __init__(self, title, text=None, revid=1, error=None):
+        """Constructor.
+
+        @param text: the text of the page or None if it does not exist
+        @param error: the error passed to the callback of save()
+        """
+        self._title = title
+        self._exists = text is not None
+        self.text = text or ''
+        self.revid = revid
+        self.error = error
+        self.site = None
+        self.saved = False
+
+    def title(self, withNamespace=True, **kwargs):
+        """Return the title."""
+        if withNamespace:
+            return self._title
+        return self._title.split(':', 1)[-1]
+
+    def exists(self):
+        """Return whether the page exists."""
+        return self._exists
+
+    @property
+    def latest_revision_id(self):
+        """Return the revision id or raise NoPage like Page."""
+        if not self._exists:
+            raise pywikibot.NoPage(self)
+        return self.revid
+
+    def save(self, asynchronous=False, callback=None):
+        """Record the save and call the callback."""
+        self.saved = True
+        if callback:
+            callback(self, self.error)
+
+
+@require_modules('jinja2', 'numpy', 'pandas', 'tabulate')
+class MainTestCase(TestCase):
+
+    """Base class resetting the state of main.py for every test."""
+
+    net = False
+
+    def setUp(self):
+        """Clear the caches and use an in-memory state database."""
+        super(MainTestCase, self).setUp()
+        for name in ('templates', 'sheet_texts', 'sheet_frames',
+                     'render_jobs', 'pending_pages', 'saved_pages',
+                     'counters', 'stats', 'page_counts'):
+            getattr(main, name).clear()
+        self.args = argparse.Namespace(debug=False, dry_run=False,
+                                       full=False, only=None, page=None,
+                                       rows=None)
+        self.pages = {}
+        self.patch(main, args=self.args, create=True,
+                   state=main.open_state(':memory:'), site=Mock(),
+                   report=io.StringIO(),
+                   Page=lambda site, title: self.pages[title])
+        main.site.preloadpages.side_effect = (
+            lambda pages, groupsize=50: iter(pages))
+
+    def patch(self, target, **attributes):
+        """Patch the attributes of target until the end of the test."""
+        patcher = patch.multiple(target, **attributes)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def add_template(self, name, source, revid=1):
+        """Compile a bot template as if it was loaded from the wiki."""
+        page = FakePage(main.template_page_name(name), source, revid)
+        return main.compile_template(name, page)
+
+
+class TemplateCacheTestCase(MainTestCase):
+
+    """Test compiling the bot templates once per revision."""
+
+    def test_cached(self):
+        """Test that an unchanged revision is not compiled again."""
+        template = self.add_template('ページ', '{{ a }}')
+        self.assertIs(self.add_template('ページ', '{{ b }}'), template)
+        self.assertIs(main.load_template('ページ'), template)
+        self.assertEqual(main.render_template('ページ', {'a': 1}), '1')
+
+    def test_new_revision(self):
+        """Test that a new revision is compiled again."""
+        self.add_template('ページ', '{{ a }}')
+        self.add_template('ページ', '{{ b }}', revid=2)
+        self.assertEqual(main.templates['ページ'][:2], (2, '{{ b }}'))
+        self.assertEqual(main.render_template('ページ', {'b': 1}), '1')
+
+    def test_missing(self):
+        """Test that a missing template is compiled as an empty one."""
+        title = main.template_page_name('ページ')
+        self.pages[title] = FakePage(title)
+        main.load_template('ページ')
+        self.assertEqual(main.templates['ページ'][:2], (None, ''))
+        self.assertEqual(main.render_template('ページ', {'a': 1}), '')
+
+    def test_preload(self):
+        """Test that the templates are compiled from one preload."""
+        for name in ('ページ', 'ページ/ブロック'):
+            title = main.template_page_name(name)
+            self.pages[title] = FakePage(title, name)
+        main.site.allpages.return_value = list(self.pages.values())
+        main.preload_templates()
+        self.assertEqual(main.site.preloadpages.call_count, 1)
+        self.assertEqual(sorted(main.templates), ['ページ', 'ページ/ブロック'])
+        self.pages.clear()
+        self.assertEqual(main.render_template('ページ/ブロック', {}),
+                         'ページ/ブロック')
+
+    def test_preload_names(self):
+        """Test that only the given templates are preloaded."""
+        for name in ('ページ', 'ページ/ブロック'):
+            title = main.template_page_name(name)
+            self.pages[title] = FakePage(title, name)
+        main.preload_templates(['ページ/ブロック'])
+        main.site.allpages.assert_not_called()
+        self.assertEqual(list(main.templates), ['ページ/ブロック'])
+
+
+class WorkbookTestCase(MainTestCase):
+
+    """Test fetching and parsing every sheet once per run."""
+
+    def setUp(self):
+        """Keep the snapshots in a temporary directory."""
+        super(WorkbookTestCase, self).setUp()
+        self.snapshot_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.snapshot_dir)
+        self.patch(main, session=Mock(), snapshot_dir=self.snapshot_dir)
+        self.response = Mock(status_code=200, text='a,b\n1,2\n', headers={})
+        main.session.get.return_value = self.response
+
+    def test_get_sheet(self):
+        """Test that a sheet is fetched and parsed once."""
+        df = main.get_sheet('ファンレベル')
+        df['c'] = 3
+        df = main.get_sheet('ファンレベル')
+        self.assertEqual(list(df.columns), ['a', 'b'])
+        self.assertEqual(main.get_sheet('ファンレベル', index_col='a').index[0],
+                         1)
+        self.assertEqual(main.session.get.call_count, 1)
+        self.assertEqual(len(main.sheet_frames), 2)
+
+    def test_fetch_workbook(self):
+        """Test that the sheets which were not fetched yet are fetched."""
+        main.fetch_workbook(['ファンレベル', 'スチル', '存在しないシート'])
+        self.assertEqual(sorted(main.sheet_texts), [53502103, 1956343157])
+        main.fetch_workbook(['ファンレベル'])
+        main.get_sheet('スチル')
+        self.assertEqual(main.session.get.call_count, 2)
+
+    def test_not_modified(self):
+        """Test that a sheet answering 304 is read from the snapshot."""
+        self.response.headers = {'ETag': '"1"'}
+        self.assertEqual(main.fetch_sheet_text(1), ('a,b\n1,2\n', '"1"'))
+        main.session.get.return_value = Mock(status_code=304)
+        self.assertEqual(main.fetch_sheet_text(1), ('a,b\n1,2\n', '"1"'))
+        self.assertEqual(main.session.get.call_args[1]['headers'],
+                         {'If-None-Match': '"1"'})
+
+    def test_parsed_snapshot(self):
+        """Test that a sheet with the same validator is not parsed again."""
+        main.sheet_texts[1] = ('a\n1\n', 'etag')
+        self.assertEqual(main.parse_sheet(1)['a'].tolist(), [1])
+        main.sheet_texts[1] = ('a\n2\n', 'etag')
+        self.assertEqual(main.parse_sheet(1)['a'].tolist(), [1])
+        main.sheet_texts[1] = ('a\n2\n', 'etag2')
+        self.assertEqual(main.parse_sheet(1)['a'].tolist(), [2])
+
+
+class StateTestCase(MainTestCase):
+
+    """Test skipping pages whose data and template did not change."""
+
+    def setUp(self):
+        """Add the template and record the page as saved once."""
+        super(StateTestCase, self).setUp()
+        self.add_template('ページ', '{{ a }}')
+        main.update_wiki('ファンレベル', 'ページ', data={'a': 1})
+        self.input_hash = main.render_jobs.pop()[4]
+        main.store_state('ページ', self.input_hash, 1, 'output')
+
+    def test_input_hash(self):
+        """Test the hash of the data of the page."""
+        self.assertEqual(self.input_hash,
+                         main.hash_data('ファンレベル', 'ページ', {'a': 1}))
+
+    def test_unchanged(self):
+        """Test that the same data and template are skipped."""
+        main.update_wiki('ファンレベル', 'ページ', data=[('a', 1)])
+        self.assertEqual(main.render_jobs, [])
+        self.assertEqual(main.page_counts['unchanged'], 1)
+
+    def test_data_changed(self):
+        """Test that changed data is rendered again."""
+        main.update_wiki('ファンレベル', 'ページ', data={'a': 2})
+        self.assertEqual(len(main.render_jobs), 1)
+        self.assertNotEqual(main.render_jobs[0][4], self.input_hash)
+        self.assertEqual(main.render_jobs[0][5], 'output')
+
+    def test_template_changed(self):
+        """Test that a new template revision is rendered again."""
+        self.add_template('ページ', '{{ a }}', revid=2)
+        main.update_wiki('ファンレベル', 'ページ', data={'a': 1})
+        self.assertEqual(len(main.render_jobs), 1)
+
+    def test_full(self):
+        """Test that --full ignores the previous run."""
+        self.args.full = True
+        main.update_wiki('ファンレベル', 'ページ', data={'a': 1})
+        self.assertEqual(main.render_jobs[0][5], None)
+
+    def test_page(self):
+        """Test that --page skips the other pages."""
+        self.args.page = ['別のページ']
+        main.update_wiki('ファンレベル', 'ページ', data={'a': 2})
+        self.assertEqual(main.render_jobs, [])
+        self.assertEqual(main.page_counts['unchanged'], 0)
+
+
+class SavePagesTestCase(MainTestCase):
+
+    """Test preloading the pending pages and saving the changed ones."""
+
+    def test_save_pages(self):
+        """Test that the pages of a template are preloaded together."""
+        self.pages['新規'] = FakePage('新規')
+        self.pages['変更'] = FakePage('変更', 'old')
+        self.pages['同じ'] = FakePage('同じ', 'text')
+        self.pages['別'] = FakePage('別', 'old')
+        for name, template_name in (('新規', 'ページ'), ('変更', 'ページ'),
+                                    ('同じ', 'ページ'), ('別', '別')):
+            main.pending_pages.append((name, template_name, 'text',
+                                       (name, 1, 'output')))
+        main.save_pages()
+        self.assertEqual(main.pending_pages, [])
+        self.assertEqual(main.site.preloadpages.call_count, 2)
+        self.assertEqual(dict(main.page_counts),
+                         {'new': 1, 'changed': 2, 'unchanged': 1})
+        self.assertEqual([page.saved for page in self.pages.values()],
+                         [True, True, False, True])
+        self.assertEqual(self.pages['新規'].text, 'text')
+        self.assertEqual(main.load_state('同じ'), ('同じ', 1, 'output'))
+        self.assertIsNone(main.load_state('変更'))
+        self.assertEqual(sorted(main.stats), ['ページ', '別'])
+
+    def test_debug(self):
+        """Test that --debug prints the pages instead of saving them."""
+        self.args.debug = True
+        self.pages['変更'] = FakePage('変更', 'old')
+        main.pending_pages.append(('変更', 'ページ', 'text',
+                                   ('変更', 1, 'output')))
+        with patch.object(main, 'print', create=True) as print_:
+            main.save_pages()
+        print_.assert_called_once_with('text')
+        self.assertFalse(self.pages['変更'].saved)
+        self.assertIsNone(main.load_state('変更'))
+
+
+class RenderTestCase(MainTestCase):
+
+    """Test rendering all queued pages in one stage."""
+
+    def setUp(self):
+        """Add the template."""
+        super(RenderTestCase, self).setUp()
+        self.add_template('ページ', '{{ a }}')
+
+    def test_render_pages(self):
+        """Test that the pages are rendered in the order of the calls."""
+        for value in (2, 1):
+            main.update_wiki('ファンレベル', 'ページ{}'.format(value),
+                             template_name='ページ', data={'a': value})
+        main.render_pages()
+        self.assertEqual(main.render_jobs, [])
+        self.assertEqual([item[:2] for item in main.pending_pages],
+                         [('ページ2', 'ページ'), ('ページ1', 'ページ')])
+        text, record = main.pending_pages[1][2:]
+        self.assertEqual(text, main.add_footer('1', 'ファンレベル', 'ページ'))
+        self.assertEqual(record[1:], (1, main.hash_text(text)))
+        self.assertEqual(main.stats['ページ']['render']['calls'], 2)
+
+    def test_same_output(self):
+        """Test that a page rendering to the previous text is not saved."""
+        text = main.add_footer('1', 'ファンレベル', 'ページ')
+        main.store_state('ページ', 'input', 1, main.hash_text(text))
+        main.update_wiki('ファンレベル', 'ページ', data={'a': 1})
+        input_hash = main.render_jobs[0][4]
+        main.render_pages()
+        self.assertEqual(main.pending_pages, [])
+        self.assertEqual(main.page_counts['unchanged'], 1)
+        self.assertEqual(main.load_state('ページ')[0], input_hash)
+
+    def test_debug(self):
+        """Test that --debug does not record the state."""
+        self.args.debug = True
+        text = main.add_footer('1', 'ファンレベル', 'ページ')
+        main.store_state('ページ', 'input', 1, main.hash_text(text))
+        main.update_wiki('ファンレベル', 'ページ', data={'a': 1})
+        main.render_pages()
+        self.assertEqual(main.load_state('ページ')[0], 'input')
+
+    def test_render_source(self):
+        """Test rendering in the way of the worker processes."""
+        text, seconds = main.render_source('{{ a }}{{ b }}', {'a': 1, 'b': 2})
+        self.assertEqual(text, '12')
+        self.assertGreaterEqual(seconds, 0)
+
+    def test_worker_import(self):
+        """Test that the worker processes do not connect to the site."""
+        with patch('pywikibot.Site') as site:
+            namespace = runpy.run_path(main.__file__,
+                                       run_name='__mp_main__')
+        site.assert_not_called()
+        self.assertIsNone(namespace['site'])
+
+
+class RecordsTestCase(MainTestCase):
+
+    """Test preparing the rows of a sheet for the templates at once."""
+
+    def setUp(self):
+        """Create a sheet with missing values."""
+        super(RecordsTestCase, self).setUp()
+        self.df = main.pd.DataFrame({'名前': ['a', None, 'c'],
+                                     '数': [1.0, main.np.nan, 3.0]})
+
+    def test_normalize_frame(self):
+        """Test that floats become integers and missing values are filled."""
+        df = main.normalize_frame(self.df, fillna='', to_int=True)
+        self.assertEqual(df.to_dict('records'),
+                         [{'名前': 'a', '数': 1}, {'名前': '', '数': ''},
+                          {'名前': 'c', '数': 3}])
+        self.assertIsInstance(df['数'][0], int)
+        self.assertTrue(main.np.isnan(self.df['数'][1]))
+
+    def test_render_rows(self):
+        """Test that the rows are rendered like with iterrows()."""
+        template = self.add_template('ブロック', '{{ 名前 }}={{ 数 }}')
+        expected = ''
+        for i, row in self.df.iterrows():
+            row = dict((key, int(value) if type(value) is float else value)
+                       for key, value in row.fillna('').to_dict().items())
+            expected += template.render(row) + '\n\n'
+        self.assertEqual(expected, 'a=1\n\n=\n\nc=3\n\n')
+        df = main.normalize_frame(self.df, fillna='', to_int=True)
+        self.assertEqual(main.render_rows('ブロック', df), expected)
+        self.assertEqual(main.render_rows('ブロック', df, reverse=True),
+                         'c=3\n\n=\n\na=1\n\n')
+
+
+class ItemIndexTestCase(MainTestCase):
+
+    """Test the index of the rows needing each prism."""
+
+    colors = ['紫', '青', '赤']
+    columns = ['瞬きプリズム', '煌めきプリズム']
+
+    def test_contains(self):
+        """Test the index of the cells containing a color."""
+        df = main.pd.DataFrame({'瞬きプリズム': ['紫3 青2', None, '青1'],
+                                '煌めきプリズム': ['赤1 赤2', '紫2', None]})
+        index = main.build_item_index(df, self.columns, self.colors)
+        self.assertEqual(index, {('瞬きプリズム', '紫'): [0],
+                                 ('瞬きプリズム', '青'): [0, 2],
+                                 ('煌めきプリズム', '赤'): [0],
+                                 ('煌めきプリズム', '紫'): [1]})
+        # the rows which were found by scanning each color separately
+        for column in self.columns:
+            for color in self.colors:
+                rows = df.index[df[column].str.contains(color, na=False)]
+                self.assertEqual(index.get((column, color), []),
+                                 rows.tolist())
+
+    def test_exact(self):
+        """Test the index of the cells equal to a color."""
+        df = main.pd.DataFrame({'瞬きプリズム': ['紫', '青', '紫2'],
+                                '煌めきプリズム': ['紫', None, '赤']})
+        index = main.build_item_index(df, self.columns, self.colors,
+                                      exact=True)
+        self.assertEqual(index, {('瞬きプリズム', '紫'): [0],
+                                 ('瞬きプリズム', '青'): [1],
+                                 ('煌めきプリズム', '紫'): [0],
+                                 ('煌めきプリズム', '赤'): [2]})
+
+
+class DryRunTestCase(MainTestCase):
+
+    """Test writing the changes to a report instead of saving them."""
+
+    def setUp(self):
+        """Enable --dry-run."""
+        super(DryRunTestCase, self).setUp()
+        self.args.dry_run = True
+
+    def test_report(self):
+        """Test that the diffs are reported and nothing is saved."""
+        self.pages['変更'] = FakePage('変更', 'old\n')
+        self.pages['新規'] = FakePage('新規')
+        self.pages['同じ'] = FakePage('同じ', 'new\n')
+        for name in ('変更', '新規', '同じ'):
+            main.pending_pages.append((name, 'ページ', 'new\n',
+                                       (name, 1, 'output')))
+        main.save_pages()
+        report = main.report.getvalue()
+        self.assertIn('--- 変更\n+++ 変更\n', report)
+        self.assertIn('- old', report)
+        self.assertIn('--- 新規\n+++ 新規\n', report)
+        self.assertNotIn('同じ', report)
+        self.assertEqual(report.count('+ new'), 2)
+        self.assertFalse(any(page.saved for page in self.pages.values()))
+        self.assertIsNone(main.load_state('同じ'))
+
+    def test_summary(self):
+        """Test the summary of the page counts."""
+        main.page_counts.update(['new', 'unchanged', 'unchanged'])
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = directory + '/summary.json'
+        main.write_summary(path)
+        with open(path) as f:
+            summary = main.json.load(f)
+        self.assertEqual(summary['pages'],
+                         {'new': 1, 'changed': 0, 'unchanged': 2})
+
+
+class InstrumentTestCase(MainTestCase):
+
+    """Test counting the requests and measuring the stages."""
+
+    def test_measure(self):
+        """Test that a stage records its time and requests."""
+        main.counters['api_requests'] += 1
+        with main.measure('ページ', 'fetch'):
+            main.counters['api_requests'] += 2
+        record = main.stats['ページ']['fetch']
+        self.assertEqual(record['calls'], 1)
+        self.assertEqual(record['api_requests'], 2)
+        self.assertGreaterEqual(record['seconds'], 0)
+
+    def test_count_response(self):
+        """Test that the response hook does not read the content."""
+        self.patch(main, session=Mock(hooks={'response': []}))
+        self.patch(main.http, session=Mock(hooks={'response': []}))
+        self.patch(main.api.Request, submit=main.api.Request.submit)
+        self.patch(main.Throttle, wait=main.Throttle.wait)
+        main.instrument()
+        count_response = main.session.hooks['response'][0]
+        response = Mock(headers={'Content-Length': '10'})
+        response.request.body = 'abc'
+        count_response(response)
+        response = Mock(headers={})
+        response.request.body = None
+        count_response(response)
+        self.assertEqual(main.counters, {'http_requests': 2,
+                                         'bytes_received': 10,
+                                         'bytes_sent': 3})
+
+
+class SelectTestCase(MainTestCase):
+
+    """Test selecting the targets and the rows to update."""
+
+    def setUp(self):
+        """Create a sheet."""
+        super(SelectTestCase, self).setUp()
+        self.df = main.pd.DataFrame({'レア': ['UR', 'SR', 'UR'],
+                                     '最大ランク': [5.0, 4.0, None]})
+
+    def rows(self, expression):
+        """Return the labels of the rows matching the expression."""
+        return main.filter_rows(self.df, expression).index.tolist()
+
+    def names(self):
+        """Return the names of the selected targets."""
+        return [target.name for target in main.select_targets(self.args)]
+
+    def test_filter_rows(self):
+        """Test the conditions on a column."""
+        self.assertEqual(self.rows('レア==UR'), [0, 2])
+        self.assertEqual(self.rows(' レア != UR '), [1])
+        self.assertEqual(self.rows('最大ランク==5'), [0])
+        self.assertEqual(self.rows('最大ランク!=5'), [1, 2])
+        self.assertEqual(self.rows('最大ランク==UR'), [])
+        self.assertEqual(self.rows('最大ランク > 4'), [0])
+
+    def test_select_targets(self):
+        """Test --only and --page."""
+        self.assertIs(main.select_targets(self.args), main.targets)
+        self.args.only = ['ファンレベル', 'プリズム']
+        self.assertEqual(self.names(), ['ファンレベル', 'プリズム'])
+        self.args.only = None
+        self.args.page = ['ファンレベル', '瞬きプリズム(紫)']
+        self.assertEqual(self.names(), ['ファンレベル', 'ブロマイド', 'プリズム'])
+        self.args.only = ['ファンレベル', '存在しない']
+        self.assertRaises(ValueError, main.select_targets, self.args)
+
+    def test_rows(self):
+        """Test that --rows selects only the bromides."""
+        self.args.rows = 'レア==UR'
+        self.assertEqual(self.names(), ['ブロマイド'])
+        self.args.only = ['ブロマイド', 'プリズム']
+        self.assertEqual(self.names(), ['ブロマイド'])
+        self.args.only = ['プリズム']
+        self.assertRaises(ValueError, main.select_targets, self.args)
+
+
+class FinishSavesTestCase(MainTestCase):
+
+    """Test recording the results of the asynchronous saves."""
+
+    def setUp(self):
+        """Replace the put queue and the put thread."""
+        super(FinishSavesTestCase, self).setUp()
+        self.queue = Mock(unfinished_tasks=0)
+        self.thread = Mock()
+        self.thread.is_alive.return_value = True
+        self.patch(pywikibot, page_put_queue=self.queue,
+                   _putthread=self.thread)
+        self.print = Mock()
+        self.patch(main, print=self.print, create=True)
+
+    def test_results(self):
+        """Test that only the saved pages are recorded."""
+        self.pages['成功'] = FakePage('成功', 'old')
+        self.pages['失敗'] = FakePage('失敗', 'old', error=pywikibot.Error('x'))
+        for name in ('成功', '失敗'):
+            main.pending_pages.append((name, 'ページ', 'new',
+                                       ('input', 1, 'output')))
+        main.save_pages()
+        self.assertEqual(len(main.saved_pages), 2)
+        self.assertIsNone(main.load_state('成功'))
+        main.finish_saves()
+        self.assertEqual(main.saved_pages, [])
+        self.assertEqual(main.load_state('成功'), ('input', 1, 'output'))
+        self.assertIsNone(main.load_state('失敗'))
+        self.print.assert_any_call('1 pages saved, 1 failed')
+
+    def test_wait(self):
+        """Test waiting until the put queue is done."""
+        def join(timeout):
+            self.queue.unfinished_tasks -= 1
+        self.queue.unfinished_tasks = 2
+        self.thread.join.side_effect = join
+        main.finish_saves()
+        self.assertEqual(self.thread.join.call_count, 2)
+
+    def test_dead_put_thread(self):
+        """Test that a stopped put thread does not block."""
+        self.queue.unfinished_tasks = 2
+        self.thread.is_alive.return_value = False
+        main.finish_saves()
+        self.thread.join.assert_not_called()
+        self.print.assert_any_call(
+            '2 saves were not finished because the put thread stopped')
+
+
+if __name__ == '__main__':  # pragma: no cover
+    try:
+        unittest.main()
+    except SystemExit:
+        pass
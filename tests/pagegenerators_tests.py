@@ -12,6 +12,7 @@ import datetime
 import json
 import logging
 import sys
+import threading
 
 from distutils.version import LooseVersion
 
@@ -575,6 +576,75 @@ class TestPreloadingGenerator(DefaultSiteTestCase):
         self.assertEqual(len(links), count)
 
 
+class FakePage(object):
+
+    """Page with a site and a number."""
+
+    def __init__(self, site, number):
+        """Constructor."""
+        self.site = site
+        self.number = number
+
+
+class FakePreloadSite(object):
+
+    """Site recording the batches passed to preloadpages."""
+
+    def __init__(self, fail=False):
+        """Constructor."""
+        self.batches = []
+        self.fail = fail
+        self.loaded = threading.Event()
+
+    def preloadpages(self, pages, groupsize=50):
+        """Yield the pages and record the batch."""
+        self.batches.append([page.number for page in pages])
+        if len(self.batches) == 2:
+            self.loaded.set()
+        if self.fail:
+            raise pywikibot.Error('preloading failed')
+        for page in pages:
+            yield page
+
+
+class TestReadAheadPreloadingGenerator(TestCase):
+
+    """Test loading the next batches while a batch is processed."""
+
+    net = False
+
+    def test_order(self):
+        """Test that pages keep their order with read ahead."""
+        sites = [FakePreloadSite(), FakePreloadSite()]
+        pages = [FakePage(sites[int(i % 3 == 0)], i) for i in range(25)]
+        result = list(PreloadingGenerator(pages, groupsize=4, read_ahead=2))
+        self.assertCountEqual(result, pages)
+        for site in sites:
+            numbers = [page.number for page in result if page.site is site]
+            self.assertEqual(numbers, sorted(numbers))
+            self.assertEqual(sum(site.batches, []), numbers)
+            self.assertTrue(all(len(batch) <= 4 for batch in site.batches))
+
+    def test_read_ahead(self):
+        """Test that the next batch is loaded before it is needed."""
+        site = FakePreloadSite()
+        gen = PreloadingGenerator((FakePage(site, i) for i in range(30)),
+                                  groupsize=10, read_ahead=1)
+        self.assertEqual(next(gen).number, 0)
+        self.assertTrue(site.loaded.wait(10))
+        self.assertEqual(site.batches[1], list(range(10, 20)))
+        # the third batch is not loaded before the first one is processed
+        self.assertEqual(len(site.batches), 2)
+        self.assertEqual(len(list(gen)), 29)
+
+    def test_error(self):
+        """Test that errors of a batch are raised to the consumer."""
+        site = FakePreloadSite(fail=True)
+        gen = PreloadingGenerator([FakePage(site, i) for i in range(5)],
+                                  groupsize=2, read_ahead=1)
+        self.assertRaises(pywikibot.Error, list, gen)
+
+
 class TestDequePreloadingGenerator(DefaultSiteTestCase):
 
     """Test preloading generator on lists."""
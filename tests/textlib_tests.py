@@ -11,6 +11,8 @@ import codecs
 import functools
 import os
 import re
+import shutil
+import tempfile
 try:
     from unittest import mock
 except ImportError:
@@ -21,6 +23,7 @@ import pywikibot.textlib as textlib
 from pywikibot.textlib import _MultiTemplateMatchBuilder
 
 from pywikibot import config, UnknownSite
+from pywikibot.data import cachestore
 from pywikibot.site import _IWEntry
 from pywikibot.tools import OrderedDict
 
@@ -794,6 +797,14 @@ class TestReplaceLinks(TestCase):
             '[[bug:1337]]?')
         del self._count
 
+    def test_parsed_text(self):
+        """Test replacing links in a ParsedWikitext."""
+        self.assertEqual(
+            textlib.replace_links(textlib.ParsedWikitext(self.text),
+                                  ('World', 'Homeworld'), self.wp_site),
+            'Hello [[Homeworld|World]], [[how|are]] [[you#section|you]]? Are '
+            '[[you]] a [[bug:1337]]?')
+
     def test_unlink_all(self):
         """Test unlinking."""
         def callback(link, text, groups, rng):
@@ -1369,6 +1380,166 @@ class TestReplaceExcept(DefaultDrySiteTestCase):
                          r'X\g<bar>X')
 
 
+class TestExceptReplacer(DefaultDrySiteTestCase):
+
+    """Test applying several replacements with ExceptReplacer."""
+
+    def test_replace(self):
+        """Test that each replacement sees the earlier replacements."""
+        replacer = textlib.ExceptReplacer('a <!--a--> b', site=self.site)
+        self.assertTrue(replacer.replace('a', 'b', ['comment']))
+        self.assertFalse(replacer.replace('c', 'd', ['comment']))
+        self.assertTrue(replacer.replace('b', 'c', ['comment']))
+        self.assertEqual(replacer.text, 'c <!--a--> c')
+
+    def test_shared_exceptions(self):
+        """Test that the exceptions are searched once for an unchanged text."""
+        exception = mock.Mock(wraps=re.compile(r'<!--.*?-->'), pattern='')
+        replacer = textlib.ExceptReplacer('xa<!--a-->a' * 3, site=self.site)
+        for old in ('a', 'a$', 'x', 'xa'):
+            self.assertFalse(replacer.replace(old, r'\g<0>', [exception]))
+        self.assertEqual(exception.search.call_count, 4)
+
+    def test_changed_context(self):
+        """Test matches which depend on the text before them."""
+        self.assertEqual(textlib.replaceExcept('ab', 'a', 'a ', [],
+                                               site=self.site),
+                         'a b')
+        self.assertEqual(textlib.replaceExcept('abb', r'a|\bb', ' ', [],
+                                               site=self.site),
+                         '   ')
+        self.assertEqual(textlib.replaceExcept('xb\nb', r'(?m)x|^b', '\n',
+                                               [], site=self.site),
+                         '\n\n\n\n')
+        self.assertEqual(textlib.replaceExcept('abab', r'a|(?<=a)b', 'a', [],
+                                               site=self.site),
+                         'aaaa')
+        self.assertEqual(textlib.replaceExcept('a<!-- -->b', 'a|b', '<!--',
+                                               ['comment'], site=self.site),
+                         '<!--<!-- --><!--')
+
+
+class TestRegexCache(DefaultDrySiteTestCase):
+
+    """Test caching the site specific regexes of textlib."""
+
+    def setUp(self):
+        """Start with empty caches."""
+        super(TestRegexCache, self).setUp()
+        for cache in (textlib._regex_cache, textlib._template_regex_cache):
+            patcher = mock.patch.dict(cache, clear=True)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.stats = textlib._regex_cache_stats.copy()
+
+    def assertStats(self, **counts):
+        """Assert the counts added to the cache statistics."""
+        for name in ('hits', 'misses', 'stored'):
+            self.assertEqual(textlib._regex_cache_stats[name] -
+                             self.stats[name], counts.get(name, 0))
+
+    def test_site_regex(self):
+        """Test that site objects of a wiki share the compiled regex."""
+        regex = textlib._get_regexes(['category'], self.site)[0]
+        self.assertStats(misses=1)
+        site = type(self.site)(self.site.code, self.site.family.name,
+                               None, None)
+        self.assertIs(textlib._get_regexes(['category'], site)[0], regex)
+        self.assertStats(hits=1, misses=1)
+
+    def test_template(self):
+        """Test that template regexes are cached."""
+        builder = _MultiTemplateMatchBuilder(self.site)
+        self.assertIs(builder.pattern('Foo'), builder.pattern('Foo'))
+        self.assertIsNot(builder.pattern('Foo'), builder.pattern('Bar'))
+
+    def test_template_first(self):
+        """Test that a template regex does not hide the default regexes."""
+        _MultiTemplateMatchBuilder(self.site).pattern('Foo')
+        regex = textlib._get_regexes(['comment'], self.site)[0]
+        self.assertEqual(regex.pattern, r'(?s)<!--.*?-->')
+        self.assertEqual(len(textlib._get_regexes(['source'], self.site)), 2)
+        self.assertEqual(textlib.replaceExcept('<!-- a --> a', 'a', 'b',
+                                               ['comment'], site=self.site),
+                         '<!-- a --> b')
+
+    def test_store(self):
+        """Test loading the pattern from the store."""
+        directory = tempfile.mkdtemp()
+        store = cachestore.CacheStore(
+            os.path.join(directory, 'regexes.sqlite3'))
+        try:
+            with mock.patch.object(textlib, '_regex_store',
+                                   return_value=store), \
+                    mock.patch.object(config, 'precompiled_regexes', True):
+                regex = textlib._get_regexes(['category'], self.site)[0]
+                self.assertEqual(store.size()[0], 1)
+                del textlib._regex_cache['category', repr(self.site)]
+                stored = textlib._get_regexes(['category'], self.site)[0]
+        finally:
+            store._db.close()
+            shutil.rmtree(directory)
+        self.assertEqual(stored.pattern, regex.pattern)
+        self.assertEqual(stored.flags, regex.flags)
+        self.assertStats(misses=2, stored=1)
+
+
+class TestParsedWikitext(DefaultDrySiteTestCase):
+
+    """Test sharing the scans of a text with ParsedWikitext."""
+
+    text = ('{{a|b=<!-- c -->d}} [[Category:Foo|bar]]<nowiki>[[Category:Baz]]'
+            '</nowiki>\n<!-- [[de:Foo]] -->[[fr:Foo]] <pre>{{e}}</pre>'
+            '<includeonly>[[Category:Qux]]</includeonly>')
+
+    def test_disabled_parts(self):
+        """Test that the text without disabled parts is computed once."""
+        parsed = textlib.ParsedWikitext(self.text)
+        for tags, include in ((['*'], []), (['comments', 'pre'], []),
+                              (['*'], ['includeonly']), ([], [])):
+            self.assertEqual(
+                textlib.removeDisabledParts(parsed, tags, include),
+                textlib.removeDisabledParts(self.text, tags, include))
+        self.assertEqual([self.text[start:end] for start, end
+                          in parsed.disabled_spans(['comments'])],
+                         ['<!-- c -->', '<!-- [[de:Foo]] -->'])
+        self.assertEqual(parsed.disabled_spans([]), [])
+        with mock.patch.object(textlib, '_disabled_parts_regex') as regex:
+            textlib.removeDisabledParts(parsed, ['comments', 'pre'])
+            parsed.disabled_spans(['pre', 'comments'])
+        regex.assert_not_called()
+
+    def test_links(self):
+        """Test reading categories and language links."""
+        parsed = textlib.ParsedWikitext(self.text)
+        for include in ([], ['includeonly']):
+            self.assertEqual(
+                textlib.getCategoryLinks(parsed, self.site, include=include),
+                textlib.getCategoryLinks(self.text, self.site,
+                                         include=include))
+        self.assertEqual(textlib.getLanguageLinks(parsed, self.site),
+                         textlib.getLanguageLinks(self.text, self.site))
+        with mock.patch.object(textlib, '_disabled_parts_regex') as regex:
+            textlib.getCategoryLinks(parsed, self.site)
+            textlib.getLanguageLinks(parsed, self.site)
+        regex.assert_not_called()
+
+    def test_templates(self):
+        """Test that the memoized templates are not changed by callers."""
+        parsed = textlib.ParsedWikitext(self.text)
+        templates = textlib.extract_templates_and_params(parsed, True, True)
+        self.assertEqual(
+            templates,
+            textlib.extract_templates_and_params(self.text, True, True))
+        templates[0][1]['b'] = 'x'
+        self.assertEqual(
+            textlib.extract_templates_and_params(parsed, True, True)[0],
+            ('a', OrderedDict([('b', 'd')])))
+        self.assertEqual(
+            textlib.extract_templates_and_params_regex(parsed),
+            textlib.extract_templates_and_params_regex(self.text))
+
+
 class TestMultiTemplateMatchBuilder(DefaultDrySiteTestCase):
 
     """Test _MultiTemplateMatchBuilder."""
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""Tests for the throttle module."""
+#
+# (C) Pywikibot team, 2017
+#
+# Distributed under the terms of the MIT license.
+#
+from __future__ import absolute_import, unicode_literals
+
+import os
+import shutil
+import tempfile
+import time
+
+from pywikibot.throttle import RateController, Throttle, TokenBucketThrottle
+
+from tests.aspects import unittest, TestCase
+
+
+class RecordingThrottle(TokenBucketThrottle):
+
+    """Token bucket throttle recording waits instead of sleeping."""
+
+    def __init__(self, *args, **kwargs):
+        """Constructor."""
+        super(RecordingThrottle, self).__init__(*args, **kwargs)
+        self.waits = []
+
+    def wait(self, seconds):
+        """Record the time to wait."""
+        self.waits.append(seconds)
+
+
+class TokenBucketThrottleTestCase(TestCase):
+
+    """Test the token bucket throttle with a temporary database."""
+
+    net = False
+
+    def setUp(self):
+        """Create a temporary directory for the bucket database."""
+        super(TokenBucketThrottleTestCase, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.dbfilename = os.path.join(self.directory, 'throttle.sqlite3')
+
+    def tearDown(self):
+        """Remove the temporary directory."""
+        shutil.rmtree(self.directory)
+        super(TokenBucketThrottleTestCase, self).tearDown()
+
+    def _throttle(self, site='test:test'):
+        """Return a throttle with a delay of 10 seconds and 3 tokens."""
+        throttle = RecordingThrottle(site, read_burst=3,
+                                     dbfilename=self.dbfilename)
+        throttle.setDelays(10, absolute=True)
+        return throttle
+
+    def test_burst(self):
+        """Test that requests wait only after the bucket is empty."""
+        throttle = self._throttle()
+        for i in range(5):
+            throttle()
+        self.assertEqual(throttle.waits[:3], [0, 0, 0])
+        self.assertAlmostEqual(throttle.waits[3], 10, delta=1)
+        self.assertAlmostEqual(throttle.waits[4], 20, delta=1)
+        self.assertGreater(throttle.waittime(), 20)
+
+    def test_shared_state(self):
+        """Test that throttles of the same site share one bucket."""
+        first = self._throttle()
+        second = self._throttle()
+        other = self._throttle('test:other')
+        first()
+        first()
+        second()
+        second()
+        other()
+        self.assertEqual(first.waits, [0, 0])
+        self.assertEqual(second.waits[0], 0)
+        self.assertAlmostEqual(second.waits[1], 10, delta=1)
+        self.assertEqual(other.waits, [0])
+
+    def test_lag(self):
+        """Test that server lag blocks all throttles of the site."""
+        first = self._throttle()
+        second = self._throttle()
+        first()
+        first.lag(30)
+        self.assertAlmostEqual(first.waits[-1], 15, delta=1)
+        second()
+        self.assertAlmostEqual(second.waits[-1], 15, delta=1)
+
+    def test_lag_before_requests(self):
+        """Test that server lag blocks requests made after it."""
+        throttle = self._throttle()
+        throttle.lag(30)
+        throttle()
+        self.assertAlmostEqual(throttle.waits[-1], 15, delta=1)
+        throttle(write=True)
+        self.assertAlmostEqual(throttle.waits[-1], 15, delta=1)
+
+    def test_wait_times(self):
+        """Test the histogram of wait times."""
+        throttle = self._throttle()
+        for i in range(5):
+            throttle()
+        histogram = dict(throttle.wait_times())
+        self.assertEqual(histogram[0], 3)
+        self.assertEqual(histogram[10] + histogram[30], 2)
+        self.assertEqual(sum(histogram.values()), 5)
+        self.assertEqual(sum(count for bound, count
+                             in throttle.wait_times(write=True)), 0)
+
+
+class RateControllerTestCase(TestCase):
+
+    """Test adapting the delays to the server load."""
+
+    net = False
+
+    def setUp(self):
+        """Create a controller and a throttle using it."""
+        super(RateControllerTestCase, self).setUp()
+        self.controller = RateController(max_concurrency=4, slow_response=1)
+        self.throttle = Throttle('test:test', mindelay=0, maxdelay=60,
+                                 multiplydelay=False,
+                                 controller=self.controller)
+        self.throttle.setDelays(2)
+
+    def test_fast_responses(self):
+        """Test that fast responses shorten delays and add concurrency."""
+        for i in range(20):
+            self.throttle.record_response(0.1)
+        self.assertEqual(self.controller.concurrency, 4)
+        self.assertEqual(self.controller.factor, RateController.min_factor)
+        self.assertEqual(self.throttle.getDelay(), 0.5)
+
+    def test_slow_responses(self):
+        """Test that slow responses lengthen delays."""
+        self.throttle.record_response(5)
+        self.assertGreater(self.throttle.getDelay(), 2)
+        self.assertEqual(self.controller.metrics()['slow'], 1)
+
+    def test_lag(self):
+        """Test that maxlag errors back off the requests."""
+        self.throttle.wait = lambda seconds: None
+        for i in range(4):
+            self.throttle.record_response(0.1)
+        self.throttle.lag(10)
+        self.assertEqual(self.controller.concurrency, 2)
+        self.assertEqual(self.controller.backoff, 1)
+        self.assertAlmostEqual(self.throttle.getDelay(), 2 * 2 * 0.9 ** 4)
+        self.throttle.setDelays(0)
+        self.assertEqual(self.throttle.getDelay(), 1)
+
+    def test_bounds(self):
+        """Test that the adjusted delays stay within mindelay and maxdelay."""
+        self.throttle.mindelay = 1
+        self.throttle.maxdelay = 4
+        for i in range(20):
+            self.throttle.record_response(0.1)
+        self.assertEqual(self.throttle.getDelay(), 1)
+        for i in range(20):
+            self.throttle.record_response(5)
+        self.assertEqual(self.throttle.getDelay(), 4)
+
+    def test_write_floor(self):
+        """Test that writes are not made faster than writedelay."""
+        self.throttle.setDelays(2, writedelay=10)
+        for i in range(20):
+            self.throttle.record_response(0.1)
+        self.assertEqual(self.throttle.getDelay(), 0.5)
+        self.assertEqual(self.throttle.getDelay(write=True), 10)
+        for i in range(4):
+            self.throttle.record_response(5)
+        self.assertGreater(self.throttle.getDelay(write=True), 10)
+
+    def test_retry_after(self):
+        """Test that Retry-After blocks all requests."""
+        self.throttle.retry_after(30)
+        self.assertAlmostEqual(self.throttle.waittime(), 30, delta=1)
+        self.assertEqual(self.controller.metrics()['retry_after'], 1)
+
+    def test_metrics(self):
+        """Test the request rate."""
+        self.throttle.wait = lambda seconds: None
+        for i in range(6):
+            self.throttle()
+        self.controller._requests[0] = time.time() - 2 * self.controller.window
+        metrics = self.controller.metrics()
+        self.assertEqual(metrics['requests'], 6)
+        self.assertAlmostEqual(metrics['rate'],
+                               5.0 / self.controller.window)
+
+
+if __name__ == '__main__':  # pragma: no cover
+    try:
+        unittest.main()
+    except SystemExit:
+        pass